@@ -0,0 +1,358 @@
+import functools
+import json
+import os
+import re
+import threading
+
+from fleet_index import DEFAULT_PAGE_SIZE, paginate
+
+# Matching of installed software against a local advisory feed.
+# The feed is a JSON file holding a list of advisories (or {"advisories": [...]}), one per affected product:
+#   {"id": "ADV-2023-001", "vendor": "Mozilla", "product": "Firefox", "severity": "high", "title": "...",
+#    "affected": [{"introduced": "100.0", "fixed": "115.0.3"}, {"last_affected": "91.2"}, {"versions": ["78.0.1"]}]}
+# "introduced" is inclusive (no lower bound when missing), "fixed" exclusive and "last_affected" inclusive
+# (no upper bound when both are missing). An id may appear several times, once per product.
+
+# Words dropped from vendor names ("Microsoft Corporation" -> "microsoft")
+VENDOR_SUFFIXES = {"inc", "incorporated", "corp", "corporation", "co", "company", "llc", "ltd", "limited",
+                   "gmbh", "ag", "sa", "srl", "bv", "plc", "the", "software", "foundation"}
+# Words dropped from product names ("Mozilla Firefox (x64 en-US)" -> "mozilla firefox")
+PRODUCT_NOISE = {"x64", "x86", "amd64", "arm64", "64", "32", "bit", "64bit", "32bit", "edition", "version"}
+# Bracketed details, version numbers and languages ("en-US") in product names
+PRODUCT_DETAILS = re.compile(r"\([^)]*\)|\[[^]]*\]|\bv?\d+(?:\.\d+)+\S*|\b[a-z]{2}-[a-z]{2}\b")
+PRODUCT_SEPARATORS = re.compile(r"[^a-z0-9+#]+")
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_vendor(vendor):
+    """
+    Returns the comparison key of a vendor name, or "" when it is unknown.
+    """
+    words = re.sub(r"[^a-z0-9]+", " ", (vendor or "").lower()).split()
+    words = [word for word in words if word not in VENDOR_SUFFIXES]
+    key = " ".join(words)
+    return "" if key in ("n a", "na", "unknown") else key
+
+
+def normalize_product(name, vendor_key=""):
+    """
+    Returns the comparison key of a product name: lower case, without version numbers, architecture,
+    language or bracketed details, and without a leading vendor name.
+    """
+    text = PRODUCT_DETAILS.sub(" ", (name or "").lower())
+    words = [word for word in PRODUCT_SEPARATORS.sub(" ", text).split() if word not in PRODUCT_NOISE]
+    return strip_vendor(" ".join(words), vendor_key)
+
+
+def strip_vendor(product_key, vendor_key):
+    """
+    Removes a leading vendor name from a normalized product name ("mozilla firefox" -> "firefox").
+    """
+    if vendor_key and product_key.startswith(vendor_key + " "):
+        return product_key[len(vendor_key) + 1:]
+    return product_key
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_version(text):
+    """
+    Returns the comparable form of a version ("115.0.3" -> (115, 0, 3)), or None when it has no number.
+    Trailing zeros are dropped, so "2.0" and "2.0.0" compare equal.
+    """
+    match = re.match(r"\s*v?(\d+(?:[._]\d+)*)", str(text or ""))
+    if not match:
+        return None
+    parts = [int(part) for part in re.split(r"[._]", match.group(1))]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def vendors_match(advisory_vendor, software_vendor):
+    """
+    Vendors are compatible when either is unknown or their first words are equal.
+    """
+    if not advisory_vendor or not software_vendor:
+        return True
+    return advisory_vendor.split()[0] == software_vendor.split()[0]
+
+
+class ProductRanges:
+    """
+    Affected version intervals of one product, sorted by lower bound.
+    The sorted list is read as a balanced binary tree (the middle interval of a range is the root of its subtree),
+    each node keeping the largest upper bound of its subtree, so a lookup skips the subtrees ending below the version.
+    """
+
+    def __init__(self, intervals):
+        # (start, end, end_inclusive, advisory id); starts are inclusive, a missing start sorts first
+        self.intervals = sorted(intervals, key=lambda interval: interval[0] or ())
+        self.starts = [interval[0] or () for interval in self.intervals]
+        self.max_ends = [None] * len(self.intervals)
+        self.build(0, len(self.intervals))
+
+    @staticmethod
+    def end_key(end):
+        # A missing upper bound is greater than every version
+        return (1,) if end is None else (0, end)
+
+    def build(self, low, high):
+        """
+        Fills max_ends for the subtree of intervals[low:high] and returns its largest upper bound.
+        """
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        max_end = max(key for key in (self.end_key(self.intervals[middle][1]), self.build(low, middle),
+                                      self.build(middle + 1, high)) if key is not None)
+        self.max_ends[middle] = max_end
+        return max_end
+
+    def lookup(self, version):
+        """
+        Returns the ids of the advisories whose intervals contain version.
+        """
+        ids = set()
+        bound = (0, version)
+        stack = [(0, len(self.intervals))]
+        while stack:
+            low, high = stack.pop()
+            if low >= high:
+                continue
+            middle = (low + high) // 2
+            if self.max_ends[middle] < bound:
+                continue  # Every interval of this subtree ends below version
+            stack.append((low, middle))
+            if self.starts[middle] > version:
+                continue  # Neither does this interval nor the ones after it start at or below version
+            stack.append((middle + 1, high))
+            _, end, end_inclusive, advisory = self.intervals[middle]
+            if end is not None and (version > end or (version == end and not end_inclusive)):
+                continue
+            ids.add(advisory)
+        return ids
+
+
+class AdvisoryFeed:
+    """
+    Advisory feed compiled into an index: product key -> ProductRanges.
+    Products are indexed with and without their vendor name, since installers are not consistent about it.
+    """
+
+    def __init__(self, entries=(), source=None):
+        self.source = source
+        self.advisories = {}  # id -> {"id", "severity", "title", "products": [...]}
+        intervals = {}        # product key -> [(start, end, end_inclusive, id)]
+        self.vendors = {}     # (product key, id) -> vendor key
+        self.ranges = 0
+        for entry in entries:
+            advisory = entry.get("id")
+            if not advisory or not entry.get("product"):
+                continue
+            vendor = normalize_vendor(entry.get("vendor"))
+            product = normalize_product(entry["product"], vendor)
+            info = self.advisories.setdefault(advisory, {"id": advisory, "severity": entry.get("severity"),
+                                                         "title": entry.get("title"), "products": []})
+            info["products"].append({"Vendor": entry.get("vendor"), "Product": entry["product"]})
+            keys = {product, f"{vendor} {product}".strip()}
+            for affected in entry.get("affected") or [{}]:
+                for interval in self.intervals_of(affected, advisory):
+                    self.ranges += 1
+                    for key in keys:
+                        intervals.setdefault(key, []).append(interval)
+            for key in keys:
+                self.vendors[(key, advisory)] = vendor
+        self.index = {key: ProductRanges(product_intervals) for key, product_intervals in intervals.items()}
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+
+    @staticmethod
+    def intervals_of(affected, advisory):
+        """
+        Returns the intervals of one "affected" item of the feed.
+        """
+        if "versions" in affected:
+            for version in affected["versions"]:
+                version = parse_version(version)
+                if version is not None:
+                    yield version, version, True, advisory
+            return
+        start = parse_version(affected.get("introduced"))
+        if affected.get("fixed"):
+            yield start, parse_version(affected["fixed"]), False, advisory
+        else:
+            yield start, parse_version(affected.get("last_affected")), True, advisory
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            document = json.load(file)
+        entries = document.get("advisories", []) if isinstance(document, dict) else document
+        return cls(entries, source=path)
+
+    def match(self, name, version, vendor):
+        """
+        Returns the ids of the advisories affecting one installed software, as a sorted tuple.
+        Results are cached: the same packages are installed on most hosts.
+        """
+        key = (name, version, vendor)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        ids = set()
+        vendor_key = normalize_vendor(vendor)
+        product = normalize_product(name)
+        for product in {product, strip_vendor(product, vendor_key)}:
+            ranges = self.index.get(product)
+            parsed = parse_version(version) if ranges is not None else None
+            if parsed is None:
+                continue
+            ids.update(advisory for advisory in ranges.lookup(parsed)
+                       if vendors_match(self.vendors[(product, advisory)], vendor_key))
+        result = tuple(sorted(ids))
+        with self.cache_lock:
+            self.cache[key] = result
+        return result
+
+
+class AdvisoryMatcher:
+    """
+    Matches of the latest report of every host against the current feed:
+    host id -> advisory id -> affected software, and advisory id -> set of host ids.
+    """
+
+    def __init__(self, feed=None):
+        self.lock = threading.Lock()
+        self.feed = feed or AdvisoryFeed()
+        self.host_matches = {}
+        self.advisory_hosts = {}
+        self.updated = None  # Hosts updated while the fleet is re-matched, see set_feed
+
+    def match_host(self, feed, software):
+        """
+        Returns {advisory id: [(name, version, vendor), ...]} for a set of software triples.
+        """
+        matches = {}
+        for triple in software:
+            for advisory in feed.match(*triple):
+                matches.setdefault(advisory, []).append(triple)
+        return matches
+
+    def update(self, host, software):
+        """
+        Matches the software triples of a host's new report, replacing its previous matches.
+        """
+        while True:
+            feed = self.feed
+            matches = self.match_host(feed, software)
+            with self.lock:
+                if feed is not self.feed:
+                    continue  # The feed changed meanwhile
+                self.remove_host(host)
+                self.store(host, matches)
+                if self.updated is not None:
+                    self.updated.add(host)
+                return
+
+    def store(self, host, matches):
+        """
+        Records the matches of a host. The caller holds the lock.
+        """
+        if matches:
+            self.host_matches[host] = matches
+        for advisory in matches:
+            self.advisory_hosts.setdefault(advisory, set()).add(host)
+
+    def remove_host(self, host):
+        """
+        Removes the matches of a host. The caller holds the lock.
+        """
+        for advisory in self.host_matches.pop(host, {}):
+            hosts = self.advisory_hosts[advisory]
+            hosts.discard(host)
+            if not hosts:
+                del self.advisory_hosts[advisory]
+
+    def set_feed(self, feed, host_software):
+        """
+        Switches to a new feed and re-matches the whole fleet (host id -> set of software triples).
+        Reports received during the re-match are matched against the new feed as they arrive and kept.
+        """
+        with self.lock:
+            self.feed = feed
+            self.updated = set()
+        # Match every distinct software once, then group the hosts by their set of affected software:
+        # most hosts share it, so each group's matches are built once and shared by its hosts
+        affected = {}
+        for triple in set().union(*host_software.values()):
+            advisories = feed.match(*triple)
+            if advisories:
+                affected[triple] = advisories
+        affected_keys = frozenset(affected)
+        groups = {}  # frozenset of affected software -> (matches, [host ids])
+        for host, software in host_software.items():
+            key = affected_keys.intersection(software)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = (self.match_host(feed, key), [])
+            group[1].append(host)
+        with self.lock:
+            if feed is not self.feed:
+                return
+            updated, current = self.updated, self.host_matches
+            self.updated = None
+            self.host_matches = {}
+            self.advisory_hosts = {}
+            for matches, hosts in groups.values():
+                hosts = [host for host in hosts if host not in updated]
+                if not matches or not hosts:
+                    continue
+                self.host_matches.update(dict.fromkeys(hosts, matches))
+                for advisory in matches:
+                    self.advisory_hosts.setdefault(advisory, set()).update(hosts)
+            for host in updated:
+                self.store(host, current.get(host, {}))
+
+    def get_host(self, host):
+        """
+        Returns the advisories affecting a host, with the affected software.
+        """
+        with self.lock:
+            matches = self.host_matches.get(host, {})
+            return [dict(self.advisory_summary(advisory),
+                         software=[{"Name": name, "Version": version, "Vendor": vendor}
+                                   for name, version, vendor in sorted(software)])
+                    for advisory, software in sorted(matches.items())]
+
+    def advisory_summary(self, advisory):
+        info = self.feed.advisories.get(advisory, {"id": advisory})
+        return {"id": advisory, "severity": info.get("severity"), "title": info.get("title")}
+
+    def find_hosts(self, advisory, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of the hosts affected by an advisory, with the affected software.
+        """
+        with self.lock:
+            items = [(host, {"host": host,
+                             "software": [{"Name": name, "Version": version, "Vendor": vendor}
+                                          for name, version, vendor in sorted(self.host_matches[host][advisory])]})
+                     for host in self.advisory_hosts.get(advisory, ())]
+        items.sort(key=lambda pair: pair[0])
+        return paginate(items, cursor, limit)
+
+    def list_advisories(self, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of the advisories affecting at least one host, with their number of hosts.
+        """
+        with self.lock:
+            items = [(advisory, dict(self.advisory_summary(advisory), hosts=len(hosts)))
+                     for advisory, hosts in self.advisory_hosts.items()]
+        items.sort(key=lambda pair: pair[0])
+        return paginate(items, cursor, limit)
+
+
+def feed_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
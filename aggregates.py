@@ -0,0 +1,168 @@
+import json
+import math
+import os
+import re
+import threading
+from datetime import datetime
+
+from fleet_index import normalize_name
+
+# Materialized fleet aggregates: number of hosts per OS release, encryption state, RAM and disk size,
+# vendor, and software version. Each host contributes a set of facts; a new report only applies
+# the facts that changed, so the counts are always current and a query never reads a snapshot.
+
+# Dimensions counted by host, in the order of the dashboard summary
+DIMENSIONS = ("os", "encryption", "ram", "disk", "vendor")
+# Dimensions small enough to be returned all at once by summary
+SUMMARY_DIMENSIONS = ("os", "encryption", "ram", "disk")
+UNKNOWN = "unknown"
+
+
+def size_bucket(text):
+    """
+    Returns the power-of-two bucket of a size written as "15.87 GB" ("16 GB"), or "unknown".
+    """
+    match = re.match(r"\s*([\d.]+)\s*GB", str(text or ""))
+    if not match:
+        return UNKNOWN
+    try:
+        size = float(match.group(1))
+    except ValueError:
+        return UNKNOWN
+    return f"{2 ** math.ceil(math.log2(max(size, 1)))} GB"
+
+
+def encryption_state(status):
+    """
+    Returns the BitLocker state of a host from the "manage-bde -status" output:
+    "encrypted" when every volume is fully encrypted, "partial" when some are (or are being) encrypted,
+    "not encrypted", or "unknown" when the status was not collected.
+    """
+    if not isinstance(status, str):
+        return UNKNOWN
+    conversions = re.findall(r"Conversion Status:\s*(.+)", status)
+    if not conversions:
+        return UNKNOWN
+    if all(conversion.strip() == "Fully Encrypted" for conversion in conversions):
+        return "encrypted"
+    if any("Encrypt" in conversion for conversion in conversions):
+        return "partial"
+    return "not encrypted"
+
+
+def host_facts(data):
+    """
+    Returns the facts counted for one report: (dimension, value) pairs and ("software", name, version).
+    """
+    system_info = data.get("system_info") or {}
+    hardware_info = data.get("hardware_info") or {}
+    disk = hardware_info.get("Disk") or {}
+    os_release = " ".join(str(system_info[key]) for key in ("System", "Release") if system_info.get(key))
+    facts = {
+        ("os", os_release or UNKNOWN),
+        ("encryption", encryption_state(data.get("disk_encryption_status"))),
+        ("ram", size_bucket(hardware_info.get("RAM"))),
+        ("disk", size_bucket(disk.get("Total") if isinstance(disk, dict) else None))
+    }
+    for s in data.get("software_list", []):
+        if isinstance(s, dict) and s.get("Name"):
+            facts.add(("software", s["Name"], str(s.get("Version", "N/A"))))
+            facts.add(("vendor", str(s.get("Vendor", "N/A"))))
+    return frozenset(facts)
+
+
+class FleetAggregates:
+    """
+    Host counts per dimension value, maintained from the difference between the old and new facts of a host.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.host_facts = {}                                      # host id -> frozenset of facts
+        self.counts = {dimension: {} for dimension in DIMENSIONS}  # dimension -> {value: number of hosts}
+        self.software = {}  # normalized name -> {"name": display name, "versions": {version: number of hosts}}
+        self.version = 0    # Incremented on every change, see save
+
+    def update(self, host, data):
+        """
+        Replaces the facts of a host by those of its new report.
+        """
+        facts = host_facts(data)
+        with self.lock:
+            previous = self.host_facts.get(host, frozenset())
+            if facts == previous:
+                return
+            for fact in previous - facts:
+                self.apply(fact, -1)
+            for fact in facts - previous:
+                self.apply(fact, 1)
+            self.host_facts[host] = facts
+            self.version += 1
+
+    def apply(self, fact, delta):
+        """
+        Adds delta to the count of one fact, dropping zero counts. The caller holds the lock.
+        """
+        if fact[0] == "software":
+            _, name, version = fact
+            key = normalize_name(name)
+            entry = self.software.setdefault(key, {"name": name, "versions": {}})
+            counts = entry["versions"]
+            value = version
+        else:
+            entry = None
+            counts = self.counts[fact[0]]
+            value = fact[1]
+        count = counts.get(value, 0) + delta
+        if count:
+            counts[value] = count
+        else:
+            counts.pop(value, None)
+            if entry is not None and not counts:
+                del self.software[key]
+
+    def summary(self):
+        """
+        Returns the number of hosts and the counts of the small dimensions.
+        """
+        with self.lock:
+            summary = {"hosts": len(self.host_facts)}
+            for dimension in SUMMARY_DIMENSIONS:
+                summary[dimension] = dict(self.counts[dimension])
+            return summary
+
+    def dimension(self, dimension):
+        """
+        Returns {value: number of hosts} for one dimension, or None when it is unknown.
+        """
+        with self.lock:
+            counts = self.counts.get(dimension)
+            return dict(counts) if counts is not None else None
+
+    def software_versions(self, name):
+        """
+        Returns {"Name", "Versions": {version: number of hosts}} for one software, or None.
+        """
+        with self.lock:
+            entry = self.software.get(normalize_name(name))
+            if entry is None:
+                return None
+            return {"Name": entry["name"], "Versions": dict(entry["versions"])}
+
+    def save(self, path):
+        """
+        Writes the aggregates to a JSON file, atomically. Returns the version saved.
+        """
+        with self.lock:
+            version = self.version
+            document = {
+                "saved_at": datetime.now().isoformat(timespec="seconds"),
+                "hosts": len(self.host_facts),
+                "counts": {dimension: dict(counts) for dimension, counts in self.counts.items()},
+                "software": {entry["name"]: dict(entry["versions"]) for entry in self.software.values()}
+            }
+        tmp_file = path + ".tmp"
+        with open(tmp_file, mode="w", encoding="utf-8") as file:
+            json.dump(document, file, separators=(",", ":"), ensure_ascii=False)
+        os.replace(tmp_file, path)
+        return version
@@ -0,0 +1,280 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import parsers
+import replay
+from advisories import AdvisoryFeed, AdvisoryMatcher
+from transport import encode_payload
+
+# Benchmark suite for the collectors' parsers, installed-software deduplication and server ingest.
+# Everything runs from recorded or synthetic outputs: no Windows commands, no network.
+# Usage: python bench.py --output bench.json [--compare previous.json]
+
+
+def measure(func, repeat):
+    """
+    Runs func repeat times and returns timing statistics in milliseconds, with the last result.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    stats = {
+        "runs": repeat,
+        "min_ms": round(timings[0], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3)
+    }
+    return stats, result
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_parsers(results, repeat, scale):
+    outputs = replay.synthetic_outputs(processes=2000 * scale, connections=5000 * scale,
+                                       adapters=16, updates=50 * scale)
+    cases = [
+        ("parse_tasklist", parsers.parse_tasklist, outputs["tasklist.txt"]),
+        ("parse_netstat", parsers.parse_netstat, outputs["netstat_an.txt"]),
+        ("parse_ipconfig", parsers.parse_ipconfig, outputs["ipconfig_all.txt"]),
+        ("parse_wmic_qfe", parsers.parse_wmic_qfe, outputs["wmic_qfe_list_brief.txt"])
+    ]
+    for name, parse, text in cases:
+        stats, records = measure(lambda: list(parse(io.StringIO(text))), repeat)
+        stats.update({"input_bytes": len(text.encode("utf-8")), "records": len(records),
+                      "output_bytes": len(json.dumps(records, separators=(",", ":")))})
+        results[name] = stats
+
+
+def bench_collectors(results, repeat, scale):
+    try:
+        import main
+    except ImportError as e:
+        print(f"Skipping collector benchmarks: {e}")
+        return
+
+    outputs = replay.synthetic_outputs(processes=2000 * scale, connections=5000 * scale,
+                                       adapters=16, updates=50 * scale, users=30 * scale)
+    main.set_command_runner(replay.ReplayRunner(outputs))
+    try:
+        for name in ("get_running_processes", "get_network_connections", "get_network_configuration",
+                     "get_update_status", "get_user_accounts"):
+            stats, value = measure(getattr(main, name), repeat)
+            stats["output_bytes"] = len(json.dumps(value, separators=(",", ":")))
+            results[f"collector.{name}"] = stats
+
+        with tempfile.TemporaryDirectory() as state_dir:
+            main.SOFTWARE_CACHE_FILE = os.path.join(state_dir, "software_cache.json")
+
+            # The whole pipeline on the recorded fixtures
+            main.set_command_runner(replay.ReplayRunner())
+            main._software_scanner = main.SoftwareScanner(replay.synthetic_registry(200), None)
+            stats, (collected, collector_status) = measure(main.run_collectors, 1)
+            stats["sections"] = len(collected)
+            stats["failed"] = sorted(key for key, status in collector_status.items() if status["status"] != "ok")
+            results["collector.run_collectors.fixtures"] = stats
+
+            # Installed software: first scan with an empty cache, then incremental rescans
+            registry = replay.synthetic_registry(1000 * scale)
+            stats, software = measure(lambda: main.get_installed_software(registry, use_wmic=False), 1)
+            stats.update({"registry_entries": 1000 * scale, "unique_software": len(software)})
+            results["get_installed_software.cold"] = stats
+            stats, _ = measure(lambda: main.get_installed_software(registry, use_wmic=False), repeat)
+            results["get_installed_software.warm"] = stats
+    finally:
+        main.set_command_runner(None)
+
+
+def bench_startup(results, repeat):
+    """
+    Times a minimal agent invocation, from process start to exit.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    command = [sys.executable, script, "--only", "system", "--output", "-"]
+    stats, completed = measure(lambda: subprocess.run(command, capture_output=True, text=True), repeat)
+    if completed.returncode != 0:
+        print(f"Agent startup failed: {completed.stderr.strip()}")
+        return
+    stats["agent_startup_ms"] = round(json.loads(completed.stdout)["telemetry"]["startup"] * 1000, 3)
+    results["agent.startup.only_system"] = stats
+
+
+def synthetic_report(i, software_count, overlap=0.9):
+    """
+    Returns a collected_data document for host i; most software is shared with the other hosts.
+    """
+    shared = int(software_count * overlap)
+    software = [{"Name": f"Package {n}", "Version": f"{n % 7}.0", "Vendor": f"Vendor {n % 50}"} for n in range(shared)]
+    software += [{"Name": f"Custom {i}-{n}", "Version": "1.0", "Vendor": "N/A"} for n in range(software_count - shared)]
+    return {
+        "system_info": {"System": "Windows", "Node Name": f"BENCH-{i:05d}", "Release": "10",
+                        "Version": "10.0.19045", "Machine": "AMD64", "Processor": "Intel64",
+                        "MAC Address": f"00:0a:cd:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}"},
+        "security_software": ["Sophos Anti-Virus"],
+        "running_processes": [{"Name": "svchost.exe", "PID": pid, "Session": "Services", "Memory KB": 1024}
+                              for pid in range(50)],
+        "software_list": software
+    }
+
+
+def bench_server(results, reports, software_count, storage_backend):
+    data_dir = tempfile.mkdtemp(prefix="bench_server_")
+    os.environ["ASSET_SERVER_DATA_DIR"] = data_dir
+    os.environ["ASSET_SERVER_STORAGE"] = storage_backend
+    try:
+        import server
+    except ImportError as e:
+        print(f"Skipping server benchmarks: {e}")
+        return
+
+    client = server.app.test_client()
+    bodies = [encode_payload(synthetic_report(i, software_count), "gzip")[0] for i in range(reports)]
+    latencies = []
+    start = time.perf_counter()
+    for body in bodies:
+        request_start = time.perf_counter()
+        response = client.post("/api/asset", data=body,
+                               headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+        latencies.append((time.perf_counter() - request_start) * 1000)
+        if response.status_code not in (200, 202):
+            print(f"Unexpected status {response.status_code}: {response.get_data(as_text=True)}")
+    accepted = time.perf_counter() - start
+    server.ingest_queue.join()
+    stored = time.perf_counter() - start
+    latencies.sort()
+    results[f"server.ingest.{storage_backend}"] = {
+        "reports": reports,
+        "software_per_report": software_count,
+        "request_p50_ms": round(percentile(latencies, 50), 3),
+        "request_p95_ms": round(percentile(latencies, 95), 3),
+        "request_p99_ms": round(percentile(latencies, 99), 3),
+        "accepted_per_s": round(reports / accepted, 1),
+        "stored_per_s": round(reports / stored, 1),
+        "disk_bytes": directory_size(data_dir)
+    }
+
+    stats, response = measure(lambda: client.get("/api/software?name=Package 1&limit=1000"), 20)
+    stats["hosts"] = len(response.get_json()["items"])
+    results["server.query.software"] = stats
+
+
+def synthetic_feed(ranges, products=None, seed=0):
+    """
+    Returns advisory feed entries over "Package <n>" products, a few of which are installed by synthetic_report.
+    Like a real feed, it covers many more products than a fleet installs (one per 4 ranges by default).
+    """
+    products = products or max(1, ranges // 4)
+    rng = random.Random(seed)
+    entries = []
+    for i in range(ranges):
+        n = rng.randrange(products)
+        major = rng.randrange(7)
+        affected = {"introduced": f"{major}.0", "fixed": f"{major}.{rng.randrange(1, 20)}"} if i % 3 else {}
+        entries.append({"id": f"ADV-{i:06d}", "vendor": f"Vendor {n % 50} Inc.", "product": f"Package {n}",
+                        "severity": "high", "affected": [affected]})
+    return entries
+
+
+def bench_advisories(results, hosts, software_count, ranges):
+    stats, feed = measure(lambda: AdvisoryFeed(synthetic_feed(ranges)), 1)
+    stats.update({"ranges": feed.ranges, "advisories": len(feed.advisories)})
+    results["advisories.compile"] = stats
+
+    host_software = {}
+    for i in range(hosts):
+        report = synthetic_report(i, software_count)
+        host_software[f"host-{i}"] = {(s["Name"], s["Version"], s["Vendor"]) for s in report["software_list"]}
+    matcher = AdvisoryMatcher()
+    stats, _ = measure(lambda: matcher.set_feed(feed, host_software), 1)
+    stats.update({"hosts": hosts, "packages": hosts * software_count,
+                  "affected_hosts": len(matcher.host_matches), "matched_advisories": len(matcher.advisory_hosts)})
+    results["advisories.rematch_fleet"] = stats
+
+    stats, _ = measure(lambda: matcher.update("host-0", host_software["host-0"]), 100)
+    results["advisories.match_report"] = stats
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline):
+    """
+    Prints the change of the main timing of every benchmark against a previous report.
+    """
+    print(f"\n{'benchmark':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, stats in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        for metric in ("p50_ms", "request_p50_ms"):
+            if metric in stats and old and metric in old:
+                change = (stats[metric] / old[metric] - 1) * 100 if old[metric] else 0.0
+                print(f"{name:<45} {old[metric]:>12.3f} {stats[metric]:>12.3f} {change:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agent parsers/collectors and server ingest.")
+    parser.add_argument("--output", help="Write the machine-readable report to this file")
+    parser.add_argument("--compare", metavar="REPORT", help="Compare with a previous report")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per micro-benchmark")
+    parser.add_argument("--scale", type=int, default=10, help="Size multiplier of the synthetic outputs")
+    parser.add_argument("--reports", type=int, default=500, help="Reports posted in the server benchmark")
+    parser.add_argument("--software", type=int, default=300, help="Software entries per report")
+    parser.add_argument("--storage", default="sqlite", choices=["sqlite", "json", "history"],
+                        help="Server storage backend")
+    parser.add_argument("--skip-server", action="store_true", help="Only benchmark the agent side")
+    parser.add_argument("--hosts", type=int, default=50000, help="Hosts matched in the advisory benchmark")
+    parser.add_argument("--ranges", type=int, default=200000, help="Version ranges of the synthetic advisory feed")
+    args = parser.parse_args()
+
+    results = {}
+    bench_parsers(results, args.repeat, args.scale)
+    bench_collectors(results, args.repeat, args.scale)
+    bench_startup(results, args.repeat)
+    bench_advisories(results, args.hosts, args.software, args.ranges)
+    if not args.skip_server:
+        bench_server(results, args.reports, args.software, args.storage)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            compare(report, json.load(file))
@@ -0,0 +1,95 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+# Production mode of the server: several worker processes serving one listening socket.
+# The socket is opened here and inherited by every worker, so the kernel spreads the connections between them.
+# The workers share the data directory (see coordination.py): reports are stored by the worker that received
+# them, and each worker applies the reports received by the others to its in-memory indexes.
+# A worker that dies is restarted; SIGTERM or Ctrl+C stops every worker after it wrote its queued reports.
+
+# Seconds to wait before restarting a worker that exited, and for the workers to stop
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 60
+
+
+def run_worker(host, port, fd):
+    """
+    Serves the application on an inherited listening socket, until SIGTERM.
+    """
+    # Exit through SystemExit, so the atexit handlers write the queued reports and the aggregates
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    from werkzeug.serving import make_server
+    from server import app
+    make_server(host, port, app, threaded=True, fd=fd).serve_forever()
+
+
+def spawn_worker(host, port, fd, processes):
+    env = dict(os.environ, ASSET_SERVER_PROCESSES=str(processes))
+    command = [sys.executable, os.path.abspath(__file__), "--host", host, "--port", str(port), "--worker-fd", str(fd)]
+    return subprocess.Popen(command, env=env, pass_fds=(fd,))
+
+
+def serve(host, port, processes):
+    """
+    Starts the workers on one listening socket and supervises them until SIGTERM or Ctrl+C.
+    """
+    # The metrics of the workers of a previous run are not added to the new ones (see server.METRICS_DIR)
+    metrics_dir = os.path.join(os.environ.get("ASSET_SERVER_DATA_DIR", "data"), "state", "metrics")
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+    listener = socket.create_server((host, port), backlog=1024)
+    listener.set_inheritable(True)
+    fd = listener.fileno()
+    workers = [spawn_worker(host, port, fd, processes) for _ in range(processes)]
+    print(f"Serving on {host}:{port} with {processes} worker processes")
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    try:
+        while not stopping:
+            time.sleep(RESTART_DELAY)
+            for i, worker in enumerate(workers):
+                if worker.poll() is not None and not stopping:
+                    print(f"Worker {worker.pid} exited with code {worker.returncode}, restarting it")
+                    workers[i] = spawn_worker(host, port, fd, processes)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in workers:
+            try:
+                worker.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        listener.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the asset server with several worker processes.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("ASSET_SERVER_PORT", "5000")))
+    parser.add_argument("--processes", type=int,
+                        default=int(os.environ.get("ASSET_SERVER_PROCESSES", os.cpu_count() or 2)),
+                        help="Number of worker processes")
+    parser.add_argument("--worker-fd", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_fd is not None:
+        run_worker(args.host, args.port, args.worker_fd)
+    elif os.name != "posix":
+        print("Several worker processes need a POSIX system, use server.py instead", file=sys.stderr)
+        sys.exit(1)
+    elif os.environ.get("ASSET_SERVER_STORAGE") == "history":
+        print("The history backend is written by a single process, use server.py instead", file=sys.stderr)
+        sys.exit(1)
+    else:
+        serve(args.host, args.port, args.processes)
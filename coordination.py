@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Coordination of several server processes sharing one data directory (see cluster.py).
+# Reports are stored by whichever process receives them, but the query indexes and aggregates live in
+# the memory of each process: every process appends the reports it accepted to a shared journal, and
+# follows the journal to apply the reports accepted by the others. Periodic jobs writing shared files
+# run in the single process holding the leader lock.
+
+# Size above which the journal continues in a new file; the two previous files are kept for slow followers
+JOURNAL_MAX_BYTES = 16 * 1024 * 1024
+JOURNAL_KEPT_FILES = 2
+# Seconds between two reads of the journal by a follower
+JOURNAL_POLL_INTERVAL = 1.0
+
+
+def lock_file(file, blocking):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+
+def unlock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    Exclusive lock on a file, shared between processes (and between the threads of a process).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.Lock()
+        self.file = None
+
+    def acquire(self, blocking=True):
+        """
+        Takes the lock. Returns False when it is held elsewhere and blocking is False.
+        """
+        if not self.thread_lock.acquire(blocking):
+            return False
+        try:
+            file = open(self.path, "a+b")
+            try:
+                lock_file(file, blocking)
+            except OSError:
+                file.close()
+                raise
+        except OSError:
+            self.thread_lock.release()
+            if blocking:
+                raise
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        file, self.file = self.file, None
+        unlock_file(file)
+        file.close()
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class LeaderLock:
+    """
+    Lock held for as long as the process lives by one of the processes sharing a directory.
+    Each process calls is_leader before a job that must run once; when the leader exits, the next caller takes over.
+    """
+
+    def __init__(self, path):
+        self.lock = FileLock(path)
+        self.leader = False
+
+    def is_leader(self):
+        if not self.leader:
+            self.leader = self.lock.acquire(blocking=False)
+        return self.leader
+
+
+class IngestJournal:
+    """
+    Append-only journal of the reports accepted by every process, as JSON lines in "journal-<n>.log" files.
+    A position is (file number, offset); read_new returns the entries written by other processes since the last call.
+    """
+
+    def __init__(self, directory, max_bytes=JOURNAL_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = FileLock(os.path.join(directory, "journal.lock"))
+        self.writer = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.position = self.end()
+
+    def path(self, number):
+        return os.path.join(self.directory, f"journal-{number:08d}.log")
+
+    def numbers(self):
+        return sorted(int(match.group(1)) for match in
+                      (re.fullmatch(r"journal-(\d+)\.log", name) for name in os.listdir(self.directory)) if match)
+
+    def end(self):
+        """
+        Returns the position of the end of the journal.
+        """
+        with self.lock:
+            numbers = self.numbers()
+            if not numbers:
+                return 1, 0
+            return numbers[-1], os.path.getsize(self.path(numbers[-1]))
+
+    def append(self, entries):
+        """
+        Appends entries (JSON-serializable dicts), starting a new file when the current one is full.
+        """
+        if not entries:
+            return
+        lines = "".join(json.dumps(dict(entry, writer=self.writer), separators=(",", ":")) + "\n"
+                        for entry in entries).encode("utf-8")
+        with self.lock:
+            numbers = self.numbers()
+            number = numbers[-1] if numbers else 1
+            if os.path.exists(self.path(number)) and os.path.getsize(self.path(number)) >= self.max_bytes:
+                number += 1
+                for old in numbers:
+                    if old < number - JOURNAL_KEPT_FILES:
+                        os.remove(self.path(old))
+            with open(self.path(number), "ab") as file:
+                file.write(lines)
+
+    def read_new(self):
+        """
+        Returns the entries appended by other processes since the last call, oldest first,
+        or None when some were lost (the follower fell too far behind); the position is then reset to the end.
+        """
+        entries = []
+        number, offset = self.position
+        while True:
+            # A file is complete once the next one exists: the journal only moves on under the lock
+            complete = os.path.exists(self.path(number + 1))
+            try:
+                with open(self.path(number), "rb") as file:
+                    file.seek(offset)
+                    data = file.read()
+            except FileNotFoundError:
+                numbers = self.numbers()
+                if numbers and numbers[-1] > number:
+                    self.position = self.end()
+                    return None
+                data = b""
+            end = data.rfind(b"\n") + 1  # A line being written is read on the next call
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("writer") != self.writer:
+                    entries.append(entry)
+            offset += end
+            if not complete:
+                break
+            number, offset = number + 1, 0
+        self.position = (number, offset)
+        return entries
@@ -0,0 +1,105 @@
+import hashlib
+import json
+
+# Format version of delta documents
+DELTA_VERSION = 1
+
+
+def software_key(software):
+    return f"{software.get('Name')}|{software.get('Version')}|{software.get('Vendor')}"
+
+
+def normalize_snapshot(data):
+    """
+    Returns a copy of the collected data with software_list in a stable order,
+    so that the same inventory always hashes the same way.
+    """
+    normalized = dict(data)
+    if isinstance(data.get("software_list"), list):
+        normalized["software_list"] = sorted(data["software_list"], key=software_key)
+    return normalized
+
+
+def snapshot_hash(data):
+    """
+    Returns the SHA-256 of the canonical JSON form of the collected data.
+    """
+    canonical = json.dumps(normalize_snapshot(data), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def diff_software(old_list, new_list):
+    """
+    Compares two software lists and returns the added, removed and changed entries.
+    An entry is changed when a single Name/Vendor pair moved to another Version.
+    """
+    old = {software_key(s): s for s in old_list}
+    new = {software_key(s): s for s in new_list}
+    added = [s for key, s in new.items() if key not in old]
+    removed = [s for key, s in old.items() if key not in new]
+
+    def by_name(entries):
+        grouped = {}
+        for s in entries:
+            grouped.setdefault((s.get("Name"), s.get("Vendor")), []).append(s)
+        return grouped
+
+    added_by_name = by_name(added)
+    removed_by_name = by_name(removed)
+    changed = []
+    for name, before in removed_by_name.items():
+        after = added_by_name.get(name)
+        if len(before) == 1 and after and len(after) == 1:
+            changed.append(dict(after[0], **{"Previous Version": before[0].get("Version")}))
+            added.remove(after[0])
+            removed.remove(before[0])
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def make_delta(base, data, base_hash=None, data_hash=None):
+    """
+    Builds a compact delta that turns the base snapshot into the new one.
+    system_info is always included so that the server can identify the host.
+    """
+    sections = {}
+    for key, value in data.items():
+        if key != "software_list" and (key not in base or base[key] != value):
+            sections[key] = value
+    sections["system_info"] = data.get("system_info", {})
+    return {
+        "delta": DELTA_VERSION,
+        "base_hash": base_hash or snapshot_hash(base),
+        "hash": data_hash or snapshot_hash(data),
+        "sections": sections,
+        "removed_sections": [key for key in base if key not in data],
+        "software": diff_software(base.get("software_list", []), data.get("software_list", []))
+    }
+
+
+def apply_delta(base, delta):
+    """
+    Rebuilds the full snapshot from the base snapshot and a delta.
+    """
+    data = {key: value for key, value in base.items() if key not in delta.get("removed_sections", [])}
+    data.update(delta.get("sections", {}))
+
+    software = {software_key(s): s for s in base.get("software_list", [])}
+    changes = delta.get("software", {})
+    for s in changes.get("removed", []):
+        software.pop(software_key(s), None)
+    for s in changes.get("changed", []):
+        entry = {key: value for key, value in s.items() if key != "Previous Version"}
+        software.pop(software_key(dict(entry, Version=s.get("Previous Version"))), None)
+        software[software_key(entry)] = entry
+    for s in changes.get("added", []):
+        software[software_key(s)] = s
+
+    # Keep software_list as the last key
+    if "software_list" in base or any(changes.values()):
+        data.pop("software_list", None)
+        data["software_list"] = sorted(software.values(), key=software_key)
+    return data
+
+
+def is_delta(payload):
+    return isinstance(payload, dict) and "delta" in payload and "base_hash" in payload
@@ -0,0 +1,345 @@
+import argparse
+import csv
+import io
+import json
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+from aggregates import encryption_state
+from storage import create_storage, host_id, parse_local_time
+
+# Fleet export: the latest report of every host flattened into tables (hosts, software, processes, updates),
+# written as CSV, NDJSON or columnar files. Reports are read one at a time and rows are written as they
+# are produced, so memory stays flat whatever the size of the fleet.
+# Incremental exports (since=) only include the hosts whose latest report was received at or after the
+# watermark of a previous export; the rows of such a host replace all its previous rows.
+
+# Columns of each table: (name, "string" or "int")
+HOST_COLUMNS = [("host_id", "string"), ("node_name", "string"), ("mac_address", "string"), ("system", "string"),
+                ("release", "string"), ("version", "string"), ("machine", "string"), ("processor", "string"),
+                ("ram", "string"), ("disk_total", "string"), ("encryption", "string"),
+                ("software_count", "int"), ("received_at", "string")]
+SOFTWARE_COLUMNS = [("host_id", "string"), ("name", "string"), ("version", "string"), ("vendor", "string")]
+PROCESS_COLUMNS = [("host_id", "string"), ("name", "string"), ("pid", "int"), ("session", "string"),
+                   ("memory_kb", "int")]
+UPDATE_COLUMNS = [("host_id", "string"), ("hotfix_id", "string"), ("description", "string"),
+                  ("installed_on", "string"), ("installed_by", "string")]
+
+# Export formats: file extension and HTTP content type
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv; charset=utf-8"),
+    "ndjson": (".ndjson", "application/x-ndjson"),
+    "columnar": (".col", "application/octet-stream")
+}
+# Bytes buffered before a chunk of a streamed export is sent
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Columnar files: rows per row group, file signature, and the value standing for a missing integer
+ROW_GROUP_SIZE = 65536
+COLUMNAR_MAGIC = b"ASSETCOL1"
+INT_NULL = -2 ** 63
+MANIFEST_FILE = "manifest.json"
+
+
+def text(value):
+    return None if value is None else str(value)
+
+
+def integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def records(data, section):
+    """
+    Returns the dict items of a list section, skipping anything else.
+    """
+    value = data.get(section)
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def host_rows(host, received_at, data):
+    system_info = data.get("system_info") or {}
+    hardware_info = data.get("hardware_info") if isinstance(data.get("hardware_info"), dict) else {}
+    disk = hardware_info.get("Disk") if isinstance(hardware_info.get("Disk"), dict) else {}
+    yield (host, text(system_info.get("Node Name")), text(system_info.get("MAC Address")),
+           text(system_info.get("System")), text(system_info.get("Release")), text(system_info.get("Version")),
+           text(system_info.get("Machine")), text(system_info.get("Processor")), text(hardware_info.get("RAM")),
+           text(disk.get("Total")), encryption_state(data.get("disk_encryption_status")),
+           len(records(data, "software_list")), received_at.isoformat(timespec="seconds"))
+
+
+def software_rows(host, received_at, data):
+    for s in records(data, "software_list"):
+        yield host, text(s.get("Name")), text(s.get("Version")), text(s.get("Vendor"))
+
+
+def process_rows(host, received_at, data):
+    for p in records(data, "running_processes"):
+        yield host, text(p.get("Name")), integer(p.get("PID")), text(p.get("Session")), integer(p.get("Memory KB"))
+
+
+def update_rows(host, received_at, data):
+    for u in records(data, "update_status"):
+        yield (host, text(u.get("HotFixID")), text(u.get("Description")), text(u.get("InstalledOn")),
+               text(u.get("InstalledBy")))
+
+
+# Exported tables: {name: (columns, function yielding the rows of one report)}
+TABLES = {
+    "hosts": (HOST_COLUMNS, host_rows),
+    "software": (SOFTWARE_COLUMNS, software_rows),
+    "processes": (PROCESS_COLUMNS, process_rows),
+    "updates": (UPDATE_COLUMNS, update_rows)
+}
+
+
+class CsvWriter:
+    """
+    Writes rows to a binary file as CSV with a header line.
+    """
+
+    def __init__(self, file, columns):
+        self.file = file
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.writer.writerow([name for name, _ in columns])
+        self.rows = 0
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.writer.writerow(row)
+            self.rows += 1
+        self.file.write(self.buffer.getvalue().encode("utf-8"))
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def close(self):
+        self.write_rows(())
+
+
+class NdjsonWriter:
+    """
+    Writes rows to a binary file as one JSON object per line.
+    """
+
+    def __init__(self, file, columns):
+        self.file = file
+        self.names = [name for name, _ in columns]
+        self.rows = 0
+
+    def write_rows(self, rows):
+        lines = [json.dumps(dict(zip(self.names, row)), ensure_ascii=False) + "\n" for row in rows]
+        self.file.write("".join(lines).encode("utf-8"))
+        self.rows += len(lines)
+
+    def close(self):
+        pass
+
+
+def little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+class ColumnarWriter:
+    """
+    Writes rows to a binary file as a columnar table, in row groups of ROW_GROUP_SIZE rows.
+    In a row group, a string column is a dictionary of its distinct values (a JSON array)
+    followed by the code of each row in it (1, 2 or 4 bytes), and an integer column is an int64 array
+    (INT_NULL for missing values). A JSON footer, followed by its length and COLUMNAR_MAGIC, lists the columns
+    and the offset of every chunk, so the file is written in one pass and a reader loads only the columns it needs.
+    """
+
+    def __init__(self, file, columns):
+        self.file = file
+        self.columns = columns
+        self.pending = []
+        self.row_groups = []
+        self.rows = 0
+        self.file.write(COLUMNAR_MAGIC)
+        self.offset = len(COLUMNAR_MAGIC)
+
+    def write_rows(self, rows):
+        self.pending.extend(rows)
+        while len(self.pending) >= ROW_GROUP_SIZE:
+            self.write_row_group(self.pending[:ROW_GROUP_SIZE])
+            del self.pending[:ROW_GROUP_SIZE]
+
+    def write_chunk(self, data):
+        self.file.write(data)
+        self.offset += len(data)
+
+    def write_row_group(self, rows):
+        chunks = []
+        for i, (_, kind) in enumerate(self.columns):
+            values = [row[i] for row in rows]
+            chunk = {"offset": self.offset}
+            if kind == "int":
+                self.write_chunk(little_endian(array("q", (INT_NULL if v is None else v for v in values))))
+            else:
+                codes = {}
+                indexes = [codes.setdefault(value, len(codes)) for value in values]
+                dictionary = json.dumps(list(codes), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                typecode = "B" if len(codes) <= 1 << 8 else "H" if len(codes) <= 1 << 16 else "I"
+                self.write_chunk(dictionary)
+                chunk["dictionary_length"] = len(dictionary)
+                chunk["codes"] = typecode
+                self.write_chunk(little_endian(array(typecode, indexes)))
+            chunk["length"] = self.offset - chunk["offset"]
+            chunks.append(chunk)
+        self.row_groups.append({"rows": len(rows), "columns": chunks})
+        self.rows += len(rows)
+
+    def close(self):
+        if self.pending or not self.row_groups:
+            self.write_row_group(self.pending)
+            self.pending = []
+        footer = json.dumps({"columns": [{"name": name, "type": kind} for name, kind in self.columns],
+                             "rows": self.rows, "row_groups": self.row_groups}).encode("utf-8")
+        self.file.write(footer + struct.pack("<Q", len(footer)) + COLUMNAR_MAGIC)
+
+
+WRITERS = {"csv": CsvWriter, "ndjson": NdjsonWriter, "columnar": ColumnarWriter}
+
+
+def load_columnar(path, columns=None):
+    """
+    Reads a columnar file. Returns {column name: list of values} for the given columns (all by default).
+    """
+    with open(path, "rb") as file:
+        content = file.read()
+    tail = len(COLUMNAR_MAGIC)
+    if content[:tail] != COLUMNAR_MAGIC or content[-tail:] != COLUMNAR_MAGIC:
+        raise ValueError(f"{path} is not a columnar export")
+    footer_length, = struct.unpack_from("<Q", content, len(content) - tail - 8)
+    footer = json.loads(content[len(content) - tail - 8 - footer_length:len(content) - tail - 8])
+    names = [column["name"] for column in footer["columns"]]
+    wanted = columns or names
+    table = {name: [] for name in wanted}
+    for group in footer["row_groups"]:
+        for name in wanted:
+            chunk = group["columns"][names.index(name)]
+            start, end = chunk["offset"], chunk["offset"] + chunk["length"]
+            if "codes" in chunk:
+                dictionary = json.loads(content[start:start + chunk["dictionary_length"]])
+                codes = array(chunk["codes"])
+                codes.frombytes(content[start + chunk["dictionary_length"]:end])
+                if sys.byteorder != "little":
+                    codes.byteswap()
+                table[name].extend(dictionary[code] for code in codes)
+            else:
+                values = array("q")
+                values.frombytes(content[start:end])
+                if sys.byteorder != "little":
+                    values.byteswap()
+                table[name].extend(None if value == INT_NULL else value for value in values)
+    return table
+
+
+def iter_reports(storage, since=None):
+    """
+    Yields (host id, received_at, data) for the latest report of every host, received at or after since.
+    """
+    for received_at, data in storage.iter_latest_reports(since):
+        yield host_id(data), received_at, data
+
+
+def stream_table(storage, table, export_format, since=None):
+    """
+    Yields the export of one table as chunks of bytes, e.g. for a streamed HTTP response.
+    """
+    columns, rows = TABLES[table]
+    buffer = io.BytesIO()
+    writer = WRITERS[export_format](buffer, columns)
+    for host, received_at, data in iter_reports(storage, since):
+        writer.write_rows(rows(host, received_at, data))
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    writer.close()
+    yield buffer.getvalue()
+
+
+def export_tables(storage, output_dir, tables=tuple(TABLES), export_format="csv", since=None):
+    """
+    Writes one file per table in output_dir, reading the reports once, and a manifest with the watermark
+    to pass as since to the next incremental export. Returns the manifest.
+    """
+    watermark = datetime.now()  # Reports received during the export are exported again next time
+    os.makedirs(output_dir, exist_ok=True)
+    extension = EXPORT_FORMATS[export_format][0]
+    files = {}
+    writers = {}
+    try:
+        for table in tables:
+            path = os.path.join(output_dir, table + extension)
+            files[table] = (path, open(path + ".tmp", "wb"))
+            writers[table] = WRITERS[export_format](files[table][1], TABLES[table][0])
+        hosts = 0
+        for host, received_at, data in iter_reports(storage, since):
+            for table, writer in writers.items():
+                writer.write_rows(TABLES[table][1](host, received_at, data))
+            hosts += 1
+        for writer in writers.values():
+            writer.close()
+    finally:
+        for path, file in files.values():
+            file.close()
+    for path, _ in files.values():
+        os.replace(path + ".tmp", path)
+
+    manifest = {
+        "watermark": watermark.isoformat(timespec="seconds"),
+        "since": since.isoformat(timespec="seconds") if since else None,
+        "format": export_format,
+        "hosts": hosts,
+        "tables": {table: {"file": os.path.basename(files[table][0]), "rows": writer.rows}
+                   for table, writer in writers.items()}
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), mode="w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=4)
+    return manifest
+
+
+def previous_watermark(output_dir):
+    """
+    Returns the watermark of the last export written to output_dir, or None.
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            return parse_local_time(json.load(file)["watermark"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the latest inventory of every host as tables.")
+    parser.add_argument("output_dir", help="Directory receiving one file per table and manifest.json")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLES), default=list(TABLES))
+    parser.add_argument("--since", type=parse_local_time,
+                        help="Only export hosts whose latest report was received at or after this ISO 8601 time")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only export hosts reported since the previous export to the same directory")
+    parser.add_argument("--storage", choices=["json", "sqlite", "history"],
+                        default=os.environ.get("ASSET_SERVER_STORAGE", "sqlite"))
+    parser.add_argument("--data-dir", default=os.environ.get("ASSET_SERVER_DATA_DIR", "data"))
+    parser.add_argument("--db", help="SQLite database path (default: <data_dir>/assets.db)")
+    args = parser.parse_args()
+
+    since = args.since
+    if args.incremental and since is None:
+        since = previous_watermark(args.output_dir)
+    result = export_tables(create_storage(args.storage, args.data_dir, args.db), args.output_dir,
+                           args.tables, args.format, since)
+    for name, table in result["tables"].items():
+        print(f"{name}: {table['rows']} rows in {table['file']}")
+    print(f"Exported {result['hosts']} hosts, watermark {result['watermark']}")
@@ -0,0 +1,169 @@
+import base64
+import bisect
+import sys
+import threading
+
+# Default and maximum page sizes of the query API
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def normalize_name(name):
+    return (name or "").strip().lower()
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def paginate(items, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns one page of (key, item) pairs sorted by key, and the cursor of the next page (or None).
+    The cursor is the last key of the page, so pages stay stable while the index changes.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    keys = [key for key, _ in items]
+    start = bisect.bisect_right(keys, decode_cursor(cursor)) if cursor else 0
+    page = items[start:start + limit]
+    next_cursor = encode_cursor(page[-1][0]) if start + limit < len(items) else None
+    return [item for _, item in page], next_cursor
+
+
+class FleetIndex:
+    """
+    In-memory inverted indexes over the latest report of every host:
+    software name -> version -> set of host ids, vendor -> set of host ids, node name -> host id.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}       # host id -> {"system_info", "software", "received_at"}
+        self.software = {}    # normalized name -> {"name": display name, "versions": {version: set of host ids}}
+        self.vendors = {}     # vendor -> {host id: number of packages}
+        self.node_names = {}  # normalized node name -> host id
+
+    def update(self, host, data, received_at=None):
+        """
+        Replaces the indexed entries of a host by the content of its new report.
+        """
+        software = set()
+        for s in data.get("software_list", []):
+            if isinstance(s, dict) and s.get("Name"):
+                software.add((sys.intern(s["Name"]), sys.intern(str(s.get("Version", "N/A"))),
+                              sys.intern(str(s.get("Vendor", "N/A")))))
+        system_info = data.get("system_info", {})
+        with self.lock:
+            self.remove_host(host)
+            self.hosts[host] = {"system_info": system_info, "software": software, "received_at": received_at}
+            self.node_names[normalize_name(system_info.get("Node Name"))] = host
+            for name, version, vendor in software:
+                entry = self.software.setdefault(normalize_name(name), {"name": name, "versions": {}})
+                entry["versions"].setdefault(version, set()).add(host)
+                vendor_hosts = self.vendors.setdefault(vendor, {})
+                vendor_hosts[host] = vendor_hosts.get(host, 0) + 1
+
+    def remove_host(self, host):
+        """
+        Removes a host from the indexes. The caller holds the lock.
+        """
+        previous = self.hosts.pop(host, None)
+        if previous is None:
+            return
+        node_name = normalize_name(previous["system_info"].get("Node Name"))
+        if self.node_names.get(node_name) == host:
+            del self.node_names[node_name]
+        for name, version, vendor in previous["software"]:
+            key = normalize_name(name)
+            versions = self.software[key]["versions"]
+            versions[version].discard(host)
+            if not versions[version]:
+                del versions[version]
+                if not versions:
+                    del self.software[key]
+            vendor_hosts = self.vendors[vendor]
+            vendor_hosts[host] -= 1
+            if not vendor_hosts[host]:
+                del vendor_hosts[host]
+                if not vendor_hosts:
+                    del self.vendors[vendor]
+
+    def software_by_host(self):
+        """
+        Returns host id -> set of (name, version, vendor) of every indexed host.
+        The sets are replaced, never modified, by update, so they can be read without the lock.
+        """
+        with self.lock:
+            return {host: entry["software"] for host, entry in self.hosts.items()}
+
+    def host_software(self, host):
+        with self.lock:
+            entry = self.hosts.get(host)
+            return entry["software"] if entry is not None else set()
+
+    def host_summary(self, host):
+        system_info = self.hosts[host]["system_info"]
+        return {"host": host, "Node Name": system_info.get("Node Name"), "MAC Address": system_info.get("MAC Address")}
+
+    def find_software(self, name, version=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of the hosts running the given software (and version).
+        """
+        with self.lock:
+            entry = self.software.get(normalize_name(name))
+            if entry is None:
+                return [], None
+            versions = entry["versions"]
+            selected = [version] if version is not None else list(versions)
+            items = []
+            for selected_version in selected:
+                for host in versions.get(selected_version, ()):
+                    item = self.host_summary(host)
+                    item["Version"] = selected_version
+                    items.append((f"{host}|{selected_version}", item))
+        items.sort(key=lambda pair: pair[0])
+        return paginate(items, cursor, limit)
+
+    def list_software(self, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of software names with the number of hosts per version.
+        """
+        with self.lock:
+            items = [(key, {"Name": entry["name"],
+                            "Versions": {version: len(hosts) for version, hosts in entry["versions"].items()}})
+                     for key, entry in self.software.items()]
+        items.sort(key=lambda pair: pair[0])
+        return paginate(items, cursor, limit)
+
+    def list_vendors(self, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Returns one page of vendors with their number of hosts and installed packages.
+        """
+        with self.lock:
+            items = [(vendor, {"Vendor": vendor, "Hosts": len(hosts), "Packages": sum(hosts.values())})
+                     for vendor, hosts in self.vendors.items()]
+        items.sort(key=lambda pair: pair[0])
+        return paginate(items, cursor, limit)
+
+    def get_host(self, node):
+        """
+        Returns the latest indexed inventory of a host, by Node Name or host id, or None.
+        """
+        with self.lock:
+            host = node if node in self.hosts else self.node_names.get(normalize_name(node))
+            if host is None:
+                return None
+            entry = self.hosts[host]
+            return {
+                "host": host,
+                "received_at": entry["received_at"],
+                "system_info": entry["system_info"],
+                "software_list": [{"Name": name, "Version": version, "Vendor": vendor}
+                                  for name, version, vendor in sorted(entry["software"])]
+            }
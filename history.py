@@ -0,0 +1,471 @@
+import argparse
+import bisect
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from delta import apply_delta, diff_software, make_delta
+from storage import encode_json, host_id
+
+# Snapshot history stored in append-only segment files.
+# Each segment is a pair of files: <name>.seg holds zlib-compressed JSON records, <name>.idx a fixed-size
+# entry per record (host hash, timestamp, offset, length, kind) that is read through mmap.
+# New reports are appended in full to "segment-<n>" files. Compaction merges every sealed segment into a
+# single "compact-<n>" segment where each host's snapshots are a full base followed by deltas, its index
+# sorted by host so a lookup is a binary search, and old history thinned according to RETENTION.
+
+# Size above which the segment being written is sealed and a new one started
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+# Longest run of deltas in a compacted segment before a full snapshot is written again
+MAX_DELTA_CHAIN = 50
+# Retention tiers, by age: (maximum age, keep the last snapshot of each period of that many seconds).
+# A period of 0 keeps every snapshot; the last tier applies to everything older.
+RETENTION = [
+    (timedelta(days=2), 0),
+    (timedelta(days=30), 3600),
+    (timedelta(days=365), 86400),
+    (None, 7 * 86400)
+]
+
+# Index entry: host hash, timestamp (seconds), offset and length of the record, kind
+INDEX_ENTRY = struct.Struct("<QqQIB3x")
+KIND_FULL = 0
+KIND_DELTA = 1
+
+
+def host_hash(host):
+    return int.from_bytes(hashlib.blake2b(host.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def timestamp(moment):
+    return int(moment.timestamp())
+
+
+def replay(host, records):
+    """
+    Yields (timestamp, received_at, data) from (timestamp, kind, record) of a segment, oldest first,
+    applying each delta to the full snapshot before it. Records of other hosts with the same hash are skipped.
+    """
+    data = None
+    for moment, kind, record in records:
+        record = json.loads(zlib.decompress(record))
+        if record["host"] != host:
+            continue
+        if kind == KIND_FULL:
+            data = record["data"]
+        elif data is not None:
+            data = apply_delta(data, record["delta"])
+        else:
+            continue
+        yield moment, record["received_at"], data
+
+
+def retention_period(received_at, now, retention=RETENTION):
+    """
+    Returns the retention period a snapshot falls in: snapshots of a host in the same period
+    are thinned to the last one. Snapshots kept in full get a period of their own.
+    """
+    age = now - received_at
+    for tier, (max_age, seconds) in enumerate(retention):
+        if max_age is None or age < max_age:
+            if not seconds:
+                return tier, received_at.isoformat()
+            return tier, timestamp(received_at) // seconds
+    return len(retention), 0
+
+
+class IndexView:
+    """
+    Sequence of (host hash, timestamp) over a sorted index, for bisect.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.count = len(buffer) // INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return INDEX_ENTRY.unpack_from(self.buffer, i * INDEX_ENTRY.size)[:2]
+
+
+class Segment:
+    """
+    One segment file and its index. Sealed segments are read through mmap; the segment being
+    written is read through a file handle.
+    """
+
+    def __init__(self, path, sorted_index=False):
+        self.path = path
+        self.index_path = path[:-len(".seg")] + ".idx"
+        self.sorted_index = sorted_index
+        self.writer = None
+        self.index_writer = None
+        self.reader = None
+        self.data_map = None
+        self.index_map = None
+        # {host hash: entries by timestamp} of an unsorted index, built on the first lookup
+        # and kept up to date by append
+        self.host_entries = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)[:-len(".seg")]
+
+    def open_for_append(self):
+        self.writer = open(self.path, "ab")
+        self.index_writer = open(self.index_path, "ab")
+        # Drop a partially written entry left by a crash
+        size = self.index_writer.tell()
+        if size % INDEX_ENTRY.size:
+            self.index_writer.truncate(size - size % INDEX_ENTRY.size)
+            self.index_writer.seek(0, os.SEEK_END)
+
+    def append(self, host, received_at, kind, payload):
+        record = zlib.compress(encode_json(dict(payload, host=host, received_at=received_at.isoformat())).encode("utf-8"))
+        offset = self.writer.tell()
+        self.writer.write(record)
+        entry = (host_hash(host), timestamp(received_at), offset, len(record), kind)
+        self.index_writer.write(INDEX_ENTRY.pack(*entry))
+        if self.host_entries is not None:
+            bisect.insort(self.host_entries.setdefault(entry[0], []), entry, key=lambda item: item[1])
+
+    def size(self):
+        return self.writer.tell() if self.writer else os.path.getsize(self.path)
+
+    def flush(self):
+        self.writer.flush()
+        self.index_writer.flush()
+
+    def seal(self):
+        """
+        Stops appending: the segment is read through mmap from now on.
+        """
+        if self.writer:
+            self.writer.close()
+            self.index_writer.close()
+            self.writer = self.index_writer = None
+        if self.reader:
+            self.reader.close()
+            self.reader = None
+
+    def map(self, path):
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index(self):
+        if self.writer:
+            with open(self.index_path, "rb") as file:
+                data = file.read()
+            return data[:len(data) - len(data) % INDEX_ENTRY.size]
+        if self.index_map is None:
+            self.index_map = self.map(self.index_path)
+        return self.index_map
+
+    def read(self, offset, length):
+        """
+        Returns the decoded record at offset.
+        """
+        return json.loads(zlib.decompress(self.read_record(offset, length)))
+
+    def read_record(self, offset, length):
+        """
+        Returns the compressed record at offset.
+        """
+        if self.writer:
+            if self.reader is None:
+                self.reader = open(self.path, "rb")
+            self.reader.seek(offset)
+            record = self.reader.read(length)
+        else:
+            if self.data_map is None:
+                self.data_map = self.map(self.path)
+            record = self.data_map[offset:offset + length]
+        return record
+
+    def entries(self, hash_value=None):
+        """
+        Returns the (host hash, timestamp, offset, length, kind) entries of one host hash (or all), by timestamp.
+        """
+        if hash_value is not None and self.sorted_index:
+            index = self.index()
+            view = IndexView(index)
+            start = bisect.bisect_left(view, (hash_value, -2 ** 63))
+            end = bisect.bisect_right(view, (hash_value, 2 ** 63 - 1))
+            return [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size) for i in range(start, end)]
+        if hash_value is not None:
+            if self.host_entries is None:
+                host_entries = {}
+                for entry in INDEX_ENTRY.iter_unpack(self.index()):
+                    host_entries.setdefault(entry[0], []).append(entry)
+                for entries in host_entries.values():
+                    entries.sort(key=lambda entry: entry[1])
+                self.host_entries = host_entries
+            return list(self.host_entries.get(hash_value, ()))
+        return sorted(INDEX_ENTRY.iter_unpack(self.index()), key=lambda entry: entry[1])
+
+    def snapshots(self, host, until=None, entries=None):
+        """
+        Yields (timestamp, received_at, data) for the snapshots of a host in this segment, oldest first
+        (or for the given index entries, which must start with a full snapshot).
+        """
+        if entries is None:
+            entries = self.entries(host_hash(host))
+        yield from replay(host, ((moment, kind, self.read_record(offset, length))
+                                 for _, moment, offset, length, kind in entries if until is None or moment <= until))
+
+    def close(self):
+        self.seal()
+        for mapped in (self.data_map, self.index_map):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self.data_map = self.index_map = None
+        self.host_entries = None
+
+    def delete(self):
+        self.close()
+        for path in (self.path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class HistoryStore:
+    """
+    Storage backend keeping the history of every host in segments, with time-travel queries.
+    """
+
+    def __init__(self, directory, segment_max_bytes=SEGMENT_MAX_BYTES, retention=RETENTION):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.compact_lock = threading.Lock()
+        self.segments = []  # Sealed segments
+        self.active = None
+        self.sequence = 0
+        for name in sorted(os.listdir(directory)):
+            match = re.match(r"(segment|compact)-(\d+)\.seg$", name)
+            if match:
+                self.segments.append(Segment(os.path.join(directory, name), match.group(1) == "compact"))
+                self.sequence = max(self.sequence, int(match.group(2)))
+
+    def new_segment(self, kind="segment"):
+        self.sequence += 1
+        return Segment(os.path.join(self.directory, f"{kind}-{self.sequence:08d}.seg"), kind == "compact")
+
+    def rotate(self):
+        """
+        Seals the segment being written. The caller holds the lock.
+        """
+        if self.active is not None:
+            self.active.seal()
+            self.segments.append(self.active)
+            self.active = None
+
+    def save(self, data, received_at=None):
+        return self.save_batch([(received_at, data)])[0]
+
+    def save_many(self, reports, received_at=None):
+        received_at = received_at or datetime.now()
+        return self.save_batch([(received_at, data) for data in reports])
+
+    def save_batch(self, items):
+        """
+        Appends several (received_at, data) reports to the current segment.
+        """
+        with self.lock:
+            if self.active is None:
+                self.active = self.new_segment()
+                self.active.open_for_append()
+            for received_at, data in items:
+                self.active.append(host_id(data), received_at or datetime.now(), KIND_FULL, {"data": data})
+            self.active.flush()
+            names = [self.active.name] * len(items)
+            if self.active.size() >= self.segment_max_bytes:
+                self.rotate()
+            return names
+
+    def all_segments(self):
+        return self.segments + ([self.active] if self.active is not None else [])
+
+    def host_hashes(self):
+        """
+        Returns {host hash: host id} of every host in the history.
+        """
+        with self.lock:
+            hosts = {}
+            for segment in self.all_segments():
+                for hash_value, _, offset, length, _ in segment.entries():
+                    if hash_value not in hosts:
+                        hosts[hash_value] = segment.read(offset, length)["host"]
+            return hosts
+
+    def iter_snapshots(self, host, until=None):
+        """
+        Yields (received_at, data) for every snapshot of a host, oldest first.
+        The records are copied under the lock and decoded once it is released, so a slow reader never blocks ingest.
+        """
+        hash_value = host_hash(host)
+        with self.lock:
+            sources = [[(moment, kind, bytes(segment.read_record(offset, length)))
+                        for _, moment, offset, length, kind in segment.entries(hash_value)
+                        if until is None or moment <= until]
+                       for segment in self.all_segments()]
+        merged = heapq.merge(*(replay(host, records) for records in sources), key=lambda snapshot: snapshot[0])
+        for _, received_at, data in merged:
+            yield datetime.fromisoformat(received_at), data
+
+    def as_of(self, host, when=None):
+        """
+        Returns (received_at, data) of the last snapshot of a host at the given time (or the latest), or None.
+        Only the segment holding that snapshot is read, from the full snapshot its delta chain starts from.
+        """
+        until = timestamp(when) if when is not None else None
+        hash_value = host_hash(host)
+        with self.lock:
+            best = None
+            for segment in self.all_segments():
+                entries = [entry for entry in segment.entries(hash_value) if until is None or entry[1] <= until]
+                if entries and (best is None or entries[-1][1] >= best[0][-1][1]):
+                    best = (entries, segment)
+            if best is None:
+                return None
+            entries, segment = best
+            # Replay from the last full snapshot of this host
+            start = len(entries) - 1
+            while start > 0 and (entries[start][4] != KIND_FULL
+                                 or segment.read(entries[start][2], entries[start][3])["host"] != host):
+                start -= 1
+            snapshot = None
+            for _, received_at, data in segment.snapshots(host, entries=entries[start:]):
+                snapshot = (received_at, data)
+        if snapshot is None:
+            return None
+        return datetime.fromisoformat(snapshot[0]), snapshot[1]
+
+    def software_events(self, start, end, host=None):
+        """
+        Returns the software installed, uninstalled and updated between two times, oldest first:
+        {"host", "received_at", "event", "Name", "Version", "Vendor"[, "Previous Version"]}.
+        """
+        hosts = [host] if host is not None else sorted(self.host_hashes().values())
+        events = []
+        for host in hosts:
+            previous = None
+            for received_at, data in self.iter_snapshots(host, timestamp(end)):
+                software = data.get("software_list", [])
+                if received_at > start and previous is not None:
+                    changes = diff_software(previous, software)
+                    for event, key in (("installed", "added"), ("uninstalled", "removed"), ("updated", "changed")):
+                        for s in changes[key]:
+                            events.append(dict(s, host=host, received_at=received_at.isoformat(), event=event))
+                previous = software
+        events.sort(key=lambda event: (event["received_at"], event["host"]))
+        return events
+
+    def iter_reports(self):
+        """
+        Yields (received_at, data) for every stored snapshot, host by host.
+        """
+        for host in self.host_hashes().values():
+            yield from self.iter_snapshots(host)
+
+    def iter_latest_reports(self, since=None):
+        """
+        Yields (received_at, data) for the latest snapshot of every host (received at or after since, if given).
+        """
+        for host in self.host_hashes().values():
+            snapshot = self.as_of(host)
+            if snapshot is not None and (since is None or snapshot[0] >= since):
+                yield snapshot
+
+    def compact(self, now=None):
+        """
+        Merges every sealed segment (and the current one) into one compacted segment:
+        history thinned according to the retention tiers, each host stored as a base and deltas.
+        Returns the number of snapshots kept.
+        """
+        now = now or datetime.now()
+        with self.compact_lock:
+            with self.lock:
+                self.rotate()
+                sources = list(self.segments)
+                target = self.new_segment("compact")
+            if not sources:
+                return 0
+            hosts = {}
+            for segment in sources:
+                for hash_value, _, offset, length, _ in segment.entries():
+                    if hash_value not in hosts:
+                        hosts[hash_value] = segment.read(offset, length)["host"]
+
+            tmp = Segment(target.path + ".tmp")
+            tmp.index_path = target.index_path + ".tmp"
+            tmp.writer = open(tmp.path, "wb")
+            tmp.index_writer = open(tmp.index_path, "wb")
+            kept = 0
+            try:
+                for hash_value in sorted(hosts):
+                    kept += self.compact_host(hosts[hash_value], sources, tmp, now)
+                tmp.close()
+                os.replace(tmp.path, target.path)
+                os.replace(tmp.index_path, target.index_path)
+            except Exception:
+                tmp.delete()
+                raise
+
+            with self.lock:
+                self.segments = [target] + [segment for segment in self.segments if segment not in sources]
+                for segment in sources:
+                    segment.delete()
+            return kept
+
+    def compact_host(self, host, sources, target, now):
+        """
+        Writes the thinned history of one host to the compacted segment. Returns the number of snapshots kept.
+        """
+        merged = heapq.merge(*(segment.snapshots(host) for segment in sources), key=lambda snapshot: snapshot[0])
+        previous = None
+        chain = 0
+        kept = 0
+        pending = None
+        for snapshot in itertools.chain(merged, [None]):
+            if pending is not None:
+                received_at = datetime.fromisoformat(pending[1])
+                period = retention_period(received_at, now, self.retention)
+                next_period = (retention_period(datetime.fromisoformat(snapshot[1]), now, self.retention)
+                               if snapshot is not None else None)
+                if period != next_period:
+                    data = pending[2]
+                    if previous is None or chain >= MAX_DELTA_CHAIN:
+                        target.append(host, received_at, KIND_FULL, {"data": data})
+                        chain = 0
+                    else:
+                        target.append(host, received_at, KIND_DELTA, {"delta": make_delta(previous, data)})
+                        chain += 1
+                    previous = data
+                    kept += 1
+            pending = snapshot
+        return kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the snapshot history of the asset server.")
+    parser.add_argument("directory", help="History directory (<data_dir>/history)")
+    args = parser.parse_args()
+
+    print(f"Kept {HistoryStore(args.directory).compact()} snapshots")
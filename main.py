@@ -1,17 +1,251 @@
+import time
+
+# Time the agent started, for the startup telemetry (see main)
+_STARTED = time.perf_counter()
+
+import argparse
+import contextlib
 import datetime
-import requests
 import json
 import platform
+import queue
+import random
+import re
+import signal
 import subprocess
-import uuid
-import winreg
+import sys
+import threading
 import os
 import shutil
 
+# requests, uuid and winreg are imported where they are used:
+# a quick "--only system --no-upload" run never pays for them.
+
+from delta import make_delta, snapshot_hash
+from parsers import parse_ipconfig, parse_netstat, parse_tasklist, parse_wmic_qfe
+from software import SoftwareScanner, WinRegistry, clean_text
+from spool import Spool
+from transport import (DEFAULT_ENCODING, FILE_EXTENSIONS, choose_encoding, decode_payload, encode_ndjson,
+                       encode_payload, encoding_for_file)
+
+# Default per-collector timeout in seconds
+COLLECTOR_TIMEOUT = 120
+# Extra time given to a collector after its deadline before it is abandoned
+COLLECTOR_GRACE = 5
+# Timeout of the installed software scan, which reads every Uninstall subkey when its cache is cold
+SOFTWARE_SCAN_TIMEOUT = 600
+# Number of collectors allowed to run at the same time
+COLLECTOR_WORKERS = 8
+
+# Local state kept between runs (registry cache, ...)
+STATE_DIR = os.environ.get("ASSET_AGENT_STATE_DIR", "agent_state")
+SOFTWARE_CACHE_FILE = os.path.join(STATE_DIR, "software_cache.json")
+LAST_SNAPSHOT_FILE = os.path.join(STATE_DIR, "last_snapshot.json")
+SPOOL_DIR = os.path.join(STATE_DIR, "spool")
+CHECKIN_FILE = os.path.join(STATE_DIR, "checkin.json")
+UPLOAD_ENCODING_FILE = os.path.join(STATE_DIR, "upload_encoding.json")
+# Set ASSET_AGENT_USE_WMIC=1 to also query "wmic product" (slow)
+USE_WMIC = os.environ.get("ASSET_AGENT_USE_WMIC", "0") == "1"
+# Words in the name of installed software that mark it as security software
+SECURITY_KEYWORDS = ("antivirus", "anti-virus", "security", "firewall")
+
+# Central server endpoint receiving the reports
+SERVER_URL = "http://192.168.25.89:5000/api/asset"  # Replace with your server's URL
+
+# Timeout in seconds for uploads to the server
+UPLOAD_TIMEOUT = 60
+
+# Check-in: the server tells the agent when to report next. Without a schedule, the agent waits a random
+# delay of up to CHECKIN_JITTER seconds; a run more than MAX_CHECKIN_WAIT seconds before its check-in exits
+CHECKIN_JITTER = int(os.environ.get("ASSET_AGENT_CHECKIN_JITTER", 15 * 60))
+MAX_CHECKIN_WAIT = int(os.environ.get("ASSET_AGENT_MAX_CHECKIN_WAIT", 3600))
+
+# HTTP session reused for all uploads (see get_session)
+_session = None
+# Registry scanner reused between collections (see get_software_scanner)
+_software_scanner = None
+
+# Resident agent: how often a report is assembled and sent, and how often the schedule is checked (seconds)
+REPORT_INTERVAL = 15 * 60
+DAEMON_TICK = 60
+# Delay before retrying a collector that failed or timed out
+COLLECTOR_RETRY_INTERVAL = 5 * 60
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Replaces the execution of commands (e.g. replay.ReplayRunner for benchmarks), see set_command_runner
+_command_runner = None
+
+# Per-thread state of the collector currently running (deadline, timeout flag, telemetry counters)
+_collector_context = threading.local()
+
+
+def count_command(output_bytes=0, error=False):
+    """
+    Adds a command run to the telemetry of the current collector.
+    """
+    _collector_context.subprocesses = getattr(_collector_context, "subprocesses", 0) + 1
+    _collector_context.output_bytes = getattr(_collector_context, "output_bytes", 0) + output_bytes
+    if error:
+        _collector_context.errors = getattr(_collector_context, "errors", 0) + 1
+
+
+def output_size(result):
+    size = 0
+    for output in (result.stdout, result.stderr):
+        if isinstance(output, str):
+            size += len(output.encode("utf-8", errors="replace"))
+        elif output:
+            size += len(output)
+    return size
+
+
+def set_command_runner(runner):
+    """
+    Makes the collectors run their commands through runner (run(args, **kwargs) and stream(args)),
+    or through subprocess again when runner is None.
+    """
+    global _command_runner
+    _command_runner = runner
+
+
+def resolve_command(args):
+    """
+    Returns args with the program looked up in PATH (with PATHEXT on Windows, so "code" finds code.cmd),
+    since commands are started without a shell.
+    """
+    return [shutil.which(args[0]) or args[0]] + list(args[1:])
+
+
+def start_process(args, **kwargs):
+    """
+    Starts a command in a new process group, so kill_process_tree also reaches the processes it starts.
+    """
+    if os.name == "nt":
+        kwargs["creationflags"] = kwargs.get("creationflags", 0) | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(resolve_command(args), **kwargs)
+
+
+def kill_process_tree(process):
+    """
+    Kills a process started by start_process and every process it started.
+    """
+    if os.name == "nt":
+        subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    process.kill()
+
+
+def run_process(args, timeout=None, capture_output=False, **kwargs):
+    """
+    Like subprocess.run, but a command that times out is killed with the processes it started.
+    """
+    if capture_output:
+        kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+    with start_process(args, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except BaseException:
+            kill_process_tree(process)
+            process.communicate()
+            raise
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+def run_command(args, **kwargs):
+    """
+    Runs a command for the current collector, bounded by the collector's remaining time.
+    The command and the processes it started are killed when the collector's deadline passes.
+    """
+    try:
+        if _command_runner is not None:
+            result = _command_runner.run(args, **kwargs)
+        else:
+            deadline = getattr(_collector_context, "deadline", None)
+            if deadline is not None and "timeout" not in kwargs:
+                kwargs["timeout"] = max(deadline - time.monotonic(), 0.1)
+            result = run_process(args, **kwargs)
+    except subprocess.TimeoutExpired:
+        _collector_context.timed_out = True
+        count_command(error=True)
+        raise
+    except OSError:
+        count_command(error=True)
+        raise
+    count_command(output_size(result), error=result.returncode != 0)
+    return result
+
+
+def counted_lines(lines, counter):
+    """
+    Yields the lines of a command's output, adding their size to counter[0].
+    """
+    for line in lines:
+        counter[0] += len(line)
+        yield line
+
+
+def stream_command(args, parse):
+    """
+    Runs a command and parses its output line by line, straight from the pipe, as it is produced.
+    Returns the parsed records and the return code. Like run_command, the process is killed when
+    the collector's deadline passes.
+    """
+    size = [0]
+    if _command_runner is not None:
+        lines, returncode = _command_runner.stream(args)
+        records = list(parse(counted_lines(lines, size)))
+        count_command(size[0], error=returncode != 0)
+        return records, returncode
+    deadline = getattr(_collector_context, "deadline", None)
+    # The whole process tree is killed, so no child of the command keeps the pipe open
+    try:
+        process = start_process(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                text=True, errors="replace")
+    except OSError:
+        count_command(error=True)
+        raise
+    killed = threading.Event()
+
+    def kill():
+        killed.set()
+        kill_process_tree(process)
+
+    timer = None
+    timeout = None
+    if deadline is not None:
+        timeout = max(deadline - time.monotonic(), 0.1)
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+    try:
+        records = list(parse(counted_lines(process.stdout, size)))
+    finally:
+        if timer is not None:
+            timer.cancel()
+        process.stdout.close()
+        returncode = process.wait()
+        count_command(size[0], error=killed.is_set() or returncode != 0)
+    if killed.is_set():
+        _collector_context.timed_out = True
+        raise subprocess.TimeoutExpired(args, timeout)
+    return records, returncode
+
+
 def get_system_info():
     """
     Retrieves and prints system information using the platform module.
     """
+    import uuid
+
     my_system = platform.uname()
     mac_address = ':'.join(['{:02x}'.format((uuid.getnode() >> ele) & 0xff)
                             for ele in range(0, 8 * 6, 8)][::-1])
@@ -26,19 +260,17 @@ def get_system_info():
     }
 
 
-def get_installed_software():
+def get_wmic_software():
     """
-    Retrieves a list of installed software using WMIC, the Windows Registry, and file metadata.
+    Retrieves a list of installed software using WMIC.
+    This is slow and triggers MSI consistency checks, so it is only used when USE_WMIC is enabled.
     """
     software_list = []
-
-    # Get software using WMIC
     try:
-        result = subprocess.run(
+        result = run_command(
             ["wmic", "product", "get", "Name,Version,Vendor"],
             capture_output=True,
-            text=False,  # Capture raw bytes
-            shell=True
+            text=False  # Capture raw bytes
         )
 
         if result.returncode == 0:
@@ -55,20 +287,22 @@ def get_installed_software():
                     software_list.append(software)
     except Exception as e:
         print(f"Error using WMIC: {e}")
+    return software_list
 
-    # Get software from the Windows Registry
-    try:
-        reg_paths = [
-            r"SOFTWARE/Microsoft\Windows/CurrentVersion/Uninstall",
-            r"SOFTWARE/WOW6432Node/Microsoft\Windows/CurrentVersion/Uninstall"
-        ]
 
-        for reg_path in reg_paths:
-            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, reg_path) as key:
-                software_list.extend(query_registry_key(key))
-            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, reg_path) as key:
-                software_list.extend(query_registry_key(key))
+def get_installed_software(registry=None, use_wmic=None):
+    """
+    Retrieves a list of installed software from the Windows Registry, optionally completed by WMIC.
+    Registry results are cached, so only subkeys changed since the previous run are re-read.
+    """
+    if use_wmic is None:
+        use_wmic = USE_WMIC
+    software_list = get_wmic_software() if use_wmic else []
 
+    # Get software from the Windows Registry
+    try:
+        scanner = get_software_scanner() if registry is None else SoftwareScanner(registry, SOFTWARE_CACHE_FILE)
+        software_list.extend(scanner.scan())
     except Exception as e:
         print(f"Error accessing registry: {e}")
 
@@ -77,66 +311,303 @@ def get_installed_software():
     return list(unique_software.values())
 
 
-def query_registry_key(key):
+def get_software_scanner():
     """
-    Helper function to query a registry key for installed software.
+    Returns the registry scanner kept for the life of the process, so a resident agent keeps its cache warm.
     """
-    software_list = []
-    for i in range(0, winreg.QueryInfoKey(key)[0]):
-        try:
-            subkey_name = winreg.EnumKey(key, i)
-            with winreg.OpenKey(key, subkey_name) as subkey:
-                name = clean_text(winreg.QueryValueEx(subkey, "DisplayName")[0])
-                version = clean_text(winreg.QueryValueEx(subkey, "DisplayVersion")[0]) if "DisplayVersion" in winreg.QueryValueEx(subkey, "DisplayVersion") else "N/A"
-                vendor = clean_text(winreg.QueryValueEx(subkey, "Publisher")[0]) if "Publisher" in winreg.QueryValueEx(subkey, "Publisher") else "N/A"
-                if name:  # Only add entries with a valid name
-                    software_list.append({
-                        "Name": name,
-                        "Version": version,
-                        "Vendor": vendor
-                    })
-        except FileNotFoundError:
-            continue
-        except Exception as e:
-            print(f"Error reading registry: {e}")
-    return software_list
+    global _software_scanner
+    if _software_scanner is None:
+        _software_scanner = SoftwareScanner(WinRegistry(), SOFTWARE_CACHE_FILE)
+    return _software_scanner
 
 
-def clean_text(text):
+def software_changed(state):
     """
-    Cleans up text by ensuring proper encoding and removing invalid characters.
+    Tells whether software was installed or removed since the previous call, from the Uninstall keys' summary.
     """
-    if not text:
-        return "N/A"
-    return text.encode("utf-8", errors="replace").decode("utf-8", errors="ignore").strip()
+    try:
+        fingerprint = get_software_scanner().fingerprint()
+    except Exception:
+        return False
+    changed = state.get("fingerprint") is not None and state["fingerprint"] != fingerprint
+    state["fingerprint"] = fingerprint
+    return changed
 
 
-def save_to_json(data, unused, output_file):
+def save_payload(payload, output_file):
     """
-    Save the collected data to a JSON file.
+    Save the encoded payload to a file, as the exact bytes sent to the server.
     """
     try:
-        with open(output_file, mode="w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
+        with open(output_file, mode="wb") as file:
+            file.write(payload)
         print(f"Data saved to {output_file}")
     except Exception as e:
-        print(f"Error saving to JSON: {e}")
+        print(f"Error saving payload: {e}")
+
+
+def get_session():
+    """
+    Returns the HTTP session shared by all uploads, so connections are kept alive and reused.
+    """
+    global _session
+    if _session is None:
+        import requests
+
+        _session = requests.Session()
+        _session.headers.update({"Content-Type": "application/json"})
+    return _session
+
+
+def post_payload(url, payload, encoding):
+    """
+    Posts an already encoded payload to the server.
+    """
+    return get_session().post(url, data=payload, headers={"Content-Encoding": encoding}, timeout=UPLOAD_TIMEOUT)
+
+
+def load_upload_encoding():
+    """
+    Returns the Content-Encoding of uploads: the one chosen after the server rejected ours, or the default.
+    """
+    try:
+        with open(UPLOAD_ENCODING_FILE, "r", encoding="utf-8") as file:
+            encoding = json.load(file)["encoding"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return DEFAULT_ENCODING
+    return encoding if encoding in FILE_EXTENSIONS else DEFAULT_ENCODING
+
+
+def save_upload_encoding(response):
+    """
+    Chooses the encoding of later uploads from the Accept-Encoding of a 415 response (gzip if it has none),
+    and records it. Returns the chosen encoding.
+    """
+    encoding = choose_encoding(response.headers.get("Accept-Encoding"))
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(UPLOAD_ENCODING_FILE + ".tmp", mode="w", encoding="utf-8") as file:
+            json.dump({"encoding": encoding}, file)
+        os.replace(UPLOAD_ENCODING_FILE + ".tmp", UPLOAD_ENCODING_FILE)
+    except OSError as e:
+        print(f"Error saving upload encoding: {e}")
+    return encoding
+
+
+def post_document(url, data, payload=None, encoding=None):
+    """
+    Posts a document in the upload encoding, reusing payload when it is already encoded that way.
+    When the server does not support the encoding (415), the document is sent again in one it accepts,
+    which is used for every later upload.
+    """
+    upload_encoding = load_upload_encoding()
+    if payload is None or encoding != upload_encoding:
+        payload, encoding = encode_payload(data, upload_encoding)
+    response = post_payload(url, payload, encoding)
+    if response.status_code == 415:
+        fallback = save_upload_encoding(response)
+        if fallback != encoding:
+            print(f"Server does not accept {encoding} payloads, sending {fallback} instead.")
+            response = post_payload(url, *encode_payload(data, fallback))
+    return response
+
+
+def load_last_snapshot():
+    """
+    Loads the last snapshot acknowledged by the server ({"hash": ..., "data": ...}), or None.
+    """
+    if not os.path.exists(LAST_SNAPSHOT_FILE):
+        return None
+    try:
+        with open(LAST_SNAPSHOT_FILE, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except Exception as e:
+        print(f"Error loading last snapshot: {e}")
+        return None
+
+
+def save_last_snapshot(snapshot):
+    """
+    Stores the snapshot acknowledged by the server, to be used as the base of the next delta.
+    """
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(LAST_SNAPSHOT_FILE + ".tmp", mode="w", encoding="utf-8") as file:
+            json.dump(snapshot, file, separators=(",", ":"), ensure_ascii=False)
+        os.replace(LAST_SNAPSHOT_FILE + ".tmp", LAST_SNAPSHOT_FILE)
+    except Exception as e:
+        print(f"Error saving last snapshot: {e}")
 
 
-def send_json_to_server(json_file, server_url):
+def send_snapshot(data, server_url, payload=None, encoding=None):
     """
-    Sends the JSON file to a central server.
+    Sends the collected data to the server.
+    When a previous snapshot was acknowledged, only the changes since that snapshot are sent;
+    the full document is sent if there is no base or the server asks for a full resend.
+    payload/encoding are the already encoded full document, if available.
+    Returns True when the server accepted the data, the server's Retry-After delay in seconds
+    when it is busy, or False on any other failure.
     """
+    snapshot = {"hash": snapshot_hash(data), "data": data}
+    base = load_last_snapshot()
     try:
-        with open(json_file, "r", encoding="utf-8") as file:
-            data = json.load(file)
-        response = requests.post(server_url, json=data)
-        if response.status_code == 200:
+        response = None
+        if base:
+            delta = make_delta(base["data"], data, base["hash"], snapshot["hash"])
+            response = post_document(server_url.rstrip("/") + "/delta", delta)
+            if response.status_code == 409:
+                print("Server does not have the base snapshot, sending full data.")
+                response = None
+        if response is None:
+            response = post_document(server_url, data, payload, encoding)
+
+        if response.status_code in (200, 202):
             print("Data successfully sent to the server.")
-        else:
-            print(f"Failed to send data. Server responded with status code {response.status_code}.")
+            body = response.json()
+            if body.get("snapshot_hash") == snapshot["hash"]:
+                save_last_snapshot(snapshot)
+            report_ingest_notes(body.get("ingest"))
+            save_checkin(body)
+            return True
+        print(f"Failed to send data. Server responded with status code {response.status_code}.")
+        return retry_after(response)
+    except Exception as e:
+        print(f"Error sending data to server: {e}")
+        return False
+
+
+def report_ingest_notes(notes):
+    """
+    Prints the sections the server truncated or dropped from the report (over a size limit or invalid).
+    """
+    if not isinstance(notes, dict):
+        return
+    for section, count in notes.get("truncated", {}).items():
+        print(f"Server truncated {section}: {count} item(s) over the size limit were dropped.")
+    for section, reason in notes.get("quarantined", {}).items():
+        print(f"Server dropped {section}: {reason}.")
+    for section, count in notes.get("dropped_items", {}).items():
+        print(f"Server dropped {count} invalid item(s) from {section}.")
+
+
+def save_checkin(body):
+    """
+    Records the next check-in time assigned by the server (sent as a delay, so clock skew does not matter).
+    """
+    try:
+        next_checkin = time.time() + float(body["checkin_in"])
+    except (KeyError, TypeError, ValueError):
+        return
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(CHECKIN_FILE + ".tmp", mode="w", encoding="utf-8") as file:
+        json.dump({"next_checkin": next_checkin, "server_time": body.get("next_checkin")}, file)
+    os.replace(CHECKIN_FILE + ".tmp", CHECKIN_FILE)
+    print(f"Next check-in in {float(body['checkin_in']) / 60:.0f} min")
+
+
+def checkin_delay():
+    """
+    Returns the number of seconds to wait before reporting, and whether it comes from the server's schedule.
+    Without a pending check-in (first run, or the check-in was missed), returns a random jitter.
+    """
+    try:
+        with open(CHECKIN_FILE, "r", encoding="utf-8") as file:
+            next_checkin = float(json.load(file)["next_checkin"])
+    except (OSError, KeyError, TypeError, ValueError):
+        next_checkin = None
+    now = time.time()
+    if next_checkin is not None and next_checkin > now:
+        return next_checkin - now, True
+    return random.uniform(0, CHECKIN_JITTER), False
+
+
+def retry_after(response):
+    """
+    Returns the Retry-After delay of a response in seconds, or False if there is none.
+    """
+    try:
+        return int(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return False
+
+
+def api_url(server_url, path):
+    """
+    Returns the URL of another API endpoint on the same server as server_url (".../api/asset").
+    """
+    return server_url.rsplit("/api/", 1)[0] + path
+
+
+def iter_saved_reports(directory):
+    """
+    Yields the all_collected_data_<timestamp> files of a directory as bulk records, oldest first.
+    """
+    pattern = re.compile(r"all_collected_data_(\d{8}_\d{6})\.json(\.gz|\.zst)?$")
+    for name in sorted(os.listdir(directory)):
+        match = pattern.match(name)
+        if not match:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as file:
+                data = decode_payload(file, encoding_for_file(path))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        collected_at = datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+        yield {"collected_at": collected_at.isoformat(), "report": data}
+
+
+def post_bulk(records, server_url):
+    """
+    Sends bulk records in a single streamed, compressed NDJSON request.
+    Returns True when the server processed them, the Retry-After delay when it is busy, or False.
+    Records the server rejects as invalid are reported and not retried.
+    """
+    try:
+        response = get_session().post(
+            api_url(server_url, "/api/assets/bulk"),
+            data=encode_ndjson(records),
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/x-ndjson"},
+            timeout=UPLOAD_TIMEOUT
+        )
+        if response.status_code != 200:
+            print(f"Bulk upload failed. Server responded with status code {response.status_code}.")
+            return retry_after(response)
+        summary = response.json()
+        print(f"Bulk upload: {summary.get('accepted', 0)} accepted, {summary.get('rejected', 0)} rejected.")
+        for error in summary.get("errors", []):
+            print(f"  line {error['line']}: {error['error']}")
+        return True
     except Exception as e:
-        print(f"Error sending JSON to server: {e}")
+        print(f"Error sending bulk upload: {e}")
+        return False
+
+
+def upload_directory(directory, server_url):
+    """
+    Uploads every saved report of a directory in a single bulk request.
+    """
+    return post_bulk(iter_saved_reports(directory), server_url) is True
+
+
+def send_or_spool(data, server_url, payload=None, encoding=None):
+    """
+    Sends the report, or appends it to the offline spool when the server cannot take it.
+    When the server is reachable, reports spooled by earlier runs are sent as well.
+    """
+    spool = Spool(SPOOL_DIR)
+    result = send_snapshot(data, server_url, payload, encoding)
+    if result is not True:
+        spool.append({"collected_at": datetime.datetime.now().isoformat(timespec="seconds"), "report": data})
+        delay = spool.record_failure(result if result is not False else None)
+        print(f"Report spooled, next attempt in {delay:.0f}s")
+        return False
+    spool.record_success()
+    sent = spool.drain(lambda records: post_bulk(records, server_url))
+    if sent:
+        print(f"Sent {sent} spooled report(s)")
+    return True
 
 
 def get_programming_languages():
@@ -147,7 +618,7 @@ def get_programming_languages():
 
     # Check Python version
     try:
-        result = subprocess.run(["python", "--version"], capture_output=True, text=True, shell=True)
+        result = run_command(["python", "--version"], capture_output=True, text=True)
         if result.returncode == 0:
             languages.append({"Name": "Python", "Version": result.stdout.strip(), "Vendor": "N/A"})
     except Exception as e:
@@ -155,7 +626,7 @@ def get_programming_languages():
 
     # Check Java version
     try:
-        result = subprocess.run(["java", "-version"], capture_output=True, text=True, shell=True)
+        result = run_command(["java", "-version"], capture_output=True, text=True)
         if result.returncode == 0:
             version_line = result.stderr.splitlines()[0]  # Java version is printed to stderr
             languages.append({"Name": "Java", "Version": version_line.strip(), "Vendor": "N/A"})
@@ -164,7 +635,7 @@ def get_programming_languages():
 
     # Check Node.js version
     try:
-        result = subprocess.run(["node", "--version"], capture_output=True, text=True, shell=True)
+        result = run_command(["node", "--version"], capture_output=True, text=True)
         if result.returncode == 0:
             languages.append({"Name": "Node.js", "Version": result.stdout.strip(), "Vendor": "N/A"})
     except Exception as e:
@@ -181,7 +652,7 @@ def get_development_tools():
 
     # Check for Visual Studio Code
     try:
-        result = subprocess.run(["code", "--version"], capture_output=True, text=True, shell=True)
+        result = run_command(["code", "--version"], capture_output=True, text=True)
         if result.returncode == 0:
             tools.append({"Name": "Visual Studio Code", "Version": result.stdout.splitlines()[0], "Vendor": "Microsoft"})
     except Exception as e:
@@ -189,7 +660,7 @@ def get_development_tools():
 
     # Check for Docker
     try:
-        result = subprocess.run(["docker", "--version"], capture_output=True, text=True, shell=True)
+        result = run_command(["docker", "--version"], capture_output=True, text=True)
         if result.returncode == 0:
             tools.append({"Name": "Docker", "Version": result.stdout.strip(), "Vendor": "N/A"})
     except Exception as e:
@@ -216,9 +687,9 @@ def get_network_configuration():
     """
     network_info = {}
     try:
-        result = subprocess.run(["ipconfig"], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            network_info["IPConfig"] = result.stdout.strip()
+        adapters, returncode = stream_command(["ipconfig", "/all"], parse_ipconfig)
+        if returncode == 0:
+            network_info["Adapters"] = adapters
     except Exception as e:
         print(f"Error collecting network configuration: {e}")
     return network_info
@@ -234,7 +705,7 @@ def get_hardware_info():
         hardware_info["CPU"] = platform.processor()
 
         # RAM Information
-        result = subprocess.run(["wmic", "memorychip", "get", "Capacity"], capture_output=True, text=True, shell=True)
+        result = run_command(["wmic", "memorychip", "get", "Capacity"], capture_output=True, text=True)
         if result.returncode == 0:
             ram_sizes = [int(x.strip()) for x in result.stdout.splitlines() if x.strip().isdigit()]
             hardware_info["RAM"] = f"{sum(ram_sizes) / (1024 ** 3):.2f} GB"
@@ -257,7 +728,7 @@ def get_user_accounts():
     """
     users = []
     try:
-        result = subprocess.run(["net", "user"], capture_output=True, text=True, shell=True)
+        result = run_command(["net", "user"], capture_output=True, text=True)
         if result.returncode == 0:
             lines = result.stdout.splitlines()
             for line in lines[4:-2]:  # Skip header and footer
@@ -267,20 +738,41 @@ def get_user_accounts():
     return users
 
 
-def get_security_software():
+def security_software_timeout():
     """
-    Detects installed security software (e.g., antivirus, firewall).
+    Returns the timeout of the security software collector: the budget of the installed software scan
+    while the registry cache is cold, since the collector then waits for that scan.
     """
-    security_software = []
+    timeout = 300 if USE_WMIC else 60
     try:
-        result = subprocess.run(["wmic", "product", "get", "Name"], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            for line in result.stdout.splitlines():
-                if "antivirus" in line.lower() or "security" in line.lower() or "firewall" in line.lower():
-                    security_software.append(line.strip())
+        if get_software_scanner().is_cold():
+            return max(timeout, SOFTWARE_SCAN_TIMEOUT)
+    except Exception:
+        pass
+    return timeout
+
+
+def get_security_software(use_wmic=None):
+    """
+    Detects installed security software (e.g., antivirus, firewall) by name, among the software found
+    by the registry scan (cached, see get_installed_software), and also through WMIC when USE_WMIC is enabled.
+    """
+    if use_wmic is None:
+        use_wmic = USE_WMIC
+    names = []
+    try:
+        names.extend(software["Name"] for software in get_software_scanner().scan())
     except Exception as e:
-        print(f"Error detecting security software: {e}")
-    return security_software
+        print(f"Error accessing registry: {e}")
+    if use_wmic:
+        try:
+            result = run_command(["wmic", "product", "get", "Name"], capture_output=True, text=True)
+            if result.returncode == 0:
+                names.extend(line.strip() for line in result.stdout.splitlines())
+        except Exception as e:
+            print(f"Error detecting security software: {e}")
+    security_software = [name for name in names if any(word in name.lower() for word in SECURITY_KEYWORDS)]
+    return list(dict.fromkeys(security_software))
 
 
 def get_running_processes():
@@ -289,11 +781,9 @@ def get_running_processes():
     """
     processes = []
     try:
-        result = subprocess.run(["tasklist"], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            lines = result.stdout.splitlines()
-            for line in lines[3:]:  # Skip header rows
-                processes.append(line.split()[0])  # Process name is the first column
+        records, returncode = stream_command(["tasklist"], parse_tasklist)
+        if returncode == 0:
+            processes = records
     except Exception as e:
         print(f"Error collecting running processes: {e}")
     return processes
@@ -305,9 +795,9 @@ def get_network_connections():
     """
     connections = []
     try:
-        result = subprocess.run(["netstat", "-an"], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            connections = result.stdout.splitlines()
+        records, returncode = stream_command(["netstat", "-an"], parse_netstat)
+        if returncode == 0:
+            connections = records
     except Exception as e:
         print(f"Error collecting network connections: {e}")
     return connections
@@ -319,9 +809,9 @@ def get_update_status():
     """
     updates = []
     try:
-        result = subprocess.run(["wmic", "qfe", "list", "brief"], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            updates = result.stdout.splitlines()
+        records, returncode = stream_command(["wmic", "qfe", "list", "brief"], parse_wmic_qfe)
+        if returncode == 0:
+            updates = records
     except Exception as e:
         print(f"Error collecting update status: {e}")
     return updates
@@ -333,7 +823,7 @@ def get_disk_encryption_status():
     """
     encryption_status = {}
     try:
-        result = subprocess.run(["manage-bde", "-status"], capture_output=True, text=True, shell=True)
+        result = run_command(["manage-bde", "-status"], capture_output=True, text=True)
         if result.returncode == 0:
             encryption_status = result.stdout.strip()
     except Exception as e:
@@ -341,70 +831,306 @@ def get_disk_encryption_status():
     return encryption_status
 
 
-if __name__ == "__main__":
-    # Configuration
-    system_info = get_system_info()
-    programming_languages = get_programming_languages()
-    development_tools = get_development_tools()
-    environment_variables = get_environment_variables()
-
-    print("\nCollecting network configuration...")
-    network_configuration = get_network_configuration()
-
-    print("\nCollecting hardware information...")
-    hardware_info = get_hardware_info()
-
-    print("\nCollecting user accounts...")
-    user_accounts = get_user_accounts()
-
-    print("\nCollecting security software...")
-    security_software = get_security_software()
-
-    print("\nCollecting running processes...")
-    running_processes = get_running_processes()
-
-    print("\nCollecting network connections...")
-    network_connections = get_network_connections()
-
-    print("\nCollecting update status...")
-    update_status = get_update_status()
-
-    print("\nCollecting disk encryption status...")
-    disk_encryption_status = get_disk_encryption_status()
-
-    print("\nCollecting installed software...")
-    software_list = get_installed_software()
-
-    # Combine all collected data with software_list as the last key
-    collected_data = {
-        "system_info": system_info,
-        "programming_languages": programming_languages,
-        "development_tools": development_tools,
-        "environment_variables": environment_variables,
-        "network_configuration": network_configuration,
-        "hardware_info": hardware_info,
-        "user_accounts": user_accounts,
-        "security_software": security_software,
-        "running_processes": running_processes,
-        "network_connections": network_connections,
-        "update_status": update_status,
-        "disk_encryption_status": disk_encryption_status,
-        "software_list": software_list  # Place software_list as the last key
+COLLECTORS = [
+    # Each collector fills one section of collected_data; the order here is the order of the report.
+    # name selects the collector on the command line (--only/--skip, the key works too).
+    # interval is how long a resident agent reuses the result; changed, if set, triggers an early refresh.
+    {"key": "system_info", "name": "system", "label": "system information", "func": get_system_info, "timeout": 30, "default": dict, "interval": DAY},
+    {"key": "programming_languages", "name": "languages", "label": "programming languages", "func": get_programming_languages, "timeout": 60, "default": list, "interval": 6 * HOUR},
+    {"key": "development_tools", "name": "devtools", "label": "development tools", "func": get_development_tools, "timeout": 60, "default": list, "interval": 6 * HOUR},
+    {"key": "environment_variables", "name": "environment", "label": "environment variables", "func": get_environment_variables, "timeout": 30, "default": dict, "interval": HOUR},
+    {"key": "network_configuration", "name": "network", "label": "network configuration", "func": get_network_configuration, "timeout": 60, "default": dict, "interval": 30 * 60},
+    {"key": "hardware_info", "name": "hardware", "label": "hardware information", "func": get_hardware_info, "timeout": 120, "default": dict, "interval": DAY},
+    {"key": "user_accounts", "name": "users", "label": "user accounts", "func": get_user_accounts, "timeout": 60, "default": list, "interval": HOUR},
+    {"key": "security_software", "name": "security", "label": "security software", "func": get_security_software, "timeout": security_software_timeout, "default": list, "interval": 6 * HOUR},
+    {"key": "running_processes", "name": "processes", "label": "running processes", "func": get_running_processes, "timeout": 60, "default": list, "interval": 5 * 60},
+    {"key": "network_connections", "name": "connections", "label": "network connections", "func": get_network_connections, "timeout": 60, "default": list, "interval": 5 * 60},
+    {"key": "update_status", "name": "updates", "label": "update status", "func": get_update_status, "timeout": 180, "default": list, "interval": 6 * HOUR},
+    {"key": "disk_encryption_status", "name": "encryption", "label": "disk encryption status", "func": get_disk_encryption_status, "timeout": 60, "default": dict, "interval": 6 * HOUR},
+    {"key": "software_list", "name": "software", "label": "installed software", "func": get_installed_software, "timeout": SOFTWARE_SCAN_TIMEOUT, "default": list, "interval": 6 * HOUR, "changed": software_changed},
+]
+
+
+def select_collectors(only=None, skip=None):
+    """
+    Returns the collectors selected by comma-separated names or keys: those in only (all by default),
+    minus those in skip. system_info is always kept, since it identifies the host.
+    Raises ValueError on an unknown name.
+    """
+    by_name = {}
+    for entry in COLLECTORS:
+        by_name[entry["name"]] = by_name[entry["key"]] = entry
+
+    def parse(names):
+        selected = set()
+        for name in (names or "").split(","):
+            name = name.strip().lower()
+            if not name:
+                continue
+            if name not in by_name:
+                raise ValueError(f"Unknown collector: {name} (choose from {', '.join(e['name'] for e in COLLECTORS)})")
+            selected.add(by_name[name]["key"])
+        return selected
+
+    keys = parse(only) or {entry["key"] for entry in COLLECTORS}
+    keys -= parse(skip)
+    keys.add("system_info")
+    return [entry for entry in COLLECTORS if entry["key"] in keys]
+
+
+def collector_timeout(entry):
+    """
+    Returns the timeout of a collector: its "timeout", which may be a function called when it starts.
+    """
+    timeout = entry.get("timeout", COLLECTOR_TIMEOUT)
+    return timeout() if callable(timeout) else timeout
+
+
+def _run_collector(entry, started):
+    """
+    Runs a single collector in a worker thread, with its own deadline.
+    Returns the collected value, its status, the elapsed time and its telemetry counters.
+    """
+    print(f"\nCollecting {entry['label']}...")
+    begin = time.monotonic()
+    deadline = begin + collector_timeout(entry)
+    started[entry["key"]] = (begin, deadline)
+    _collector_context.deadline = deadline
+    _collector_context.timed_out = False
+    _collector_context.subprocesses = 0
+    _collector_context.output_bytes = 0
+    _collector_context.errors = 0
+    try:
+        value = entry["func"]()
+        status = "timeout" if _collector_context.timed_out else "ok"
+    except Exception as e:
+        print(f"Error in collector {entry['key']}: {e}")
+        value = entry["default"]()
+        status = "timeout" if _collector_context.timed_out else "error"
+        _collector_context.errors += 1
+    finally:
+        _collector_context.deadline = None
+    telemetry = {
+        "subprocesses": _collector_context.subprocesses,
+        "output_bytes": _collector_context.output_bytes,
+        "errors": _collector_context.errors
     }
+    return value, status, time.monotonic() - begin, telemetry
+
+
+def run_collectors(collectors=None, max_workers=COLLECTOR_WORKERS):
+    """
+    Runs the collectors concurrently, each with its own timeout.
+    Returns the collected data (in registry order) and the status of each collector, with its
+    telemetry (subprocesses started, bytes of command output read, errors).
+    A collector that does not finish within its timeout plus a grace period is abandoned
+    and its section is filled with an empty default. The collectors run on daemon threads,
+    so an abandoned one never keeps the agent from exiting.
+    """
+    if collectors is None:
+        collectors = COLLECTORS
+    started = {}
+    results = {}
+    collector_status = {}
+
+    waiting = queue.Queue()
+    for entry in collectors:
+        waiting.put(entry)
+    finished = queue.Queue()
+
+    def work():
+        while True:
+            try:
+                entry = waiting.get_nowait()
+            except queue.Empty:
+                return
+            finished.put((entry, _run_collector(entry, started)))
+
+    for i in range(min(max_workers, len(collectors))):
+        threading.Thread(target=work, name=f"collector_{i}", daemon=True).start()
+
+    pending = {entry["key"] for entry in collectors}
+    try:
+        while pending:
+            try:
+                entry, (value, status, elapsed, telemetry) = finished.get(timeout=0.5)
+                if entry["key"] in pending:
+                    pending.discard(entry["key"])
+                    results[entry["key"]] = value
+                    collector_status[entry["key"]] = dict({"status": status, "duration": round(elapsed, 3)},
+                                                          **telemetry)
+            except queue.Empty:
+                pass
+
+            # Abandon collectors that are stuck past their deadline
+            now = time.monotonic()
+            for entry in collectors:
+                if entry["key"] not in pending or entry["key"] not in started:
+                    continue
+                begin, deadline = started[entry["key"]]
+                if now < deadline + COLLECTOR_GRACE:
+                    continue
+                print(f"Collector {entry['key']} timed out after {now - begin:.1f}s")
+                pending.discard(entry["key"])
+                results[entry["key"]] = entry["default"]()
+                collector_status[entry["key"]] = {"status": "timeout", "duration": round(now - begin, 3),
+                                                  "subprocesses": 0, "output_bytes": 0, "errors": 1}
+    finally:
+        # Collectors not started yet are dropped (on Ctrl+C); the running ones end with the process
+        while True:
+            try:
+                waiting.get_nowait()
+            except queue.Empty:
+                break
+
+    collected_data = {entry["key"]: results[entry["key"]] for entry in collectors}
+    return collected_data, collector_status
+
+
+def build_report(results, collector_status):
+    """
+    Combines the collected sections and the collectors' status and telemetry, keeping software_list as the last key.
+    """
+    collected_data = {entry["key"]: results[entry["key"]] for entry in COLLECTORS if entry["key"] in results}
+    software_list = collected_data.pop("software_list", [])
+    collected_data["telemetry"] = {"collectors": collector_status}
+    collected_data["software_list"] = software_list
+    return collected_data
+
 
-    # Save to a JSON file
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    json_output_file = f"all_collected_data_{timestamp}.json"
-    save_to_json(collected_data, None, json_output_file)
+def run_daemon(server_url, report_interval=REPORT_INTERVAL):
+    """
+    Resident agent: runs each collector on its own interval, reuses cached results between cycles,
+    and sends a report assembled from the cache at the check-in time assigned by the server
+    (every report_interval seconds plus jitter when the server gives none).
+    """
+    cache = {}          # collector key -> {"value", "status", "expires"}
+    change_state = {}   # collector key -> state kept by its "changed" check
+    next_report = time.monotonic() + checkin_delay()[0]
+    print(f"Agent running, reporting every {report_interval}s")
+    while True:
+        now = time.monotonic()
+        due = []
+        for entry in COLLECTORS:
+            cached = cache.get(entry["key"])
+            changed = entry.get("changed")
+            state = change_state.setdefault(entry["key"], {})
+            if cached is None or now >= cached["expires"] or (changed and changed(state)):
+                due.append(entry)
+        if due:
+            results, collector_status = run_collectors(due)
+            for entry in due:
+                status = collector_status[entry["key"]]
+                retry = status["status"] != "ok" and entry["interval"] > COLLECTOR_RETRY_INTERVAL
+                cache[entry["key"]] = {
+                    "value": results[entry["key"]],
+                    "status": dict(status, collected_at=datetime.datetime.now().isoformat(timespec="seconds")),
+                    "expires": time.monotonic() + (COLLECTOR_RETRY_INTERVAL if retry else entry["interval"])
+                }
+
+        if time.monotonic() >= next_report:
+            report = build_report({key: cached["value"] for key, cached in cache.items()},
+                                  {key: cached["status"] for key, cached in cache.items()})
+            send_or_spool(report, server_url)
+            # Cached results are reported again, but their telemetry must only be counted once
+            for cached in cache.values():
+                cached["status"]["cached"] = True
+            delay, scheduled = checkin_delay()
+            next_report = time.monotonic() + (delay if scheduled else report_interval + delay)
+        else:
+            Spool(SPOOL_DIR).drain(lambda records: post_bulk(records, server_url))
 
-    # Print payload before sending
-    # print("Payload being sent to the server:")
-    # print(json.dumps(collected_data, indent=4))
+        time.sleep(DAEMON_TICK)
 
-    # Send the JSON file to the central server
-    SERVER_URL = "http://192.168.25.89:5000/api/asset"  # Replace with your server's URL
-    print("\nSending JSON file to the server...")
-    # send_json_to_server(json_output_file, SERVER_URL)
+
+def write_output(collected_data, output, payload=None, encoding=None):
+    """
+    Writes the report to stdout as JSON ("-"), or saves the encoded payload to a file
+    (all_collected_data_<timestamp> by default, compressed according to the file extension otherwise).
+    Returns the payload and its encoding, to be reused for the upload.
+    """
+    if output == "-":
+        json.dump(collected_data, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+        return payload, encoding
+    if output:
+        payload, encoding = encode_payload(collected_data, encoding_for_file(output))
+    else:
+        payload, encoding = encode_payload(collected_data)
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = f"all_collected_data_{timestamp}{FILE_EXTENSIONS[encoding]}"
+    save_payload(payload, output)
+    return payload, encoding
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collect the inventory of this machine and send it to the server.")
+    parser.add_argument("--server-url", default=SERVER_URL, help="URL of the server's /api/asset endpoint")
+    parser.add_argument("--upload-dir", metavar="DIR",
+                        help="Upload the all_collected_data_* files of DIR in bulk instead of collecting")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running, refresh each collector on its own interval and report periodically")
+    parser.add_argument("--report-interval", type=int, default=REPORT_INTERVAL,
+                        help="Seconds between two reports in daemon mode, when the server assigns no check-in")
+    parser.add_argument("--now", action="store_true", help="Report immediately, ignoring the check-in schedule")
+    parser.add_argument("--only", metavar="NAMES",
+                        help="Run only these collectors, e.g. software,hardware (implies --no-upload)")
+    parser.add_argument("--skip", metavar="NAMES", help="Do not run these collectors (implies --no-upload)")
+    parser.add_argument("--no-upload", action="store_true", help="Collect and save the report without sending it")
+    parser.add_argument("--output", metavar="FILE",
+                        help="Where to save the report: a file (.json, .json.gz or .json.zst) or - for stdout")
+    args = parser.parse_args(argv)
+    try:
+        args.collectors = select_collectors(args.only, args.skip)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.daemon and (args.only or args.skip or args.no_upload or args.output):
+        parser.error("--daemon always runs every collector and reports to the server")
+    # A partial report would replace the host's full inventory on the server
+    args.upload = not (args.no_upload or args.only or args.skip)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.upload_dir:
+        return 0 if upload_directory(args.upload_dir, args.server_url) else 1
+    if args.daemon:
+        run_daemon(args.server_url, args.report_interval)
+
+    # With the report on stdout, progress messages (including the upload's) go to stderr
+    progress = sys.stderr if args.output == "-" else sys.stdout
+    with contextlib.redirect_stdout(progress):
+        # Report at the time assigned by the server, so that agents started together do not all report at once
+        if args.upload and not args.now:
+            delay, scheduled = checkin_delay()
+            if scheduled and delay > MAX_CHECKIN_WAIT:
+                print(f"Next check-in in {delay / 60:.0f} min, nothing to do.")
+                return 0
+            print(f"Waiting {delay:.0f}s before reporting...")
+            time.sleep(delay)
+
+        # Run the selected collectors in parallel, and record timing and timeout status
+        startup = time.perf_counter() - _STARTED
+        results, collector_status = run_collectors(args.collectors)
+        collected_data = build_report(results, collector_status)
+        collected_data["telemetry"]["startup"] = round(startup, 3)
+        print(f"Started in {startup * 1000:.0f} ms, collected in {time.perf_counter() - _STARTED - startup:.1f}s")
+
+    # Serialize once; the same compressed bytes are saved locally and sent to the server
+    payload, encoding = write_output(collected_data, args.output)
+    if not args.upload:
+        return 0
+
+    # Send the data to the central server, or keep it in the spool until the server is reachable
+    with contextlib.redirect_stdout(progress):
+        print("\nSending data to the server...")
+        send_or_spool(collected_data, args.server_url, payload, encoding)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
 
 # Example payload
 # SERVER_URL = "http://192.168.25.89:5000/api/asset"
@@ -424,14 +1150,14 @@ if __name__ == "__main__":
 #     ]
 # }
 
-# Send the example payload
-response = requests.post(SERVER_URL, json=collected_data)
-print(f"Response from server: {response.status_code}, {response.text}")
-
 # python -m PyInstaller --onefile --name "AssetAgent" main.py
 # run the command above to create a standalone executable for the script
 # The executable will be created in the "dist" folder.
 # You can run the executable on any Windows machine to collect system information and installed software.
 # Make sure to have the required permissions to access the registry and run WMIC commands.
 # The server should be running and accessible at the specified SERVER_URL.
-# The JSON file will be saved locally and sent to the server for further processing.
\ No newline at end of file
+# The JSON file will be saved locally and sent to the server for further processing.
+# Run "AssetAgent --daemon" to keep the agent resident and refresh each collector on its own interval.
+# The server assigns each agent a check-in time; schedule the task more often than MAX_CHECKIN_WAIT
+# (e.g. hourly): runs before the check-in exit at once, and "AssetAgent --now" reports immediately.
+# Quick checks: "AssetAgent --only software --output -" prints the installed software without uploading anything.
@@ -0,0 +1,183 @@
+import threading
+
+# Minimal Prometheus text-format metrics (counters, gauges and histograms with labels).
+# Several processes serving the same metrics each dump their values (Registry.dump); a process renders
+# its own values summed with the dumps of the others (Registry.render).
+
+# Default histogram buckets, in seconds
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Buckets for sizes, in bytes
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+    # Whether the values of several processes are summed (see Registry.render)
+    aggregate = True
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+    def copy_value(self, value):
+        return value
+
+    def add_value(self, total, value):
+        return total + value
+
+    def current_values(self):
+        with self.lock:
+            return {key: self.copy_value(value) for key, value in self.values.items()}
+
+    def dump(self):
+        """
+        Returns the values as JSON-serializable [label values, value] pairs.
+        """
+        return [[list(key), value] for key, value in self.current_values().items()]
+
+    def merged_values(self, dumps):
+        """
+        Returns the values of this process summed with the dumped values of other processes.
+        """
+        values = self.current_values()
+        for dumped in dumps if self.aggregate else ():
+            for key, value in dumped:
+                key = tuple(key)
+                values[key] = self.add_value(values[key], value) if key in values else self.copy_value(value)
+        return values
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self, dumps=()):
+        values = self.merged_values(dumps)
+        return self.header() + [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+                                for key, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """
+    Gauge set explicitly, or computed at scrape time by a callback.
+    With aggregate=False, the gauge already holds the value of every process and is not summed.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None, aggregate=True):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+        self.aggregate = aggregate
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def current_values(self):
+        if self.callback is not None:
+            self.set(self.callback())
+        return super().current_values()
+
+    def render(self, dumps=()):
+        values = self.merged_values(dumps)
+        return self.header() + [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+                                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=TIME_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def copy_value(self, value):
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+
+    def add_value(self, total, value):
+        if len(value["counts"]) != len(total["counts"]):
+            return total  # Dumped by a process with other buckets
+        return {"counts": [a + b for a, b in zip(total["counts"], value["counts"])],
+                "sum": total["sum"] + value["sum"], "count": total["count"] + value["count"]}
+
+    def render(self, dumps=()):
+        values = self.merged_values(dumps)
+        lines = self.header()
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', '+Inf')])} {entry['count']}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(entry['sum'])}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {entry['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), callback=None, aggregate=True):
+        return self.register(Gauge(name, help_text, labels, callback, aggregate))
+
+    def histogram(self, name, help_text, labels=(), buckets=TIME_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def dump(self):
+        """
+        Returns the values of every metric, JSON-serializable, for the other processes to render.
+        """
+        return {metric.name: {"kind": metric.kind, "values": metric.dump()} for metric in self.metrics}
+
+    def render(self, dumps=()):
+        """
+        Returns all metrics in the Prometheus text exposition format,
+        summed with the dumps of other processes (see dump).
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render([dump[metric.name]["values"] for dump in dumps if metric.name in dump]))
+        return "\n".join(lines) + "\n"
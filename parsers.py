@@ -0,0 +1,155 @@
+import re
+
+# Parsers turning the text output of Windows commands into compact records.
+# Each parser takes an iterable of lines (e.g. a pipe) and yields records as it goes,
+# so the raw output never has to be held in memory.
+
+
+def parse_int(text):
+    """
+    Parses an integer written with thousands separators ("12,345 K"), or returns None.
+    """
+    digits = re.sub(r"[^0-9]", "", text or "")
+    return int(digits) if digits else None
+
+
+def column_spans(separator_line):
+    """
+    Returns the (start, end) character spans of the columns of a "==== ====" separator line.
+    """
+    return [match.span() for match in re.finditer(r"=+", separator_line)]
+
+
+def split_columns(line, spans):
+    """
+    Cuts a fixed-width line into columns; the last column runs to the end of the line.
+    """
+    columns = []
+    for i, (start, end) in enumerate(spans):
+        end = spans[i + 1][0] if i + 1 < len(spans) else len(line)
+        columns.append(line[start:end].strip())
+    return columns
+
+
+def parse_tasklist(lines):
+    """
+    Parses the output of "tasklist" into {"Name", "PID", "Session", "Memory KB"} records.
+    """
+    spans = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if spans is None:
+            if line.startswith("="):
+                spans = column_spans(line)
+            continue
+        if not line.strip():
+            continue
+        columns = split_columns(line, spans)
+        if len(columns) < 5:
+            continue
+        yield {
+            "Name": columns[0],
+            "PID": parse_int(columns[1]),
+            "Session": columns[2],
+            "Memory KB": parse_int(columns[4])
+        }
+
+
+def parse_netstat(lines):
+    """
+    Parses the output of "netstat -an" into {"Proto", "Local", "Remote", "State"} records.
+    UDP sockets have no state.
+    """
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 3 or fields[0] not in ("TCP", "UDP"):
+            continue
+        record = {"Proto": fields[0], "Local": fields[1], "Remote": fields[2]}
+        if len(fields) > 3:
+            record["State"] = fields[3]
+        yield record
+
+
+def parse_wmic_qfe(lines):
+    """
+    Parses the output of "wmic qfe list brief" into {"HotFixID", "Description", "InstalledOn", "InstalledBy"} records.
+    Columns are located from the header line, since wmic pads values to the header width.
+    """
+    starts = None
+    names = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if starts is None:
+            matches = list(re.finditer(r"\S+", line))
+            starts = [match.start() for match in matches]
+            names = [match.group() for match in matches]
+            continue
+        values = {}
+        for i, name in enumerate(names):
+            end = starts[i + 1] if i + 1 < len(starts) else len(line)
+            values[name] = line[starts[i]:end].strip()
+        if not values.get("HotFixID"):
+            continue
+        yield {
+            "HotFixID": values["HotFixID"],
+            "Description": values.get("Description", ""),
+            "InstalledOn": values.get("InstalledOn", ""),
+            "InstalledBy": values.get("InstalledBy", "")
+        }
+
+
+# ipconfig /all properties kept for each adapter, and whether they can have several values
+IPCONFIG_FIELDS = {
+    "Description": False,
+    "Physical Address": False,
+    "DHCP Enabled": False,
+    "IPv4 Address": True,
+    "IPv6 Address": True,
+    "Link-local IPv6 Address": True,
+    "Subnet Mask": True,
+    "Default Gateway": True,
+    "DNS Servers": True,
+    "Media State": False
+}
+
+
+def parse_ipconfig(lines):
+    """
+    Parses the output of "ipconfig /all" into one record per adapter, with its addresses and DNS servers.
+    """
+    adapter = None
+    field = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if not line[0].isspace():
+            # "Ethernet adapter Ethernet:" starts a new adapter; "Windows IP Configuration" is the host section
+            if adapter is not None:
+                yield adapter
+            adapter = {"Adapter": line.strip().rstrip(":")} if line.rstrip().endswith(":") else None
+            field = None
+            continue
+        if adapter is None:
+            continue
+        if " : " in line or line.rstrip().endswith(":"):
+            key, _, value = line.partition(":")
+            key = key.strip(" .")
+            field = key if key in IPCONFIG_FIELDS else None
+        elif field is not None and IPCONFIG_FIELDS[field]:
+            value = line  # Continuation line: another value of the previous property
+        else:
+            continue
+        if field is None:
+            continue
+        value = re.sub(r"\((Preferred|Deprecated|Tentative|Duplicate)\)$", "", value.strip())
+        if not value:
+            continue
+        if IPCONFIG_FIELDS[field]:
+            adapter.setdefault(field, []).append(value)
+        else:
+            adapter[field] = value
+    if adapter is not None:
+        yield adapter
@@ -0,0 +1,147 @@
+import io
+import os
+import random
+import subprocess
+
+from software import HIVES, UNINSTALL_PATHS, FakeRegistry
+
+# Directory of recorded command outputs, one <command>.txt file per command (see fixture_name)
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture_name(args):
+    """
+    Returns the fixture file name of a command: "netstat -an" -> "netstat_an.txt".
+    """
+    return "_".join(arg.lstrip("-/").replace(",", "_") for arg in args) + ".txt"
+
+
+class ReplayRunner:
+    """
+    Command runner replaying recorded or synthetic outputs instead of running the commands.
+    outputs maps fixture names to output text; commands without an output fail with return code 1.
+    """
+
+    def __init__(self, outputs=None, fixtures_dir=FIXTURES_DIR):
+        self.outputs = dict(outputs or {})
+        self.fixtures_dir = fixtures_dir
+        self.calls = []
+
+    def output(self, args):
+        self.calls.append(list(args))
+        name = fixture_name(args)
+        if name not in self.outputs and self.fixtures_dir:
+            path = os.path.join(self.fixtures_dir, name)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8", newline="") as file:
+                    self.outputs[name] = file.read()
+        return self.outputs.get(name)
+
+    def run(self, args, **kwargs):
+        """
+        Same interface as subprocess.run(args, capture_output=True, ...).
+        """
+        output = self.output(args)
+        returncode = 0 if output is not None else 1
+        output = output or ""
+        if not kwargs.get("text"):
+            output = output.encode("cp850", errors="replace")
+            return subprocess.CompletedProcess(args, returncode, output, b"")
+        return subprocess.CompletedProcess(args, returncode, output, "")
+
+    def stream(self, args):
+        """
+        Returns the output as a stream of lines, and the return code.
+        """
+        output = self.output(args)
+        return io.StringIO(output or ""), 0 if output is not None else 1
+
+
+# Synthetic outputs, to measure the collectors on hosts much bigger than the recorded ones
+
+def synthetic_tasklist(count, seed=0):
+    rng = random.Random(seed)
+    lines = ["", "Image Name                     PID Session Name        Session#    Mem Usage",
+             "========================= ======== ================ =========== ============"]
+    for pid in range(count):
+        name = f"process{rng.randrange(500)}.exe"
+        lines.append(f"{name:<25} {pid * 4:>8} {'Console':<16} {1:>11} {rng.randrange(1, 900000):>10,} K")
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_netstat(count, seed=0):
+    rng = random.Random(seed)
+    states = ["ESTABLISHED", "TIME_WAIT", "CLOSE_WAIT", "LISTENING"]
+    lines = ["", "Active Connections", "", "  Proto  Local Address          Foreign Address        State"]
+    for i in range(count):
+        local = f"10.0.{rng.randrange(256)}.{rng.randrange(256)}:{1024 + i % 60000}"
+        if i % 10 == 0:
+            lines.append(f"  UDP    {local:<22} *:*")
+        else:
+            remote = f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}:443"
+            lines.append(f"  TCP    {local:<22} {remote:<22} {rng.choice(states)}")
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_ipconfig(adapters):
+    lines = ["", "Windows IP Configuration", "", "   Host Name . . . . . . . . . . . . : SYNTHETIC-PC", ""]
+    for i in range(adapters):
+        lines += [
+            f"Ethernet adapter Ethernet {i}:", "",
+            f"   Description . . . . . . . . . . . : Synthetic Adapter #{i}",
+            f"   Physical Address. . . . . . . . . : 00-0A-CD-{i // 256 % 256:02X}-{i % 256:02X}-0C",
+            "   DHCP Enabled. . . . . . . . . . . : Yes",
+            f"   IPv4 Address. . . . . . . . . . . : 10.{i // 256 % 256}.{i % 256}.10(Preferred)",
+            "   Subnet Mask . . . . . . . . . . . : 255.255.255.0",
+            f"   Default Gateway . . . . . . . . . : 10.{i // 256 % 256}.{i % 256}.1",
+            "   DNS Servers . . . . . . . . . . . : 10.0.0.2",
+            "                                       10.0.0.3",
+            ""
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_qfe(count):
+    header = "Description      FixComments  HotFixID   InstallDate  InstalledBy          InstalledOn  Name  ServicePackInEffect  Status  "
+    lines = [header, ""]
+    for i in range(count):
+        lines.append(f"{'Security Update':<30}{f'KB{5000000 + i}':<24}{'NT AUTHORITY' + chr(92) + 'SYSTEM':<21}"
+                     f"{f'{i % 12 + 1}/15/2023':<13}")
+    return "\r\r\n".join(lines) + "\r\r\n"
+
+
+def synthetic_net_user(count):
+    names = [f"user{i}" for i in range(count)]
+    rows = ["".join(f"{name:<25}" for name in names[i:i + 3]).rstrip() for i in range(0, count, 3)]
+    lines = ["", "User accounts for \\\\SYNTHETIC-PC", "", "-" * 79] + rows + ["The command completed successfully.", ""]
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_outputs(processes=20000, connections=50000, adapters=16, updates=500, users=300):
+    """
+    Returns replay outputs for a very large host.
+    """
+    return {
+        "tasklist.txt": synthetic_tasklist(processes),
+        "netstat_an.txt": synthetic_netstat(connections),
+        "ipconfig_all.txt": synthetic_ipconfig(adapters),
+        "wmic_qfe_list_brief.txt": synthetic_qfe(updates),
+        "net_user.txt": synthetic_net_user(users)
+    }
+
+
+def synthetic_registry(count, duplicates=0.3, seed=0):
+    """
+    Returns a FakeRegistry with count Uninstall entries spread over the hives and paths;
+    a share of them are duplicated across keys, as on real machines.
+    """
+    rng = random.Random(seed)
+    registry = FakeRegistry()
+    keys = [(hive, path) for hive in HIVES for path in UNINSTALL_PATHS]
+    for i in range(count):
+        number = rng.randrange(i) if i and rng.random() < duplicates else i
+        values = {"DisplayName": f"Package {number}", "DisplayVersion": f"{number % 7}.{number % 13}.0",
+                  "Publisher": f"Vendor {number % 50}", "InstallLocation": f"C:\\Program Files\\Package {number}"}
+        hive, path = keys[i % len(keys)]
+        registry.set_subkey(hive, path, f"{{{i:08X}-0000-0000-0000-000000000000}}", values, last_write=i)
+    return registry
@@ -0,0 +1,132 @@
+import os
+import random
+import threading
+import time
+
+from coordination import FileLock
+
+# Check-in scheduling: every host gets a fixed slot in a fleet-wide cycle, so that agents
+# started at the same time (same scheduled task) come back spread over the whole cycle.
+
+# Length of the cycle in seconds: each host is asked to report once per cycle
+CHECKIN_INTERVAL = 24 * 3600
+# Width of one slot in seconds
+SLOT_SECONDS = 60
+# Minimum delay before the next check-in, so that a host reporting just before its slot is not called back at once
+MIN_GAP = 10 * 60
+# Ingest load (0 to 1) above which check-ins are pushed back, and the longest extra delay
+LOAD_THRESHOLD = 0.5
+MAX_DEFER = 2 * 3600
+
+# Golden ratio fractional part: successive hosts land as far as possible from the slots already taken
+_GOLDEN = 0.6180339887498949
+
+
+class CheckinScheduler:
+    """
+    Assigns every host a slot of the check-in cycle and computes its next check-in time.
+    Slots are handed out along a low-discrepancy sequence, so hosts are spread evenly over the
+    cycle whatever their number; a host keeps its slot for as long as the server runs.
+    With a registry file, the hosts are numbered in the order they were first seen by any of the
+    processes sharing the file, so every process gives a host the same slot, across restarts too.
+    """
+
+    def __init__(self, interval=CHECKIN_INTERVAL, slot_seconds=SLOT_SECONDS, min_gap=MIN_GAP,
+                 load_threshold=LOAD_THRESHOLD, max_defer=MAX_DEFER, registry_path=None):
+        self.interval = interval
+        self.slot_seconds = slot_seconds
+        self.slots = max(1, int(interval // slot_seconds))
+        self.min_gap = min(min_gap, interval / 2)
+        self.load_threshold = load_threshold
+        self.max_defer = max_defer
+        self.lock = threading.Lock()
+        self.host_slots = {}            # host id -> slot number
+        self.counts = [0] * self.slots  # slot number -> number of hosts
+        # One host id per line, appended under registry_lock; registry_offset is the end of the lines read
+        self.registry_path = registry_path
+        self.registry_lock = FileLock(registry_path + ".lock") if registry_path else None
+        self.registry_offset = 0
+        if registry_path:
+            directory = os.path.dirname(registry_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self.lock:
+                self.read_registry()
+
+    def add(self, host):
+        """
+        Gives a host the next slot of the sequence. The caller holds the lock.
+        """
+        slot = int((len(self.host_slots) * _GOLDEN) % 1 * self.slots)
+        self.host_slots[host] = slot
+        self.counts[slot] += 1
+        return slot
+
+    def read_registry(self):
+        """
+        Adds the hosts registered since the last read, in registry order. The caller holds the lock.
+        """
+        try:
+            with open(self.registry_path, "rb") as file:
+                file.seek(self.registry_offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # A line being written is read on the next call
+        for line in data[:end].splitlines():
+            host = line.decode("utf-8")
+            if host and host not in self.host_slots:
+                self.add(host)
+        self.registry_offset += end
+
+    def assign(self, host):
+        """
+        Returns the slot of a host, giving it the next slot of the sequence on first contact.
+        """
+        with self.lock:
+            slot = self.host_slots.get(host)
+            if slot is not None:
+                return slot
+            if self.registry_path is None:
+                return self.add(host)
+            with self.registry_lock:
+                self.read_registry()
+                if host not in self.host_slots:
+                    with open(self.registry_path, "ab") as file:
+                        file.write(host.encode("utf-8") + b"\n")
+                    self.read_registry()
+            return self.host_slots[host]
+
+    def defer(self, load):
+        """
+        Returns the extra delay for the current ingest load: none below the threshold,
+        growing linearly up to max_defer when the ingest queue is full.
+        """
+        if load <= self.load_threshold or self.load_threshold >= 1:
+            return 0.0
+        return min(1.0, (load - self.load_threshold) / (1 - self.load_threshold)) * self.max_defer
+
+    def next_checkin(self, host, now=None, load=0.0):
+        """
+        Returns the time (seconds since the epoch) of the next check-in of a host:
+        the first occurrence of its slot at least min_gap from now, plus a random position within
+        the slot and a delay when the server is loaded.
+        """
+        if now is None:
+            now = time.time()
+        offset = self.assign(host) * self.slot_seconds
+        earliest = now + self.min_gap
+        cycle_start = earliest - earliest % self.interval
+        checkin = cycle_start + offset
+        if checkin < earliest:
+            checkin += self.interval
+        return checkin + random.uniform(0, self.slot_seconds) + self.defer(load)
+
+    def stats(self):
+        """
+        Returns the number of hosts and the largest number of hosts sharing a slot.
+        """
+        with self.lock:
+            if self.registry_path is not None:
+                self.read_registry()
+            return {"hosts": len(self.host_slots), "slots": self.slots, "max_per_slot": max(self.counts)}
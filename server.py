@@ -1,37 +1,515 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+import atexit
 import os
 import json
+import queue
+import threading
+import time
 from datetime import datetime
 
+from advisories import AdvisoryFeed, AdvisoryMatcher, feed_mtime
+from aggregates import FleetAggregates
+from coordination import JOURNAL_POLL_INTERVAL, FileLock, IngestJournal, LeaderLock
+from delta import apply_delta, snapshot_hash
+from export import EXPORT_FORMATS, TABLES, stream_table
+from fleet_index import DEFAULT_PAGE_SIZE, FleetIndex, paginate
+from metrics import SIZE_BUCKETS, Registry
+from scheduler import CHECKIN_INTERVAL, CheckinScheduler
+from storage import create_storage, host_id, parse_local_time, shard_of, shard_path, temporary_path
+from transport import SUPPORTED_ENCODINGS, iter_ndjson, open_decoded
+from validation import MAX_DOCUMENT_BYTES, PayloadError, has_notes, read_document, sanitize
+
 app = Flask(__name__)
 
 # Directory to store the JSON files
-DATA_DIR = "data"
+DATA_DIR = os.environ.get("ASSET_SERVER_DATA_DIR", "data")
 os.makedirs(DATA_DIR, exist_ok=True)  # Ensure the directory exists
 
-def save_data_to_json(data):
+# Directory holding the last accepted snapshot of each host, used as the base for delta uploads
+LATEST_DIR = os.path.join(DATA_DIR, "latest")
+os.makedirs(LATEST_DIR, exist_ok=True)
+
+# Storage backend for received reports: "sqlite" (normalized, indexed database), "json" (one file per report)
+# or "history" (compacted segments with retention and time-travel queries)
+STORAGE_BACKEND = os.environ.get("ASSET_SERVER_STORAGE", "sqlite")
+DB_PATH = os.path.join(DATA_DIR, "assets.db")
+storage = create_storage(STORAGE_BACKEND, DATA_DIR, DB_PATH)
+
+# Number of server processes sharing DATA_DIR: set by cluster.py, or by hand for another multi-process runner
+SERVER_PROCESSES = int(os.environ.get("ASSET_SERVER_PROCESSES", "1"))
+if SERVER_PROCESSES > 1 and STORAGE_BACKEND == "history":
+    raise RuntimeError("The history backend is written by a single process, use ASSET_SERVER_PROCESSES=1")
+# Journal through which each process applies the reports accepted by the others to its indexes,
+# and lock electing the process that writes the shared files (aggregates)
+ingest_journal = IngestJournal(os.path.join(DATA_DIR, "journal")) if SERVER_PROCESSES > 1 else None
+leader_lock = LeaderLock(os.path.join(DATA_DIR, "leader.lock"))
+# Seconds between two compactions of the history backend
+HISTORY_COMPACT_INTERVAL = 6 * 3600
+
+# In-memory query indexes over the latest report of every host, rebuilt from storage at startup
+fleet_index = FleetIndex()
+
+# Directory of the files written by the server itself, kept apart from the stored reports
+STATE_DIR = os.path.join(DATA_DIR, "state")
+os.makedirs(STATE_DIR, exist_ok=True)
+
+# Host counts per OS release, encryption state, hardware size, vendor and software version,
+# rebuilt from storage at startup and written to AGGREGATES_FILE when they changed
+AGGREGATES_FILE = os.path.join(STATE_DIR, "aggregates.json")
+AGGREGATES_SAVE_INTERVAL = 300
+fleet_aggregates = FleetAggregates()
+aggregates_saved_version = 0
+
+# Advisory feed matched against the installed software of every host, reloaded when the file changes
+ADVISORY_FEED = os.environ.get("ASSET_SERVER_ADVISORY_FEED", os.path.join(STATE_DIR, "advisories.json"))
+ADVISORY_POLL_INTERVAL = 60
+advisory_matcher = AdvisoryMatcher()
+
+# Set ASSET_SERVER_DEBUG=1 to dump received payloads to stdout
+DEBUG_DUMPS = os.environ.get("ASSET_SERVER_DEBUG", "0") == "1"
+
+# Bounded queue of accepted reports waiting to be written by the ingest workers
+INGEST_QUEUE_SIZE = int(os.environ.get("ASSET_SERVER_QUEUE_SIZE", "1000"))
+INGEST_WORKERS = int(os.environ.get("ASSET_SERVER_WORKERS", "4"))
+# Maximum number of queued reports written in one storage transaction
+INGEST_BATCH_SIZE = 100
+# Bulk ingest: records committed per transaction, maximum size of one record, errors listed in the summary
+BULK_BATCH_SIZE = 200
+BULK_MAX_RECORD_BYTES = 16 * 1024 * 1024
+BULK_MAX_ERRORS = 100
+# Largest report accepted, in bytes once decompressed (sections also have their own limits, see validation.py)
+MAX_PAYLOAD_BYTES = int(os.environ.get("ASSET_SERVER_MAX_PAYLOAD_BYTES", MAX_DOCUMENT_BYTES))
+# Seconds an agent is asked to wait when the queue is full
+RETRY_AFTER = 30
+
+ingest_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+
+# Check-in schedule handed to the agents: each host reports once per interval, in its own slot
+# (numbered in the registry file shared by the server processes)
+checkin_scheduler = CheckinScheduler(int(os.environ.get("ASSET_SERVER_CHECKIN_INTERVAL", CHECKIN_INTERVAL)),
+                                     registry_path=os.path.join(STATE_DIR, "checkin_slots.txt"))
+ingest_threads = []
+ingest_threads_lock = threading.Lock()
+
+# Server metrics, exposed in the Prometheus text format on /metrics.
+# With several processes, each one writes its metrics to METRICS_DIR and /metrics shows the sum over all of them
+# (the gauges of processes that exited are left out)
+metrics = Registry()
+METRICS_DIR = os.path.join(STATE_DIR, "metrics")
+METRICS_SAVE_INTERVAL = 5
+request_seconds = metrics.histogram("asset_request_seconds", "Request handling time", ["endpoint", "status"])
+payload_bytes = metrics.histogram("asset_payload_bytes", "Size of received request bodies (as sent, possibly compressed)",
+                                  ["endpoint"], SIZE_BUCKETS)
+reports_total = metrics.counter("asset_reports_total", "Reports received, by outcome", ["outcome"])
+sections_truncated = metrics.counter("asset_report_sections_truncated_total",
+                                     "Report sections cut to their size limit", ["section"])
+sections_quarantined = metrics.counter("asset_report_sections_quarantined_total",
+                                       "Report sections dropped as too big or invalid", ["section"])
+items_dropped = metrics.counter("asset_report_items_dropped_total",
+                                "Items of report sections dropped as truncated or invalid", ["section"])
+queue_depth = metrics.gauge("asset_ingest_queue_depth", "Reports waiting to be written",
+                            callback=lambda: ingest_queue.qsize())
+checkin_hosts = metrics.gauge("asset_checkin_hosts", "Hosts with a check-in slot",
+                              callback=lambda: checkin_scheduler.stats()["hosts"], aggregate=False)
+checkin_max_per_slot = metrics.gauge("asset_checkin_max_hosts_per_slot", "Largest number of hosts sharing a check-in slot",
+                                     callback=lambda: checkin_scheduler.stats()["max_per_slot"], aggregate=False)
+storage_write_seconds = metrics.histogram("asset_storage_write_seconds", "Time to write one batch of reports",
+                                          ["backend"])
+storage_reports_total = metrics.counter("asset_storage_reports_total", "Reports written to storage", ["backend"])
+agent_collector_seconds = metrics.histogram("asset_agent_collector_seconds", "Collector wall time reported by agents",
+                                            ["collector"])
+agent_collector_subprocesses = metrics.counter("asset_agent_collector_subprocesses_total",
+                                               "Subprocesses started by agent collectors", ["collector"])
+agent_collector_output_bytes = metrics.histogram("asset_agent_collector_output_bytes",
+                                                 "Command output read by agent collectors", ["collector"], SIZE_BUCKETS)
+agent_collector_errors = metrics.counter("asset_agent_collector_errors_total", "Errors reported by agent collectors",
+                                         ["collector"])
+agent_collector_status = metrics.counter("asset_agent_collector_runs_total", "Agent collector runs, by status",
+                                         ["collector", "status"])
+
+# In-memory cache of the last accepted snapshot per host: {host id: (hash, data)}
+latest_snapshots = {}
+latest_lock = threading.Lock()
+latest_file_locks = {}  # shard -> FileLock
+latest_file_locks_lock = threading.Lock()
+
+
+def get_latest_snapshot(host):
+    """
+    Returns (hash, data) of the last accepted snapshot of a host, or None.
+    """
+    with latest_lock:
+        if host in latest_snapshots:
+            return latest_snapshots[host]
+    snapshot = load_latest_snapshot(host)
+    if snapshot is not None:
+        with latest_lock:
+            latest_snapshots[host] = snapshot
+    return snapshot
+
+
+def load_latest_snapshot(host):
+    """
+    Reads (hash, data) of the last accepted snapshot of a host from disk, or returns None.
+    """
+    latest_file = shard_path(LATEST_DIR, host, f"{host}.json")
+    if not os.path.exists(latest_file):
+        latest_file = os.path.join(LATEST_DIR, f"{host}.json")  # Written before the latest snapshots were sharded
+        if not os.path.exists(latest_file):
+            return None
+    try:
+        with open(latest_file, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except Exception as e:
+        print(f"Error loading latest snapshot of {host}: {e}")
+        return None
+    return snapshot_hash(data), data
+
+
+def set_latest_snapshot(data, digest=None):
+    """
+    Records the data as the last accepted snapshot of its host and returns its hash.
+    The snapshot is written to disk later by save_latest_snapshot.
+    """
+    digest = digest or snapshot_hash(data)
+    with latest_lock:
+        latest_snapshots[host_id(data)] = (digest, data)
+    return digest
+
+
+def latest_file_lock(host):
+    """
+    Returns the lock serializing the writes of the latest snapshots of a shard, between the threads and the processes.
+    """
+    shard = shard_of(host)
+    with latest_file_locks_lock:
+        lock = latest_file_locks.get(shard)
+        if lock is None:
+            lock = latest_file_locks[shard] = FileLock(os.path.join(LATEST_DIR, shard, ".lock"))
+        return lock
+
+
+def save_latest_snapshot(data, digest, received_at=None):
     """
-    Save the received data to a JSON file.
+    Writes the latest snapshot of a host to disk, dated received_at (the JSON backend reads it as the time of the report),
+    unless a newer one was accepted meanwhile, by this process or by another one sharing the data directory.
     """
+    host = host_id(data)
+    with latest_lock:
+        current = latest_snapshots.get(host)
+    if current is not None and current[0] != digest:
+        return
+    timestamp = (received_at or datetime.now()).timestamp()
     try:
-        # Print the received data for debugging
-        print("Data received by save_data_to_json:")
-        print(json.dumps(data, indent=4))  # Pretty-print the data
+        latest_file = shard_path(LATEST_DIR, host, f"{host}.json")
+        with latest_file_lock(host):
+            if os.path.exists(latest_file) and os.path.getmtime(latest_file) > timestamp:
+                return
+            tmp_file = temporary_path(latest_file)
+            with open(tmp_file, mode="w", encoding="utf-8") as file:
+                json.dump(data, file, separators=(",", ":"), ensure_ascii=False)
+            os.utime(tmp_file, (timestamp, timestamp))
+            os.replace(tmp_file, latest_file)
+    except Exception as e:
+        print(f"Error saving latest snapshot of {host}: {e}")
+
+
+def save_data_to_json(data):
+    """
+    Save the received data with the configured storage backend.
+    """
+    save_reports([(datetime.now(), data)])
 
-        # Extract Node Name from the system_info section
-        node_name = data.get("system_info", {}).get("Node Name", "Unknown").replace(" ", "_")
 
-        # Generate a filename based on the Node Name and timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(DATA_DIR, f"{node_name}_{timestamp}.json")
+def save_reports(items):
+    """
+    Save several (received_at, data) reports at once (a single transaction with the SQLite backend).
+    """
+    try:
+        if DEBUG_DUMPS:
+            for _, data in items:
+                print("Data received by save_data_to_json:")
+                print(json.dumps(data, indent=4))  # Pretty-print the data
 
-        # Save the entire data to the JSON file
-        with open(output_file, mode="w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4, ensure_ascii=False)
+        start = time.perf_counter()
+        storage.save_batch(items)
+        storage_write_seconds.observe(time.perf_counter() - start, STORAGE_BACKEND)
+        storage_reports_total.inc(STORAGE_BACKEND, amount=len(items))
 
-        print(f"Data saved to {output_file}")
+        if DEBUG_DUMPS:
+            print(f"Saved {len(items)} report(s) with the {STORAGE_BACKEND} backend")
     except Exception as e:
-        print(f"Error saving data to JSON: {e}")
+        print(f"Error saving data: {e}")
+
+
+def open_payload():
+    """
+    Returns the request body as a stream, decompressed according to its Content-Encoding.
+    Raises PayloadError when the body is larger than MAX_PAYLOAD_BYTES even before decompression.
+    """
+    if request.content_length and request.content_length > MAX_PAYLOAD_BYTES:
+        raise PayloadError(f"Payload exceeds {MAX_PAYLOAD_BYTES} bytes", 413)
+    try:
+        return open_decoded(request.stream, request.headers.get("Content-Encoding"))
+    except ValueError as e:
+        raise PayloadError(str(e), 415)
+
+
+def read_json_payload():
+    """
+    Parses the request body, of at most MAX_PAYLOAD_BYTES once decompressed.
+    Raises PayloadError if the body is too big, empty or not valid JSON.
+    """
+    try:
+        body = open_payload().read(MAX_PAYLOAD_BYTES + 1)
+        if len(body) > MAX_PAYLOAD_BYTES:
+            raise PayloadError(f"Payload exceeds {MAX_PAYLOAD_BYTES} bytes", 413)
+        return json.loads(body)
+    except ValueError as e:
+        if isinstance(e, PayloadError):
+            raise
+        raise PayloadError(f"Invalid payload: {e}")
+    except (OSError, EOFError) as e:  # Corrupt or truncated compressed data
+        raise PayloadError(f"Invalid compressed payload: {e}")
+
+
+def read_report():
+    """
+    Parses a collected_data request body one section at a time, within the size limits, and checks it
+    against the schema. Returns the document and the notes on the sections truncated or quarantined.
+    Raises PayloadError if the body is too big, malformed or has no valid system_info.
+    """
+    try:
+        data, notes = read_document(open_payload(), MAX_PAYLOAD_BYTES)
+    except (OSError, EOFError) as e:  # Corrupt or truncated compressed data
+        raise PayloadError(f"Invalid compressed payload: {e}")
+    return data, sanitize(data, notes)
+
+
+def observe_ingest_notes(notes):
+    """
+    Counts the sections truncated, quarantined or with items dropped on ingest.
+    """
+    for section, count in notes["truncated"].items():
+        sections_truncated.inc(section)
+        items_dropped.inc(section, amount=count)
+    for section in notes["quarantined"]:
+        sections_quarantined.inc(section)
+    for section, count in notes["dropped_items"].items():
+        items_dropped.inc(section, amount=count)
+
+
+def ingest_worker():
+    """
+    Background worker writing accepted reports to storage, in batches of up to INGEST_BATCH_SIZE.
+    """
+    running = True
+    while running:
+        batch = [ingest_queue.get()]
+        while batch[-1] is not None and len(batch) < INGEST_BATCH_SIZE:
+            try:
+                batch.append(ingest_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if None in batch:
+                running = False
+            items = [item for item in batch if item is not None]
+            if items:
+                save_reports([(received_at, data) for data, _, received_at in items])
+                for data, digest, received_at in items:
+                    save_latest_snapshot(data, digest, received_at)
+                journal_reports([(host_id(data), received_at.isoformat(timespec="seconds"), digest)
+                                 for data, digest, received_at in items])
+        except Exception as e:
+            print(f"Error in ingest worker: {e}")
+        finally:
+            for _ in batch:
+                ingest_queue.task_done()
+
+
+def start_ingest_workers():
+    """
+    Starts the ingest workers, once.
+    """
+    with ingest_threads_lock:
+        if ingest_threads:
+            return
+        for i in range(INGEST_WORKERS):
+            thread = threading.Thread(target=ingest_worker, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            ingest_threads.append(thread)
+
+
+@atexit.register
+def stop_ingest_workers(timeout=30):
+    """
+    Lets the ingest workers write the queued reports, then stops them.
+    """
+    with ingest_threads_lock:
+        threads = list(ingest_threads)
+        ingest_threads.clear()
+    for _ in threads:
+        ingest_queue.put(None)
+    for thread in threads:
+        thread.join(timeout)
+
+
+def ingest_load():
+    """
+    Returns how full the ingest queue is, from 0 to 1.
+    """
+    return ingest_queue.qsize() / INGEST_QUEUE_SIZE if INGEST_QUEUE_SIZE > 0 else 0.0
+
+
+def enqueue_report(data, digest=None, notes=None):
+    """
+    Accepts a validated report and queues it for storage.
+    Returns the response to send to the agent, with the time of its next check-in
+    and the notes on the sections truncated or quarantined on ingest, if any.
+    """
+    start_ingest_workers()
+    digest = digest or snapshot_hash(data)
+    received_at = datetime.now()
+    try:
+        ingest_queue.put_nowait((data, digest, received_at))
+    except queue.Full:
+        reports_total.inc("busy")
+        response = jsonify({"error": "Server busy, retry later"})
+        response.headers["Retry-After"] = str(RETRY_AFTER)
+        return response, 503
+    set_latest_snapshot(data, digest)
+    host = host_id(data)
+    index_report(host, data, received_at.isoformat(timespec="seconds"))
+    observe_agent_telemetry(data)
+    reports_total.inc("accepted")
+    now = time.time()
+    next_checkin = checkin_scheduler.next_checkin(host, now, ingest_load())
+    body = {"message": "Data accepted", "snapshot_hash": digest,
+            "next_checkin": datetime.fromtimestamp(next_checkin).astimezone().isoformat(timespec="seconds"),
+            "checkin_in": round(next_checkin - now)}
+    if notes and has_notes(notes):
+        observe_ingest_notes(notes)
+        body["ingest"] = notes
+    return jsonify(body), 202
+
+
+def index_report(host, data, received_at):
+    """
+    Applies the latest report of a host to the query indexes, advisory matches and aggregates.
+    """
+    fleet_index.update(host, data, received_at)
+    advisory_matcher.update(host, fleet_index.host_software(host))
+    fleet_aggregates.update(host, data)
+
+
+def observe_agent_telemetry(data):
+    """
+    Aggregates the per-collector telemetry sent by the agent into the server metrics.
+    Results a resident agent reports again from its cache are skipped.
+    """
+    collectors = data.get("telemetry", {}).get("collectors", {}) if isinstance(data.get("telemetry"), dict) else {}
+    for collector, stats in collectors.items():
+        if not isinstance(stats, dict) or stats.get("cached"):
+            continue
+        try:
+            agent_collector_seconds.observe(float(stats.get("duration", 0)), collector)
+            agent_collector_subprocesses.inc(collector, amount=int(stats.get("subprocesses", 0)))
+            agent_collector_output_bytes.observe(int(stats.get("output_bytes", 0)), collector)
+            agent_collector_errors.inc(collector, amount=int(stats.get("errors", 0)))
+            agent_collector_status.inc(collector, str(stats.get("status", "unknown")))
+        except (TypeError, ValueError):
+            continue
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or "unknown"
+    if endpoint != "serve_metrics":
+        request_seconds.observe(time.perf_counter() - g.request_start, endpoint, str(response.status_code))
+        if request.content_length:
+            payload_bytes.observe(request.content_length, endpoint)
+    if response.status_code == 415:
+        # Tells the agent which encodings to use instead
+        response.headers["Accept-Encoding"] = ", ".join(SUPPORTED_ENCODINGS)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def serve_metrics():
+    """
+    Exposes the server metrics in the Prometheus text format.
+    """
+    return Response(metrics.render(load_process_metrics()), mimetype="text/plain; version=0.0.4")
+
+
+@atexit.register
+def save_process_metrics():
+    """
+    Writes the metrics of this process to METRICS_DIR, for the other server processes to add to theirs.
+    """
+    if SERVER_PROCESSES <= 1:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        metrics_file = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp_file = temporary_path(metrics_file)
+        with open(tmp_file, mode="w", encoding="utf-8") as file:
+            json.dump(metrics.dump(), file, separators=(",", ":"))
+        os.replace(tmp_file, metrics_file)
+    except (OSError, ValueError) as e:
+        print(f"Error saving metrics: {e}")
+
+
+def process_alive(pid):
+    if os.name != "posix":
+        return True  # Signal 0 is only a liveness check on POSIX
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def load_process_metrics():
+    """
+    Returns the metrics written by the other server processes, without the gauges of those that exited.
+    """
+    if SERVER_PROCESSES <= 1 or not os.path.isdir(METRICS_DIR):
+        return []
+    dumps = []
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json") or name == f"{os.getpid()}.json":
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), "r", encoding="utf-8") as file:
+                dump = json.load(file)
+            if not process_alive(int(name[:-len(".json")])):
+                dump = {metric: entry for metric, entry in dump.items() if entry["kind"] != "gauge"}
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        dumps.append(dump)
+    return dumps
+
+
+def watch_process_metrics():
+    while True:
+        time.sleep(METRICS_SAVE_INTERVAL)
+        save_process_metrics()
+
+
+def start_metrics_saver():
+    if SERVER_PROCESSES <= 1:
+        return
+    thread = threading.Thread(target=watch_process_metrics, name="metrics-saver", daemon=True)
+    thread.start()
 
 
 @app.route('/api/asset', methods=['POST'])
@@ -40,23 +518,518 @@ def receive_asset_data():
     Endpoint to receive asset data from the agent.
     """
     try:
-        data = request.json  # Parse the JSON payload
-        if not data:
-            print("No JSON payload received or payload is empty.")
-            return jsonify({"error": "No JSON payload received"}), 400
-
-        print("Received payload:")
-        print(json.dumps(data, indent=4))  # Log the received data for debugging
+        data, notes = read_report()  # Parse the (possibly compressed) JSON payload, within the size limits
 
-        # Save the received data to a JSON file
-        save_data_to_json(data)
+        if DEBUG_DUMPS:
+            print("Received payload:")
+            print(json.dumps(data, indent=4))  # Log the received data for debugging
 
-        return jsonify({"message": "Data received and saved successfully"}), 200
+        # Queue the received data for the ingest workers
+        return enqueue_report(data, notes=notes)
+    except PayloadError as e:
+        print(f"Rejected payload: {e}")
+        reports_total.inc("rejected")
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         print(f"Error processing request: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+def parse_bulk_record(record):
+    """
+    Returns (received_at, data) of a bulk record: a collected_data document,
+    or an envelope {"collected_at": ISO time, "report": collected_data}.
+    """
+    if isinstance(record, dict) and "report" in record:
+        collected_at = record.get("collected_at")
+        try:
+            received_at = parse_local_time(collected_at) if collected_at else None
+        except (TypeError, ValueError):
+            raise PayloadError("Invalid collected_at: expected an ISO 8601 date")
+        return received_at, record["report"]
+    return None, record
+
+
+def commit_bulk_batch(batch):
+    """
+    Saves a batch of bulk records in one transaction, then updates the latest snapshots
+    and query indexes with the records newer than what is already known.
+    """
+    start = time.perf_counter()
+    storage.save_batch([(received_at, data) for _, received_at, data in batch])
+    storage_write_seconds.observe(time.perf_counter() - start, STORAGE_BACKEND)
+    storage_reports_total.inc(STORAGE_BACKEND, amount=len(batch))
+    journal = []
+    for _, received_at, data in batch:
+        host = host_id(data)
+        received = (received_at or datetime.now()).isoformat(timespec="seconds")
+        indexed = fleet_index.hosts.get(host)
+        if indexed is None or not indexed["received_at"] or indexed["received_at"] <= received:
+            digest = set_latest_snapshot(data)
+            save_latest_snapshot(data, digest, received_at)
+            index_report(host, data, received)
+            journal.append((host, received, digest))
+    journal_reports(journal)
+
+
+@app.route('/api/assets/bulk', methods=['POST'])
+def receive_bulk_assets():
+    """
+    Endpoint to receive many reports at once as NDJSON (optionally compressed), e.g. from a relay or a backfill.
+    The body is parsed one record at a time and committed in batches, so memory stays bounded.
+    """
+    summary = {"received": 0, "accepted": 0, "rejected": 0, "errors": []}
+
+    def reject(line, error):
+        summary["rejected"] += 1
+        if len(summary["errors"]) < BULK_MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": error})
+
+    def commit(batch):
+        try:
+            commit_bulk_batch(batch)
+            summary["accepted"] += len(batch)
+        except Exception as e:
+            print(f"Error saving bulk batch: {e}")
+            for line, _, _ in batch:
+                reject(line, "Storage error")
+
+    batch = []
+    try:
+        stream = open_decoded(request.stream, request.headers.get("Content-Encoding"))
+        for line, record, error in iter_ndjson(stream, BULK_MAX_RECORD_BYTES):
+            summary["received"] += 1
+            if error is None:
+                try:
+                    received_at, data = parse_bulk_record(record)
+                    observe_ingest_notes(sanitize(data))
+                except PayloadError as e:
+                    error = str(e)
+                except (TypeError, ValueError) as e:
+                    error = f"Invalid record: {e}"
+            if error:
+                reject(line, error)
+                continue
+            batch.append((line, received_at, data))
+            if len(batch) >= BULK_BATCH_SIZE:
+                commit(batch)
+                batch = []
+        if batch:
+            commit(batch)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 415
+    except (OSError, EOFError) as e:
+        print(f"Bulk stream interrupted: {e}")
+        if batch:
+            commit(batch)
+        summary["error"] = "Truncated or corrupt body, the records after the last complete line were not read"
+        return jsonify(summary), 400
+
+    return jsonify(summary), 200
+
+
+@app.route('/api/asset/delta', methods=['POST'])
+def receive_asset_delta():
+    """
+    Endpoint to receive the changes since the last snapshot the server accepted from the agent.
+    The full document is rebuilt from the stored base; on a hash mismatch the agent must resend everything.
+    """
+    try:
+        delta = read_json_payload()
+        if not isinstance(delta, dict) or "base_hash" not in delta:
+            return jsonify({"error": "No delta payload received"}), 400
+
+        base = get_latest_snapshot(host_id(delta.get("sections", {})))
+        if base is None or base[0] != delta["base_hash"]:
+            return jsonify({"error": "Unknown base snapshot", "resend": "full"}), 409
+
+        data = apply_delta(base[1], delta)
+        digest = snapshot_hash(data)
+        if digest != delta.get("hash"):
+            return jsonify({"error": "Rebuilt snapshot does not match", "resend": "full"}), 409
+
+        notes = sanitize(data)
+        if has_notes(notes):
+            digest = None  # Changed by sanitize: hash what is actually stored
+        return enqueue_report(data, digest, notes)
+    except PayloadError as e:
+        print(f"Rejected delta: {e}")
+        reports_total.inc("rejected")
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        print(f"Error processing delta: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def load_fleet_index():
+    """
+    Rebuilds the query indexes and aggregates from the latest stored report of every host.
+    """
+    count = 0
+    try:
+        for received_at, data in storage.iter_latest_reports():
+            fleet_index.update(host_id(data), data, received_at.isoformat(timespec="seconds"))
+            fleet_aggregates.update(host_id(data), data)
+            checkin_scheduler.assign(host_id(data))
+            count += 1
+    except Exception as e:
+        print(f"Error loading fleet index: {e}")
+    print(f"Fleet index loaded with {count} hosts")
+
+
+@atexit.register
+def save_aggregates():
+    """
+    Writes the aggregates to AGGREGATES_FILE if they changed since the last save (only in the leader process).
+    """
+    global aggregates_saved_version
+    if fleet_aggregates.version == aggregates_saved_version or not leader_lock.is_leader():
+        return
+    try:
+        aggregates_saved_version = fleet_aggregates.save(AGGREGATES_FILE)
+    except OSError as e:
+        print(f"Error saving aggregates: {e}")
+
+
+def watch_aggregates():
+    while True:
+        time.sleep(AGGREGATES_SAVE_INTERVAL)
+        save_aggregates()
+
+
+def start_aggregates_saver():
+    thread = threading.Thread(target=watch_aggregates, name="aggregates-saver", daemon=True)
+    thread.start()
+
+
+def compact_history():
+    while True:
+        time.sleep(HISTORY_COMPACT_INTERVAL)
+        try:
+            start = time.perf_counter()
+            kept = storage.compact()
+            print(f"History compacted in {time.perf_counter() - start:.1f}s, {kept} snapshots kept")
+        except Exception as e:
+            print(f"Error compacting history: {e}")
+
+
+def journal_reports(items):
+    """
+    Tells the other server processes about accepted reports, as (host id, received_at, hash).
+    """
+    if ingest_journal is None or not items:
+        return
+    try:
+        ingest_journal.append([{"host": host, "received_at": received_at, "hash": digest}
+                               for host, received_at, digest in items])
+    except OSError as e:
+        print(f"Error writing the ingest journal: {e}")
+
+
+def apply_journal():
+    """
+    Applies the reports accepted by the other server processes to the indexes and aggregates of this one,
+    from the latest snapshots they wrote. Returns the number of reports applied.
+    """
+    entries = ingest_journal.read_new()
+    if entries is None:
+        print("Ingest journal entries were lost, reloading the fleet index")
+        load_fleet_index()
+        return 0
+    applied = 0
+    for entry in entries:
+        host = entry["host"]
+        with latest_lock:
+            cached = latest_snapshots.get(host)
+        indexed = fleet_index.hosts.get(host)
+        if cached is not None and cached[0] == entry["hash"]:
+            continue
+        if indexed is not None and indexed["received_at"] and indexed["received_at"] > entry["received_at"]:
+            continue  # This process has a newer report
+        snapshot = load_latest_snapshot(host)
+        if snapshot is None:
+            continue
+        with latest_lock:
+            latest_snapshots[host] = snapshot
+        index_report(host, snapshot[1], entry["received_at"])
+        checkin_scheduler.assign(host)
+        applied += 1
+    return applied
+
+
+def follow_journal():
+    while True:
+        time.sleep(JOURNAL_POLL_INTERVAL)
+        try:
+            apply_journal()
+        except Exception as e:
+            print(f"Error applying the ingest journal: {e}")
+
+
+def start_journal_follower():
+    if ingest_journal is None:
+        return
+    thread = threading.Thread(target=follow_journal, name="journal-follower", daemon=True)
+    thread.start()
+
+
+def start_history_compactor():
+    if not hasattr(storage, "compact"):
+        return
+    thread = threading.Thread(target=compact_history, name="history-compactor", daemon=True)
+    thread.start()
+
+
+def load_advisories():
+    """
+    Loads the advisory feed when it changed, and re-matches the whole fleet against it.
+    Returns True when a new feed was loaded.
+    """
+    mtime = feed_mtime(ADVISORY_FEED)
+    if mtime is None or mtime == getattr(advisory_matcher.feed, "mtime", None):
+        return False
+    start = time.perf_counter()
+    try:
+        feed = AdvisoryFeed.load(ADVISORY_FEED)
+    except (OSError, ValueError) as e:
+        print(f"Error loading advisory feed {ADVISORY_FEED}: {e}")
+        return False
+    feed.mtime = mtime
+    advisory_matcher.set_feed(feed, fleet_index.software_by_host())
+    print(f"Advisory feed loaded: {len(feed.advisories)} advisories, {feed.ranges} ranges, "
+          f"fleet matched in {time.perf_counter() - start:.1f}s")
+    return True
+
+
+def watch_advisories():
+    while True:
+        time.sleep(ADVISORY_POLL_INTERVAL)
+        load_advisories()
+
+
+def start_advisory_watcher():
+    thread = threading.Thread(target=watch_advisories, name="advisory-watcher", daemon=True)
+    thread.start()
+
+
+def page_arguments():
+    """
+    Returns the cursor and limit query arguments of a paginated request.
+    """
+    return request.args.get("cursor"), request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+
+
+@app.route('/api/software', methods=['GET'])
+def query_software():
+    """
+    Lists the hosts running a software (?name=, optionally &version=), or all software names without a name.
+    """
+    try:
+        cursor, limit = page_arguments()
+        name = request.args.get("name")
+        if name:
+            items, next_cursor = fleet_index.find_software(name, request.args.get("version"), cursor, limit)
+        else:
+            items, next_cursor = fleet_index.list_software(cursor, limit)
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/hosts/<node>', methods=['GET'])
+def query_host(node):
+    """
+    Returns the latest inventory of a host, by Node Name or host id.
+    """
+    host = fleet_index.get_host(node)
+    if host is None:
+        return jsonify({"error": "Unknown host"}), 404
+    return jsonify(host), 200
+
+
+@app.route('/api/vendors', methods=['GET'])
+def query_vendors():
+    """
+    Lists the software vendors with their number of hosts and packages.
+    """
+    try:
+        items, next_cursor = fleet_index.list_vendors(*page_arguments())
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def parse_time_argument(name, default=None):
+    """
+    Returns an ISO 8601 query argument as a naive local datetime (like the stored times),
+    or default when it is missing.
+    """
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return parse_local_time(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected an ISO 8601 date")
+
+
+@app.route('/api/hosts/<node>/history', methods=['GET'])
+def query_host_history(node):
+    """
+    Returns the inventory of a host as of a time (?at=, the latest by default), by Node Name or host id.
+    """
+    if not hasattr(storage, "as_of"):
+        return jsonify({"error": "History requires ASSET_SERVER_STORAGE=history"}), 501
+    try:
+        at = parse_time_argument("at")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    host = fleet_index.get_host(node)
+    snapshot = storage.as_of(host["host"] if host else node, at)
+    if snapshot is None:
+        return jsonify({"error": "No snapshot"}), 404
+    received_at, data = snapshot
+    return jsonify({"received_at": received_at.isoformat(timespec="seconds"), "data": data}), 200
+
+
+@app.route('/api/history/software-events', methods=['GET'])
+def query_software_events():
+    """
+    Lists the software installed, uninstalled and updated between two times (?since=&until=, optionally &host=).
+    """
+    if not hasattr(storage, "software_events"):
+        return jsonify({"error": "History requires ASSET_SERVER_STORAGE=history"}), 501
+    try:
+        since = parse_time_argument("since")
+        until = parse_time_argument("until", datetime.now())
+        if since is None:
+            return jsonify({"error": "Missing since"}), 400
+        node = request.args.get("host")
+        host = None
+        if node:
+            indexed = fleet_index.get_host(node)
+            host = indexed["host"] if indexed else node
+        events = storage.software_events(since, until, host)
+        items = [(f"{event['received_at']}|{event['host']}|{i:08d}", event) for i, event in enumerate(events)]
+        items.sort(key=lambda pair: pair[0])
+        items, next_cursor = paginate(items, *page_arguments())
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/export', methods=['GET'])
+def export_table():
+    """
+    Streams one table of the latest inventory of every host (?table=hosts|software|processes|updates,
+    &format=csv|ndjson|columnar). With ?since=, only the hosts reported since then are exported;
+    the X-Export-Watermark header is the since of the next incremental export.
+    """
+    table = request.args.get("table", "hosts")
+    export_format = request.args.get("format", "csv")
+    if table not in TABLES:
+        return jsonify({"error": f"Unknown table, expected one of {', '.join(TABLES)}"}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since = parse_time_argument("since")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    watermark = datetime.now()
+    extension, mimetype = EXPORT_FORMATS[export_format]
+    response = Response(stream_table(storage, table, export_format, since), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={table}{extension}"
+    response.headers["X-Export-Watermark"] = watermark.isoformat(timespec="seconds")
+    return response
+
+
+@app.route('/api/aggregates', methods=['GET'])
+def query_aggregates():
+    """
+    Returns the number of hosts per OS release, encryption state, RAM and disk size.
+    """
+    return jsonify(fleet_aggregates.summary()), 200
+
+
+@app.route('/api/aggregates/software', methods=['GET'])
+def query_software_aggregates():
+    """
+    Returns the number of hosts running each version of a software (?name=).
+    """
+    name = request.args.get("name")
+    if not name:
+        return jsonify({"error": "Missing name"}), 400
+    versions = fleet_aggregates.software_versions(name)
+    if versions is None:
+        return jsonify({"error": "Unknown software"}), 404
+    return jsonify(versions), 200
+
+
+@app.route('/api/aggregates/<dimension>', methods=['GET'])
+def query_dimension_aggregates(dimension):
+    """
+    Returns the number of hosts per value of one dimension (os, encryption, ram, disk or vendor).
+    """
+    counts = fleet_aggregates.dimension(dimension)
+    if counts is None:
+        return jsonify({"error": "Unknown dimension"}), 404
+    return jsonify(counts), 200
+
+
+@app.route('/api/advisories', methods=['GET'])
+def query_advisories():
+    """
+    Lists the advisories affecting at least one host, with their number of hosts.
+    """
+    try:
+        items, next_cursor = advisory_matcher.list_advisories(*page_arguments())
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/advisories/<advisory>', methods=['GET'])
+def query_advisory_hosts(advisory):
+    """
+    Lists the hosts affected by an advisory, with the affected software.
+    """
+    try:
+        items, next_cursor = advisory_matcher.find_hosts(advisory, *page_arguments())
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/advisories/reload', methods=['POST'])
+def reload_advisories():
+    """
+    Reloads the advisory feed now instead of waiting for the watcher.
+    """
+    loaded = load_advisories()
+    return jsonify({"reloaded": loaded, "advisories": len(advisory_matcher.feed.advisories)}), 200
+
+
+@app.route('/api/hosts/<node>/advisories', methods=['GET'])
+def query_host_advisories(node):
+    """
+    Lists the advisories affecting a host, by Node Name or host id.
+    """
+    host = fleet_index.get_host(node)
+    if host is None:
+        return jsonify({"error": "Unknown host"}), 404
+    return jsonify({"host": host["host"], "advisories": advisory_matcher.get_host(host["host"])}), 200
+
+
+load_fleet_index()
+load_advisories()
+start_advisory_watcher()
+start_aggregates_saver()
+start_history_compactor()
+start_journal_follower()
+start_metrics_saver()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    # Single process development server; cluster.py runs several worker processes
+    app.run(host="0.0.0.0", port=int(os.environ.get("ASSET_SERVER_PORT", "5000")))
 
@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+
+# Uninstall keys that list installed software, per hive
+UNINSTALL_PATHS = [
+    r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall",
+    r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall"
+]
+HIVES = ["HKLM", "HKCU"]
+
+# Registry values read for each software entry
+SOFTWARE_VALUES = {"DisplayName": "Name", "DisplayVersion": "Version", "Publisher": "Vendor"}
+
+
+def clean_text(text):
+    """
+    Cleans up text by ensuring proper encoding and removing invalid characters.
+    """
+    if not text:
+        return "N/A"
+    return text.encode("utf-8", errors="replace").decode("utf-8", errors="ignore").strip()
+
+
+class WinRegistry:
+    """
+    Registry access backed by winreg (Windows only).
+    """
+
+    def __init__(self):
+        import winreg
+        self.winreg = winreg
+        self.hives = {"HKLM": winreg.HKEY_LOCAL_MACHINE, "HKCU": winreg.HKEY_CURRENT_USER}
+
+    def list_subkeys(self, hive, path):
+        """
+        Returns (subkey name, last write time) for every subkey of the given key.
+        """
+        winreg = self.winreg
+        subkeys = []
+        with winreg.OpenKey(self.hives[hive], path) as key:
+            for i in range(winreg.QueryInfoKey(key)[0]):
+                try:
+                    name = winreg.EnumKey(key, i)
+                    with winreg.OpenKey(key, name) as subkey:
+                        subkeys.append((name, winreg.QueryInfoKey(subkey)[2]))
+                except OSError:
+                    continue
+        return subkeys
+
+    def key_info(self, hive, path):
+        """
+        Returns (number of subkeys, last write time) of a key.
+        """
+        winreg = self.winreg
+        with winreg.OpenKey(self.hives[hive], path) as key:
+            info = winreg.QueryInfoKey(key)
+        return info[0], info[2]
+
+    def read_values(self, hive, path, subkey_name):
+        """
+        Reads all values of a subkey in a single pass.
+        """
+        winreg = self.winreg
+        values = {}
+        with winreg.OpenKey(self.hives[hive], path + "\\" + subkey_name) as subkey:
+            for i in range(winreg.QueryInfoKey(subkey)[1]):
+                name, data, _ = winreg.EnumValue(subkey, i)
+                values[name] = data
+        return values
+
+
+class FakeRegistry:
+    """
+    In-memory registry with the same interface as WinRegistry, for tests and benchmarks.
+    keys maps (hive, path) to {subkey name: {"last_write": int, "values": dict}}.
+    """
+
+    def __init__(self, keys=None):
+        self.keys = keys if keys is not None else {}
+        self.reads = 0
+
+    def set_subkey(self, hive, path, subkey_name, values, last_write):
+        self.keys.setdefault((hive, path), {})[subkey_name] = {"last_write": last_write, "values": dict(values)}
+
+    def delete_subkey(self, hive, path, subkey_name):
+        self.keys.get((hive, path), {}).pop(subkey_name, None)
+
+    def key_info(self, hive, path):
+        if (hive, path) not in self.keys:
+            raise FileNotFoundError(f"{hive}\\{path}")
+        subkeys = self.keys[(hive, path)]
+        return len(subkeys), max((entry["last_write"] for entry in subkeys.values()), default=0)
+
+    def list_subkeys(self, hive, path):
+        if (hive, path) not in self.keys:
+            raise FileNotFoundError(f"{hive}\\{path}")
+        return [(name, entry["last_write"]) for name, entry in self.keys[(hive, path)].items()]
+
+    def read_values(self, hive, path, subkey_name):
+        self.reads += 1
+        return dict(self.keys[(hive, path)][subkey_name]["values"])
+
+
+def software_from_values(values):
+    """
+    Builds a software entry from the values of an Uninstall subkey, or None if it has no name.
+    """
+    if not values.get("DisplayName"):
+        return None
+    software = {}
+    for value_name, field in SOFTWARE_VALUES.items():
+        value = values.get(value_name)
+        software[field] = clean_text(value if value is None or isinstance(value, str) else str(value))
+    return software
+
+
+class SoftwareScanner:
+    """
+    Enumerates installed software from the Uninstall keys.
+    Results are cached by subkey and last write time, so later scans only re-read changed subkeys.
+    The cache file is only rewritten when a scan added, removed or refreshed an entry.
+    """
+
+    def __init__(self, registry, cache_file=None):
+        self.registry = registry
+        self.cache_file = cache_file
+        self.cache = self.load_cache()
+        self.dirty = False
+        # Scans may run from two collectors at once (installed software, security software)
+        self.lock = threading.Lock()
+        self.generation = 0  # Number of scans done, so a waiting caller can tell one finished meanwhile
+        self.result = []
+
+    def load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except Exception as e:
+            print(f"Error loading software cache: {e}")
+            return {}
+
+    def save_cache(self):
+        if not self.cache_file or not self.dirty:
+            return
+        try:
+            directory = os.path.dirname(self.cache_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, mode="w", encoding="utf-8") as file:
+                json.dump(self.cache, file, separators=(",", ":"), ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+            self.dirty = False
+        except Exception as e:
+            print(f"Error saving software cache: {e}")
+
+    def fingerprint(self):
+        """
+        Returns a cheap summary of the Uninstall keys (subkey counts and last write times)
+        that changes when software is installed or removed.
+        """
+        fingerprint = []
+        for hive in HIVES:
+            for path in UNINSTALL_PATHS:
+                try:
+                    fingerprint.append(self.registry.key_info(hive, path))
+                except OSError:
+                    fingerprint.append(None)
+        return tuple(fingerprint)
+
+    def is_cold(self):
+        """
+        Tells whether the next scan has to read every subkey (no cache yet).
+        """
+        return not self.cache
+
+    def scan(self):
+        """
+        Returns the list of installed software, re-reading only subkeys changed since the last scan.
+        A call made while another scan is running waits for it and returns its result.
+        """
+        generation = self.generation
+        with self.lock:
+            if self.generation == generation:
+                self.result = self.scan_unlocked()
+                self.generation += 1
+            return list(self.result)
+
+    def scan_unlocked(self):
+        cache = {}
+        software_list = []
+        for hive in HIVES:
+            for path in UNINSTALL_PATHS:
+                try:
+                    subkeys = self.registry.list_subkeys(hive, path)
+                except FileNotFoundError:
+                    continue
+                except Exception as e:
+                    print(f"Error accessing registry: {e}")
+                    continue
+                for subkey_name, last_write in subkeys:
+                    cache_key = f"{hive}\\{path}\\{subkey_name}"
+                    entry = self.cache.get(cache_key)
+                    if entry is None or entry["last_write"] != last_write:
+                        try:
+                            values = self.registry.read_values(hive, path, subkey_name)
+                        except FileNotFoundError:
+                            continue
+                        except Exception as e:
+                            print(f"Error reading registry: {e}")
+                            continue
+                        entry = {"last_write": last_write, "software": software_from_values(values)}
+                        self.dirty = True
+                    cache[cache_key] = entry
+                    if entry["software"]:
+                        software_list.append(entry["software"])
+        if len(cache) != len(self.cache):
+            self.dirty = True  # Subkeys were removed (every other entry kept comes from the old cache)
+        self.cache = cache
+        self.save_cache()
+        return software_list
@@ -0,0 +1,171 @@
+import gzip
+import json
+import os
+import random
+import time
+
+# Spool limits: size of one segment before rotation, and of the whole spool
+SEGMENT_BYTES = 4 * 1024 * 1024
+MAX_SPOOL_BYTES = 64 * 1024 * 1024
+# Retransmission backoff in seconds (exponential with full jitter)
+BACKOFF_BASE = 30
+BACKOFF_CAP = 6 * 3600
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    Returns a random delay before the next attempt, up to base * 2^attempt (capped).
+    The jitter keeps agents that failed at the same time from retrying at the same time.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Spool:
+    """
+    Durable on-disk queue of reports waiting to be sent.
+    Reports are appended as gzip-compressed NDJSON lines to numbered segment files; the oldest
+    segments are dropped when the spool grows beyond max_bytes.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, max_bytes=MAX_SPOOL_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.state_file = os.path.join(directory, "state.json")
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        """
+        Returns the segment paths, oldest first.
+        """
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".ndjson.gz"))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def segment_number(self, path):
+        return int(os.path.basename(path).split(".")[0])
+
+    def append(self, record):
+        """
+        Appends a record to the current segment, rotating it when full, and enforces the size cap.
+        """
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1]) < self.segment_bytes:
+            path = segments[-1]
+        else:
+            number = self.segment_number(segments[-1]) + 1 if segments else 1
+            path = os.path.join(self.directory, f"{number:08d}.ndjson.gz")
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+        # Each append is a separate gzip member; readers see one continuous stream
+        with gzip.open(path, "ab") as file:
+            file.write(line)
+        self.enforce_cap()
+
+    def enforce_cap(self):
+        """
+        Drops the oldest segments until the spool fits in max_bytes (the newest segment is kept).
+        """
+        segments = self.segments()
+        total = sum(os.path.getsize(path) for path in segments)
+        while total > self.max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            print(f"Spool full, dropped {os.path.basename(oldest)}")
+
+    def read_segment(self, path):
+        records = []
+        try:
+            with gzip.open(path, "rb") as file:
+                for line in file:
+                    if line.strip():
+                        records.append(json.loads(line))
+        except (OSError, EOFError, ValueError) as e:
+            # A segment cut short by a crash still yields the records before the damage
+            print(f"Spool segment {os.path.basename(path)} is damaged: {e}")
+        return records
+
+    def load_state(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {"attempts": 0, "next_attempt": 0}
+
+    def save_state(self, state):
+        with open(self.state_file + ".tmp", mode="w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(self.state_file + ".tmp", self.state_file)
+
+    def record_failure(self, retry_after=None):
+        """
+        Schedules the next attempt after a failed send, using backoff with jitter
+        (or the server's Retry-After when given).
+        """
+        state = self.load_state()
+        delay = retry_after if retry_after is not None else backoff_delay(state["attempts"])
+        state = {"attempts": state["attempts"] + 1, "next_attempt": time.time() + delay}
+        self.save_state(state)
+        return delay
+
+    def record_success(self):
+        """
+        Clears the backoff after a successful send. The state file is only written when it changes.
+        """
+        state = {"attempts": 0, "next_attempt": 0}
+        if self.load_state() != state:
+            self.save_state(state)
+
+    def ready(self):
+        """
+        Returns True when the backoff delay has passed.
+        """
+        return time.time() >= self.load_state()["next_attempt"]
+
+    def write_segment(self, path, records):
+        """
+        Replaces a segment with the given records.
+        """
+        with gzip.open(path + ".tmp", "wb") as file:
+            for record in records:
+                file.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+        os.replace(path + ".tmp", path)
+
+    def drain(self, send_batch, max_records=50):
+        """
+        Sends the spooled records in batches of up to max_records, oldest first.
+        send_batch(records) returns True when the server accepted the batch, or a number of
+        seconds to wait (Retry-After) / False on failure. Sent segments are deleted, and a segment
+        sent in part is rewritten with its unsent records when a later batch fails.
+        Returns the number of records sent.
+        """
+        segments = self.segments()
+        if not segments or not self.ready():
+            return 0
+        sent = 0
+        records = []  # Records read and not sent yet, oldest first
+        unsent = []   # [path, records not sent yet, records] for each segment read, oldest first
+        while segments or records:
+            while segments and len(records) < max_records:
+                path = segments.pop(0)
+                segment_records = self.read_segment(path)
+                unsent.append([path, len(segment_records), len(segment_records)])
+                records.extend(segment_records)
+            batch = records[:max_records]
+            result = send_batch(batch) if batch else True
+            if result is not True:
+                path, count, total = unsent[0]
+                if count < total:
+                    self.write_segment(path, records[:count])
+                delay = self.record_failure(result if result is not False else None)
+                print(f"Spool upload failed, next attempt in {delay:.0f}s")
+                return sent
+            del records[:len(batch)]
+            sent += len(batch)
+            done = len(batch)
+            while unsent and unsent[0][1] <= done:
+                done -= unsent[0][1]
+                os.remove(unsent.pop(0)[0])
+            if unsent:
+                unsent[0][1] -= done
+        self.record_success()
+        return sent
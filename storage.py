@@ -0,0 +1,495 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from delta import snapshot_hash
+
+# Timestamp format used in stored file names
+FILE_TIMESTAMP = "%Y%m%d_%H%M%S"
+# Name of a stored report file: <NodeName>_<timestamp>.json, with a counter for reports of the same second
+REPORT_FILE_NAME = re.compile(r".+_(\d{8}_\d{6})(?:_\d+)?\.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    id INTEGER PRIMARY KEY,
+    host_key TEXT NOT NULL UNIQUE,
+    node_name TEXT,
+    mac_address TEXT,
+    system TEXT,
+    release TEXT,
+    first_seen TEXT,
+    last_seen TEXT,
+    latest_snapshot_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_hosts_mac_address ON hosts(mac_address);
+CREATE INDEX IF NOT EXISTS idx_hosts_node_name ON hosts(node_name);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    host_id INTEGER NOT NULL REFERENCES hosts(id),
+    received_at TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    software_hash TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_host ON snapshots(host_id, received_at);
+
+-- Deduplicated sections, stored once per distinct content
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    section TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+
+-- Software rows of each distinct software_list blob
+CREATE TABLE IF NOT EXISTS software (
+    blob_hash TEXT NOT NULL REFERENCES blobs(hash),
+    name TEXT,
+    version TEXT,
+    vendor TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_software_name_version ON software(name, version);
+CREATE INDEX IF NOT EXISTS idx_software_vendor ON software(vendor);
+CREATE INDEX IF NOT EXISTS idx_software_blob ON software(blob_hash);
+"""
+
+# Sections identical across hosts built from the same image, stored once in the blob store
+DEDUP_SECTIONS = ("software_list", "security_software", "development_tools")
+# Key of the reference that replaces a deduplicated section in a stored snapshot
+BLOB_REF = "$blob"
+
+
+def host_id(data):
+    """
+    Returns the identifier of the host that sent the data (MAC address, or Node Name as a fallback).
+    """
+    system_info = data.get("system_info", {})
+    identifier = system_info.get("MAC Address") or system_info.get("Node Name") or "Unknown"
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in identifier)
+
+
+def parse_local_time(value):
+    """
+    Parses an ISO 8601 time as a naive local datetime, like the stored times (a time with an offset is converted).
+    Raises ValueError when value is not a valid time.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def shard_of(host):
+    return hashlib.sha1(host.encode("utf-8")).hexdigest()[:2]
+
+
+def shard_path(root, host, name):
+    """
+    Returns the path of a file of a host under root, in one of 256 subdirectories chosen by the hash
+    of the host id, so no directory grows with the fleet and paths of different hosts never collide.
+    """
+    directory = os.path.join(root, shard_of(host))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def iter_shard_files(root):
+    """
+    Yields (name, path, sharded) for the files directly under root and in its shard subdirectories.
+    """
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if re.fullmatch(r"[0-9a-f]{2}", name) and os.path.isdir(path):
+            for shard_name in os.listdir(path):
+                yield shard_name, os.path.join(path, shard_name), True
+        else:
+            yield name, path, False
+
+
+def temporary_path(path):
+    """
+    Returns a temporary file name for an atomic write of path, unique to the process and thread.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def normalize_section(value):
+    """
+    Returns a section in a stable order: entries sorted by Name/Version/Vendor, or by value.
+    """
+    if not isinstance(value, list):
+        return value
+    return sorted(value, key=lambda entry: (
+        (str(entry.get("Name")), str(entry.get("Version")), str(entry.get("Vendor")))
+        if isinstance(entry, dict) else ("", "", str(entry))
+    ))
+
+
+def encode_json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def split_sections(data):
+    """
+    Replaces the deduplicated sections of a report by references to content-addressed blobs.
+    Returns the report to store and the blobs it references: {hash: (section, encoded content)}.
+    """
+    stored = dict(data)
+    blobs = {}
+    for section in DEDUP_SECTIONS:
+        if section not in data:
+            continue
+        encoded = encode_json(normalize_section(data[section]))
+        digest = hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+        stored[section] = {BLOB_REF: digest}
+        blobs[digest] = (section, encoded)
+    return stored, blobs
+
+
+def join_sections(stored, load_blob):
+    """
+    Resolves the blob references of a stored report.
+    """
+    data = dict(stored)
+    for section, value in stored.items():
+        if isinstance(value, dict) and BLOB_REF in value:
+            data[section] = load_blob(value[BLOB_REF])
+    return data
+
+
+class JsonFileStorage:
+    """
+    Stores every report as a separate <shard>/<NodeName>_<timestamp>.json file (see shard_path).
+    Deduplicated sections are written once to blobs/<hash>.json.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        # Last report of every host, as <shard>/<host>.json files written by the server (see server.py)
+        self.latest_dir = os.path.join(data_dir, "latest")
+        self.blob_dir = os.path.join(data_dir, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.known_blobs = {name[:-len(".json")] for name in os.listdir(self.blob_dir) if name.endswith(".json")}
+        self.blob_cache = {}
+
+    def save_blob(self, digest, encoded):
+        """
+        Writes a blob unless it is already stored.
+        """
+        if digest in self.known_blobs:
+            return
+        blob_file = os.path.join(self.blob_dir, f"{digest}.json")
+        tmp_file = temporary_path(blob_file)
+        with open(tmp_file, mode="w", encoding="utf-8") as file:
+            file.write(encoded)
+        os.replace(tmp_file, blob_file)
+        self.known_blobs.add(digest)
+
+    def load_blob(self, digest):
+        if digest not in self.blob_cache:
+            with open(os.path.join(self.blob_dir, f"{digest}.json"), "r", encoding="utf-8") as file:
+                self.blob_cache[digest] = json.load(file)
+        return self.blob_cache[digest]
+
+    def save(self, data, received_at=None):
+        """
+        Save the data to a new JSON file and return its path.
+        A counter is appended when the host already sent a report in the same second
+        (the file is created exclusively, so this also holds between several server processes).
+        """
+        stored, blobs = split_sections(data)
+        for digest, (_, encoded) in blobs.items():
+            self.save_blob(digest, encoded)
+
+        node_name = data.get("system_info", {}).get("Node Name", "Unknown").replace(" ", "_")
+        timestamp = (received_at or datetime.now()).strftime(FILE_TIMESTAMP)
+        base = shard_path(self.data_dir, host_id(data), f"{node_name}_{timestamp}")
+        output_file = base + ".json"
+        counter = 1
+        while True:
+            try:
+                # Exclusive creation, so two reports never overwrite each other
+                with open(output_file, mode="x", encoding="utf-8") as file:
+                    json.dump(stored, file, separators=(",", ":"), ensure_ascii=False)
+                return output_file
+            except FileExistsError:
+                output_file = f"{base}_{counter}.json"
+                counter += 1
+
+    def save_many(self, reports, received_at=None):
+        return [self.save(data, received_at) for data in reports]
+
+    def save_batch(self, items):
+        """
+        Save several (received_at, data) reports.
+        """
+        return [self.save(data, received_at) for received_at, data in items]
+
+    def iter_reports(self):
+        """
+        Yields (received_at, data) for every stored report.
+        """
+        for path, received_at in list_report_files(self.data_dir):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    stored = json.load(file)
+                yield received_at, join_sections(stored, self.load_blob)
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+
+    def iter_latest_reports(self, since=None):
+        """
+        Yields (received_at, data) for the latest report of every host (received at or after since, if given).
+        The reports are read one at a time from the latest snapshots kept by the server, dated by their
+        modification time; without them, every stored report is read to find the latest ones.
+        """
+        files = list_latest_files(self.latest_dir) if os.path.isdir(self.latest_dir) else []
+        if not files:
+            yield from self.scan_latest_reports(since)
+            return
+        for path in files:
+            try:
+                received_at = datetime.fromtimestamp(os.path.getmtime(path))
+                if since is not None and received_at < since:
+                    continue
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+                continue
+            yield received_at, data
+
+    def scan_latest_reports(self, since=None):
+        latest = {}
+        for received_at, data in self.iter_reports():
+            latest[host_id(data)] = (received_at, data)
+        for received_at, data in latest.values():
+            if since is None or received_at >= since:
+                yield received_at, data
+
+
+class SQLiteStorage:
+    """
+    Stores reports normalized into a SQLite database (hosts, snapshots and software rows).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        connection = self.connection()
+        connection.executescript(SCHEMA)
+        connection.commit()
+        self.known_blobs = {row[0] for row in connection.execute("SELECT hash FROM blobs")}
+        self.pending_blobs = set()
+        self.blob_cache = {}
+
+    def load_blob(self, digest):
+        if digest not in self.blob_cache:
+            row = self.connection().execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            self.blob_cache[digest] = json.loads(row[0])
+        return self.blob_cache[digest]
+
+    def connection(self):
+        """
+        Returns the connection of the current thread.
+        """
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def save(self, data, received_at=None):
+        return self.save_many([data], received_at)[0]
+
+    def save_many(self, reports, received_at=None):
+        """
+        Save several reports in a single transaction and return their snapshot ids.
+        """
+        received_at = received_at or datetime.now()
+        return self.save_batch([(received_at, data) for data in reports])
+
+    def save_batch(self, items):
+        """
+        Save several (received_at, data) reports in a single transaction and return their snapshot ids.
+        """
+        connection = self.connection()
+        snapshot_ids = []
+        with self.write_lock:
+            # Blobs become known only once their transaction is committed
+            self.pending_blobs = set()
+            with connection:
+                for received_at, data in items:
+                    received_at = (received_at or datetime.now()).isoformat(timespec="seconds")
+                    snapshot_ids.append(self.insert_report(connection, data, received_at))
+            self.known_blobs |= self.pending_blobs
+        return snapshot_ids
+
+    def insert_report(self, connection, data, received_at):
+        system_info = data.get("system_info", {})
+        key = host_id(data)
+        connection.execute(
+            "INSERT INTO hosts (host_key, node_name, mac_address, system, release, first_seen, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            # A report older than the last one (e.g. a spooled report sent late) does not replace the host's details
+            "ON CONFLICT(host_key) DO UPDATE SET "
+            "node_name = CASE WHEN excluded.last_seen >= last_seen THEN excluded.node_name ELSE node_name END, "
+            "system = CASE WHEN excluded.last_seen >= last_seen THEN excluded.system ELSE system END, "
+            "release = CASE WHEN excluded.last_seen >= last_seen THEN excluded.release ELSE release END, "
+            "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)",
+            (key, system_info.get("Node Name"), system_info.get("MAC Address"), system_info.get("System"),
+             system_info.get("Release"), received_at, received_at)
+        )
+        host = connection.execute("SELECT id FROM hosts WHERE host_key = ?", (key,)).fetchone()[0]
+
+        # Sections already seen are neither written again nor expanded into rows
+        stored, blobs = split_sections(data)
+        software_hash = None
+        for digest, (section, encoded) in blobs.items():
+            if section == "software_list":
+                software_hash = digest
+            if digest in self.known_blobs or digest in self.pending_blobs:
+                continue
+            cursor = connection.execute("INSERT OR IGNORE INTO blobs (hash, section, data) VALUES (?, ?, ?)",
+                                        (digest, section, encoded))
+            # Another process may have stored the blob since it was last seen here
+            if section == "software_list" and cursor.rowcount:
+                connection.executemany(
+                    "INSERT INTO software (blob_hash, name, version, vendor) VALUES (?, ?, ?, ?)",
+                    [(digest, s.get("Name"), s.get("Version"), s.get("Vendor"))
+                     for s in data["software_list"] if isinstance(s, dict)]
+                )
+            self.pending_blobs.add(digest)
+
+        cursor = connection.execute(
+            "INSERT INTO snapshots (host_id, received_at, hash, software_hash, data) VALUES (?, ?, ?, ?, ?)",
+            (host, received_at, snapshot_hash(data), software_hash, encode_json(stored))
+        )
+        snapshot_id = cursor.lastrowid
+        # The latest snapshot only moves forward in time
+        connection.execute(
+            "UPDATE hosts SET latest_snapshot_id = ? WHERE id = ? AND (latest_snapshot_id IS NULL OR "
+            "(SELECT received_at FROM snapshots WHERE id = hosts.latest_snapshot_id) <= ?)",
+            (snapshot_id, host, received_at)
+        )
+        return snapshot_id
+
+    def iter_reports(self):
+        """
+        Yields (received_at, data) for every stored snapshot, oldest first.
+        """
+        cursor = self.connection().execute("SELECT received_at, data FROM snapshots ORDER BY id")
+        for received_at, data in cursor:
+            yield datetime.fromisoformat(received_at), join_sections(json.loads(data), self.load_blob)
+
+    def iter_latest_reports(self, since=None):
+        """
+        Yields (received_at, data) for the latest snapshot of every host (received at or after since, if given).
+        """
+        query = "SELECT s.received_at, s.data FROM hosts h JOIN snapshots s ON s.id = h.latest_snapshot_id"
+        params = []
+        if since is not None:
+            query += " WHERE s.received_at >= ?"
+            params.append(since.isoformat())
+        cursor = self.connection().execute(query, params)
+        for received_at, data in cursor:
+            yield datetime.fromisoformat(received_at), join_sections(json.loads(data), self.load_blob)
+
+    def find_hosts_with_software(self, name, version=None):
+        """
+        Returns the hosts whose latest snapshot contains the given software (and version).
+        """
+        query = ("SELECT DISTINCT h.node_name, h.mac_address, sw.version FROM hosts h "
+                 "JOIN snapshots s ON s.id = h.latest_snapshot_id "
+                 "JOIN software sw ON sw.blob_hash = s.software_hash WHERE sw.name = ?")
+        params = [name]
+        if version is not None:
+            query += " AND sw.version = ?"
+            params.append(version)
+        return [{"Node Name": node_name, "MAC Address": mac_address, "Version": software_version}
+                for node_name, mac_address, software_version in self.connection().execute(query, params)]
+
+
+def list_report_files(data_dir):
+    """
+    Returns (path, received_at) of the report files in a data directory and its shards, oldest first.
+    Only <NodeName>_<timestamp>[_<n>].json files are reports; the time is taken from the file name.
+    """
+    files = []
+    for name, path, _ in iter_shard_files(data_dir):
+        match = REPORT_FILE_NAME.fullmatch(name)
+        if not match or not os.path.isfile(path):
+            continue
+        files.append((path, datetime.strptime(match.group(1), FILE_TIMESTAMP)))
+    return sorted(files, key=lambda item: item[1])
+
+
+def list_latest_files(latest_dir):
+    """
+    Returns the paths of the latest snapshot files of the hosts: <shard>/<host>.json, or <host>.json
+    for a host whose snapshot was written before they were sharded.
+    """
+    files = []
+    for name, path, sharded in iter_shard_files(latest_dir):
+        if not name.endswith(".json"):
+            continue
+        if not sharded and os.path.exists(os.path.join(latest_dir, shard_of(name[:-len(".json")]), name)):
+            continue
+        files.append(path)
+    return files
+
+
+def import_json_directory(data_dir, storage, batch_size=500):
+    """
+    One-shot import of an existing directory of JSON reports into a storage backend.
+    Returns the number of imported reports.
+    """
+    imported = 0
+    batch = []
+    for received_at, data in JsonFileStorage(data_dir).iter_reports():
+        batch.append((received_at, data))
+        if len(batch) >= batch_size:
+            storage.save_batch(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        storage.save_batch(batch)
+        imported += len(batch)
+    return imported
+
+
+def create_storage(backend, data_dir, db_path=None):
+    """
+    Returns the storage backend selected by name ("json", "sqlite" or "history").
+    """
+    if backend == "sqlite":
+        return SQLiteStorage(db_path or os.path.join(data_dir, "assets.db"))
+    if backend == "json":
+        return JsonFileStorage(data_dir)
+    if backend == "history":
+        from history import HistoryStore
+        return HistoryStore(os.path.join(data_dir, "history"))
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a directory of JSON reports into the SQLite database.")
+    parser.add_argument("data_dir", help="Directory containing <NodeName>_<timestamp>.json reports")
+    parser.add_argument("--db", help="SQLite database path (default: <data_dir>/assets.db)")
+    args = parser.parse_args()
+
+    count = import_json_directory(args.data_dir, create_storage("sqlite", args.data_dir, args.db))
+    print(f"Imported {count} reports")
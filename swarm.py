@@ -0,0 +1,422 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from bench import directory_size, percentile
+from transport import encode_payload
+
+# Load generator for server.py: simulates thousands of agents with asyncio and reports throughput,
+# latency percentiles, error rates and the growth of the server's data directory.
+# Usage: python swarm.py --spawn --agents 2000 --duration 120 --pattern burst [--output swarm.json]
+#        python swarm.py --url http://host:5000 --data-dir /srv/assets/data ...
+#        python swarm.py --spawn --processes 4 --verify ...  (no report lost across several worker processes)
+
+# Check-in patterns: when the agents report within the run
+PATTERNS = ("burst", "steady", "diurnal")
+# Width in seconds of the window in which all agents report in the burst pattern
+BURST_WINDOW = 1.0
+# Size of the software catalog the hosts' long tail is drawn from
+CATALOG_SIZE = 20000
+# Seconds given to the worker processes to apply each other's reports before --verify queries them
+VERIFY_SYNC_SECONDS = 5
+
+
+class SyntheticHost:
+    """
+    One simulated agent: a stable identity and an inventory made of software shared by every host
+    (overlap) and software of its own, a fraction of which changes between two reports (change_rate).
+    """
+
+    def __init__(self, number, software_count, overlap, change_rate, rng):
+        self.number = number
+        self.change_rate = change_rate
+        self.rng = rng
+        self.system_info = {
+            "System": "Windows", "Node Name": f"SWARM-{number:06d}", "Release": "10", "Version": "10.0.19045",
+            "Machine": "AMD64", "Processor": "Intel64 Family 6 Model 158 Stepping 10, GenuineIntel",
+            "MAC Address": f"02:5a:{number >> 24 & 255:02x}:{number >> 16 & 255:02x}:"
+                           f"{number >> 8 & 255:02x}:{number & 255:02x}"
+        }
+        shared = int(software_count * overlap)
+        self.software = {f"Common Package {n}": self.package(n, 0) for n in range(shared)}
+        while len(self.software) < software_count:
+            n = rng.randrange(CATALOG_SIZE)
+            self.software[f"Package {n}"] = self.package(n, rng.randrange(5))
+
+    @staticmethod
+    def package(n, release):
+        return {"Version": f"{n % 9 + 1}.{release}.{n % 97}", "Vendor": f"Vendor {n % 300}"}
+
+    def change(self):
+        """
+        Applies the changes of one reporting interval: updates, installs and uninstalls.
+        """
+        for _ in range(int(len(self.software) * self.change_rate + self.rng.random())):
+            name = self.rng.choice(list(self.software))
+            action = self.rng.random()
+            if action < 0.6:
+                version = self.software[name]["Version"].split(".")
+                version[1] = str(int(version[1]) + 1)
+                self.software[name] = dict(self.software[name], Version=".".join(version))
+            elif action < 0.8 and not name.startswith("Common"):
+                del self.software[name]
+            else:
+                n = self.rng.randrange(CATALOG_SIZE)
+                self.software[f"Package {n}"] = self.package(n, 0)
+
+    def report(self):
+        """
+        Returns the next collected_data document of this host.
+        """
+        self.change()
+        return {
+            "system_info": self.system_info,
+            "hardware_info": {"CPU": "Intel64 Family 6", "RAM": "16.00 GB",
+                              "Disk": {"Total": "475.69 GB", "Used": "201.13 GB", "Free": "274.56 GB"}},
+            "security_software": ["Sophos Anti-Virus", "Windows Defender Firewall"],
+            "running_processes": [{"Name": f"process{i}.exe", "PID": self.rng.randrange(65536),
+                                   "Session": "Console", "Memory KB": self.rng.randrange(1000, 500000)}
+                                  for i in range(80)],
+            "software_list": [dict(values, Name=name) for name, values in self.software.items()]
+        }
+
+
+def schedule(pattern, agents, duration, interval, rng):
+    """
+    Returns the (time offset, agent number) of every report of the run, in time order.
+    burst: every agent reports at the start of each interval, within BURST_WINDOW seconds.
+    steady: every agent reports once per interval, at its own offset.
+    diurnal: reports follow a day-shaped rate, low at the start and end of the run and peaking in the middle.
+    """
+    reports_per_agent = max(1, int(duration // interval))
+    events = []
+    for agent in range(agents):
+        if pattern == "burst":
+            times = [k * interval + rng.uniform(0, BURST_WINDOW) for k in range(reports_per_agent)]
+        elif pattern == "steady":
+            offset = rng.uniform(0, interval)
+            times = [k * interval + offset for k in range(reports_per_agent)]
+        else:
+            times = []
+            while len(times) < reports_per_agent:
+                t = rng.uniform(0, duration)
+                if rng.random() < (1 - math.cos(2 * math.pi * t / duration)) / 2:
+                    times.append(t)
+        events.extend((t, agent) for t in times)
+    events.sort()
+    return events
+
+
+async def post(host, port, path, body, headers, timeout):
+    """
+    Sends one HTTP/1.1 POST on a new connection and returns the status code and response body.
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        head = [f"POST {path} HTTP/1.1", f"Host: {host}:{port}", f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("ascii") + body)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    parts = status_line.split()
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise ConnectionError(f"Invalid response: {status_line[:80]!r}")
+    return int(parts[1]), rest.partition(b"\r\n\r\n")[2]
+
+
+async def get(host, port, path, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split()[1]), rest.partition(b"\r\n\r\n")[2]
+
+
+class Swarm:
+    """
+    Runs the agents' reports against the server and records the outcome of every request.
+    """
+
+    def __init__(self, url, hosts, encoding, concurrency, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.path = (parts.path.rstrip("/") or "") + "/api/asset"
+        self.hosts = hosts
+        self.encoding = encoding
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.latencies = []
+        self.lags = []      # Seconds a report waited for a free connection slot
+        self.outcomes = {}  # "202", "503", "timeout", "connection error", ... -> count
+        self.sent_bytes = 0
+        self.completed = []  # Completion time of every accepted report, relative to the start
+        self.accepted_hosts = set()
+
+    async def send(self, agent, due, start):
+        async with self.semaphore:
+            self.lags.append(max(0.0, time.perf_counter() - start - due))
+            payload, encoding = encode_payload(self.hosts[agent].report(), self.encoding)
+            headers = {"Content-Type": "application/json", "Content-Encoding": encoding}
+            self.sent_bytes += len(payload)
+            request_start = time.perf_counter()
+            try:
+                status, _ = await post(self.host, self.port, self.path, payload, headers, self.timeout)
+                outcome = str(status)
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+            except (ConnectionError, OSError):
+                outcome = "connection error"
+            now = time.perf_counter()
+            self.latencies.append((now - request_start) * 1000)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome in ("200", "202"):
+                self.completed.append(now - start)
+                self.accepted_hosts.add(agent)
+
+    async def run(self, events):
+        start = time.perf_counter()
+        tasks = []
+        for due, agent in events:
+            delay = due - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(self.send(agent, due, start)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    async def queue_depth(self):
+        """
+        Returns the server's ingest queue depth from /metrics, or None when it is not available.
+        """
+        try:
+            status, body = await get(self.host, self.port, "/metrics", self.timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        if status != 200:
+            return None
+        for line in body.decode("utf-8", errors="replace").splitlines():
+            if line.startswith("asset_ingest_queue_depth"):
+                return float(line.split()[-1])
+        return None
+
+    async def drain(self, max_wait=600):
+        """
+        Waits until the server has written its queued reports. Returns the seconds waited.
+        """
+        start = time.perf_counter()
+        while time.perf_counter() - start < max_wait:
+            depth = await self.queue_depth()
+            if not depth:
+                break
+            await asyncio.sleep(0.5)
+        return time.perf_counter() - start
+
+
+def throughput_series(completed, elapsed):
+    """
+    Returns the number of accepted reports per second of the run.
+    """
+    series = [0] * (int(elapsed) + 1)
+    for moment in completed:
+        series[min(int(moment), len(series) - 1)] += 1
+    return series
+
+
+def spawn_server(port, data_dir, storage, processes=1):
+    """
+    Starts server.py (cluster.py with several processes) on a fresh data directory and waits until it answers.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, ASSET_SERVER_DATA_DIR=data_dir, ASSET_SERVER_STORAGE=storage,
+               ASSET_SERVER_PORT=str(port))
+    if processes > 1:
+        command = [sys.executable, os.path.join(directory, "cluster.py"), "--host", "127.0.0.1",
+                   "--processes", str(processes)]
+    else:
+        command = [sys.executable, os.path.join(directory, "server.py")]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with code {process.returncode}")
+        try:
+            status, _ = asyncio.run(get("127.0.0.1", port, "/metrics", 1))
+            if status == 200:
+                return process
+        except (asyncio.TimeoutError, OSError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("server.py did not start within 30s")
+
+
+def run(args):
+    """
+    Runs the swarm against the server. Returns the result and the Swarm, for verify.
+    """
+    rng = random.Random(args.seed)
+    print(f"Preparing {args.agents} agents...", file=sys.stderr)
+    hosts = [SyntheticHost(i, args.software, args.overlap, args.change_rate, random.Random(rng.random()))
+             for i in range(args.agents)]
+    events = schedule(args.pattern, args.agents, args.duration, args.interval, rng)
+
+    async def main():
+        swarm = Swarm(args.url, hosts, args.encoding, args.concurrency, args.timeout)
+        disk_before = directory_size(args.data_dir) if args.data_dir else None
+        print(f"Sending {len(events)} reports over {args.duration}s ({args.pattern})...", file=sys.stderr)
+        elapsed = await swarm.run(events)
+        drain = await swarm.drain()
+        return swarm, elapsed, drain, disk_before
+
+    swarm, elapsed, drain, disk_before = asyncio.run(main())
+    latencies = sorted(swarm.latencies)
+    lags = sorted(swarm.lags)
+    total = sum(swarm.outcomes.values())
+    accepted = sum(count for outcome, count in swarm.outcomes.items() if outcome in ("200", "202"))
+    series = throughput_series(swarm.completed, elapsed)
+    result = {
+        "reports": total,
+        "accepted": accepted,
+        "elapsed_s": round(elapsed, 3),
+        "drain_s": round(drain, 3),
+        "accepted_per_s": round(accepted / elapsed, 1) if elapsed else 0.0,
+        "peak_accepted_per_s": max(series) if series else 0,
+        "latency_p50_ms": round(percentile(latencies, 50), 3),
+        "latency_p95_ms": round(percentile(latencies, 95), 3),
+        "latency_p99_ms": round(percentile(latencies, 99), 3),
+        "latency_max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "schedule_lag_p95_s": round(percentile(lags, 95), 3),
+        "error_rate": round((total - accepted) / total, 4) if total else 0.0,
+        "outcomes": dict(sorted(swarm.outcomes.items())),
+        "sent_bytes": swarm.sent_bytes,
+        "accepted_per_s_series": series
+    }
+    if args.data_dir:
+        disk_after = directory_size(args.data_dir)
+        result.update({"disk_before_bytes": disk_before, "disk_after_bytes": disk_after,
+                       "disk_growth_bytes": disk_after - disk_before,
+                       "disk_bytes_per_report": round((disk_after - disk_before) / accepted, 1) if accepted else None})
+    return result, swarm
+
+
+def indexed_host_counts(swarm, requests):
+    """
+    Returns the number of hosts in the aggregates of the server, from several requests
+    (spread over the worker processes by the kernel).
+    """
+    async def fetch():
+        counts = []
+        for _ in range(requests):
+            try:
+                status, body = await get(swarm.host, swarm.port, "/api/aggregates", swarm.timeout)
+            except (asyncio.TimeoutError, OSError):
+                continue
+            if status == 200:
+                counts.append(json.loads(body)["hosts"])
+        return counts
+    return asyncio.run(fetch())
+
+
+def count_stored_reports(data_dir, storage_backend):
+    """
+    Returns the number of reports and of hosts in the storage of a stopped server.
+    """
+    from storage import create_storage
+    storage = create_storage(storage_backend, data_dir, os.path.join(data_dir, "assets.db"))
+    reports = sum(1 for _ in storage.iter_reports())
+    hosts = sum(1 for _ in storage.iter_latest_reports())
+    return reports, hosts
+
+
+def verify(result, swarm, counts, stored):
+    """
+    Compares what the server stored and indexed with what it accepted. Returns the list of problems found.
+    """
+    accepted, hosts = result["accepted"], len(swarm.accepted_hosts)
+    result["verify"] = {"accepted": accepted, "stored": stored[0], "hosts": hosts, "stored_hosts": stored[1],
+                        "indexed_hosts": sorted(set(counts))}
+    problems = []
+    if stored[0] != accepted:
+        problems.append(f"{accepted} reports accepted but {stored[0]} stored")
+    if stored[1] != hosts:
+        problems.append(f"{hosts} hosts accepted but {stored[1]} stored")
+    if not counts or set(counts) != {hosts}:
+        problems.append(f"{hosts} hosts accepted but the workers index {sorted(set(counts))}")
+    result["verify"]["problems"] = problems
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a fleet of agents reporting to server.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Base URL of the server")
+    parser.add_argument("--spawn", action="store_true", help="Start a local server.py on a temporary data directory")
+    parser.add_argument("--port", type=int, default=5055, help="Port of the spawned server")
+    parser.add_argument("--storage", default="sqlite", choices=["sqlite", "json", "history"],
+                        help="Storage backend of the spawned server")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes of the spawned server (runs cluster.py when above 1)")
+    parser.add_argument("--verify", action="store_true",
+                        help="With --spawn, check that every accepted report was stored and indexed by every worker")
+    parser.add_argument("--data-dir", help="Data directory of the server, to measure its growth")
+    parser.add_argument("--agents", type=int, default=1000, help="Number of simulated agents")
+    parser.add_argument("--duration", type=float, default=60, help="Length of the run in seconds")
+    parser.add_argument("--interval", type=float, default=30, help="Seconds between two reports of an agent")
+    parser.add_argument("--pattern", default="steady", choices=PATTERNS, help="Check-in pattern")
+    parser.add_argument("--software", type=int, default=300, help="Software entries per host")
+    parser.add_argument("--overlap", type=float, default=0.8, help="Fraction of software shared by all hosts")
+    parser.add_argument("--change-rate", type=float, default=0.01,
+                        help="Fraction of a host's software that changes between two reports")
+    parser.add_argument("--encoding", default="gzip", choices=["gzip", "zstd", "identity"], help="Payload encoding")
+    parser.add_argument("--concurrency", type=int, default=500, help="Maximum number of requests in flight")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the machine-readable report to this file")
+    args = parser.parse_args()
+
+    if args.verify and not args.spawn:
+        parser.error("--verify needs --spawn, on a fresh data directory")
+    server = None
+    if args.spawn:
+        args.data_dir = args.data_dir or tempfile.mkdtemp(prefix="swarm_server_")
+        args.url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args.port, args.data_dir, args.storage, args.processes)
+    try:
+        result, swarm = run(args)
+        if args.verify:
+            time.sleep(VERIFY_SYNC_SECONDS)
+            counts = indexed_host_counts(swarm, 4 * args.processes)
+    finally:
+        if server is not None:
+            server.terminate()  # Lets the workers write their queued reports
+            server.wait()
+    problems = []
+    if args.verify:
+        problems = verify(result, swarm, counts, count_stored_reports(args.data_dir, args.storage))
+
+    report = {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "args": vars(args)},
+        "results": {f"swarm.{args.pattern}.{args.storage if args.spawn else 'remote'}": result}
+    }
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+    for problem in problems:
+        print(f"Verification failed: {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
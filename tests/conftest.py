@@ -0,0 +1,34 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, "fixtures")
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """
+    The server module, imported once with its data directory in a temporary directory.
+    """
+    pytest.importorskip("flask")
+    os.environ["ASSET_SERVER_DATA_DIR"] = str(tmp_path_factory.mktemp("server"))
+    return importlib.import_module("server")
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def make_report(node, software=(), **sections):
+    """
+    Returns a minimal collected_data document of a host.
+    """
+    report = {"system_info": {"Node Name": node, "OS Name": "Microsoft Windows 11 Pro"}}
+    report.update(sections)
+    report["software_list"] = [{"Name": name, "Version": version, "Vendor": "Vendor"} for name, version in software]
+    return report
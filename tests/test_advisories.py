@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from advisories import AdvisoryFeed, ProductRanges, normalize_product, normalize_vendor, parse_version
+
+FEED = [
+    {"id": "ADV-1", "vendor": "Mozilla Foundation", "product": "Firefox", "severity": "high",
+     "affected": [{"introduced": "100.0", "fixed": "115.0.3"}, {"versions": ["78.0.1"]}]},
+    {"id": "ADV-2", "vendor": "Mozilla", "product": "Firefox", "affected": [{"last_affected": "91.2"}]},
+    {"id": "ADV-3", "vendor": "Igor Pavlov", "product": "7-Zip", "affected": [{"introduced": "23.0"}]}
+]
+
+
+@pytest.mark.parametrize("text, expected", [("115.0.3", (115, 0, 3)), ("2.0.0", (2,)), ("v1_2", (1, 2)),
+                                            ("N/A", None), ("", None)])
+def test_parse_version(text, expected):
+    assert parse_version(text) == expected
+
+
+def test_normalize_names():
+    assert normalize_vendor("Microsoft Corporation") == "microsoft"
+    assert normalize_vendor("N/A") == ""
+    assert normalize_product("Mozilla Firefox (x64 en-US) 118.0", "mozilla") == "firefox"
+
+
+@pytest.mark.parametrize("name, version, vendor, expected", [
+    ("Mozilla Firefox (x64 en-US)", "110.0", "Mozilla", ("ADV-1",)),
+    ("Mozilla Firefox (x64 en-US)", "115.0.3", "Mozilla", ()),
+    ("Firefox", "115.0.2", "N/A", ("ADV-1",)),
+    ("Firefox", "78.0.1", "Mozilla", ("ADV-1", "ADV-2")),
+    ("Firefox", "91.2", "Mozilla", ("ADV-2",)),
+    ("Firefox", "110.0", "Another Vendor", ()),
+    ("7-Zip 23.01 (x64)", "23.01", "Igor Pavlov", ("ADV-3",)),
+    ("7-Zip 22.01 (x64)", "22.01", "Igor Pavlov", ()),
+    ("Firefox", "N/A", "Mozilla", ())
+])
+def test_feed_match(name, version, vendor, expected):
+    assert AdvisoryFeed(FEED).match(name, version, vendor) == expected
+
+
+def test_lookup_matches_a_linear_scan():
+    rng = random.Random(7)
+
+    def version():
+        return tuple(rng.randint(0, 9) for _ in range(rng.randint(1, 3)))
+
+    for _ in range(200):
+        intervals = [(rng.choice([None, version()]), rng.choice([None, version()]), rng.random() < 0.5, f"ADV-{i}")
+                     for i in range(rng.randint(0, 30))]
+        ranges = ProductRanges(intervals)
+        for _ in range(20):
+            probe = version()
+            expected = {advisory for start, end, end_inclusive, advisory in intervals
+                        if (start is None or start <= probe)
+                        and (end is None or probe < end or (probe == end and end_inclusive))}
+            assert ranges.lookup(probe) == expected
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import make_report
+
+
+def ndjson(records):
+    return "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+
+
+def test_naive_collected_at_is_kept(server):
+    received_at, data = server.parse_bulk_record({"collected_at": "2026-03-01T08:30:00", "report": {"a": 1}})
+    assert received_at == datetime(2026, 3, 1, 8, 30)
+    assert data == {"a": 1}
+
+
+def test_aware_collected_at_is_converted_to_local_time(server):
+    aware = datetime(2026, 3, 1, 8, 30, tzinfo=timezone(timedelta(hours=5)))
+    received_at, _ = server.parse_bulk_record({"collected_at": aware.isoformat(), "report": {}})
+    assert received_at.tzinfo is None
+    assert received_at == aware.astimezone().replace(tzinfo=None)
+
+
+@pytest.mark.parametrize("collected_at", ["yesterday", 1709281800])
+def test_malformed_collected_at_is_a_payload_error(server, collected_at):
+    with pytest.raises(server.PayloadError):
+        server.parse_bulk_record({"collected_at": collected_at, "report": {}})
+
+
+def test_record_without_envelope(server):
+    assert server.parse_bulk_record({"system_info": {}}) == (None, {"system_info": {}})
+
+
+def test_bulk_upload_with_mixed_times(server, client):
+    aware = datetime(2026, 2, 1, 12, 0, tzinfo=timezone.utc)
+    body = ndjson([
+        {"collected_at": "2026-02-01T09:00:00", "report": make_report("bulk-naive-pc")},
+        {"collected_at": aware.isoformat(), "report": make_report("bulk-aware-pc")},
+        {"collected_at": "not a date", "report": make_report("bulk-invalid-pc")},
+        make_report("bulk-plain-pc")
+    ])
+
+    response = client.post("/api/assets/bulk", data=body, content_type="application/x-ndjson")
+
+    summary = response.get_json()
+    assert response.status_code == 200
+    assert (summary["received"], summary["accepted"], summary["rejected"]) == (4, 3, 1)
+    assert summary["errors"] == [{"line": 3, "error": "Invalid collected_at: expected an ISO 8601 date"}]
+    hosts = server.fleet_index.hosts
+    assert hosts["bulk-naive-pc"]["received_at"] == "2026-02-01T09:00:00"
+    assert hosts["bulk-aware-pc"]["received_at"] == \
+        aware.astimezone().replace(tzinfo=None).isoformat(timespec="seconds")
+    assert "bulk-invalid-pc" not in hosts
+    assert "bulk-plain-pc" in hosts
@@ -0,0 +1,37 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+# End-to-end check of cluster.py: a swarm of agents reports to several worker processes sharing one
+# data directory, then swarm.py --verify compares what was accepted with what was stored and indexed.
+
+pytest.importorskip("flask")
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="cluster.py needs a POSIX system")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize("storage", ["sqlite", "json"])
+def test_cluster_loses_no_report(storage, tmp_path):
+    command = [sys.executable, os.path.join(ROOT, "swarm.py"), "--spawn", "--verify", "--processes", "3",
+               "--storage", storage, "--port", str(free_port()), "--data-dir", str(tmp_path),
+               "--agents", "60", "--duration", "4", "--interval", "1", "--software", "40", "--concurrency", "50"]
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr
+
+    result = next(iter(json.loads(completed.stdout)["results"].values()))
+    assert result["accepted"] > 0
+    assert result["verify"]["problems"] == []
+    assert result["verify"]["stored"] == result["accepted"]
+    assert result["verify"]["stored_hosts"] == result["verify"]["hosts"] > 0
+    assert result["verify"]["indexed_hosts"] == [result["verify"]["hosts"]]
@@ -0,0 +1,64 @@
+from conftest import make_report
+from delta import apply_delta, make_delta, snapshot_hash
+
+
+def test_delta_round_trip():
+    base = make_report("delta-pc", [("Firefox", "115.0"), ("7-Zip", "23.01"), ("Git", "2.42")],
+                       user_accounts=["admin"], security_software=["Defender"])
+    data = make_report("delta-pc", [("Firefox", "118.0"), ("Git", "2.42"), ("Python", "3.12")],
+                       user_accounts=["admin", "guest"])
+
+    delta = make_delta(base, data)
+
+    assert delta["removed_sections"] == ["security_software"]
+    assert delta["software"]["changed"] == [{"Name": "Firefox", "Version": "118.0", "Vendor": "Vendor",
+                                             "Previous Version": "115.0"}]
+    assert [s["Name"] for s in delta["software"]["added"]] == ["Python"]
+    assert [s["Name"] for s in delta["software"]["removed"]] == ["7-Zip"]
+    rebuilt = apply_delta(base, delta)
+    assert snapshot_hash(rebuilt) == delta["hash"] == snapshot_hash(data)
+    assert list(rebuilt)[-1] == "software_list"
+
+
+def test_hash_ignores_software_order():
+    data = make_report("order-pc", [("Firefox", "118.0"), ("Git", "2.42")])
+    reordered = dict(data, software_list=data["software_list"][::-1])
+    assert snapshot_hash(reordered) == snapshot_hash(data)
+
+
+def test_delta_upload(server, client):
+    base = make_report("delta-upload-pc", [("Firefox", "115.0"), ("Git", "2.42")])
+    data = make_report("delta-upload-pc", [("Firefox", "118.0"), ("Git", "2.42")])
+    response = client.post("/api/asset", json=base)
+    assert response.status_code == 202
+    assert response.get_json()["snapshot_hash"] == snapshot_hash(base)
+
+    response = client.post("/api/asset/delta", json=make_delta(base, data))
+
+    assert response.status_code == 202
+    assert response.get_json()["snapshot_hash"] == snapshot_hash(data)
+    assert server.get_latest_snapshot("delta-upload-pc") == (snapshot_hash(data), data)
+
+
+def test_delta_hash_mismatch_asks_for_full_snapshot(server, client):
+    base = make_report("mismatch-pc", [("Firefox", "115.0")])
+    data = make_report("mismatch-pc", [("Firefox", "118.0")])
+    assert client.post("/api/asset", json=base).status_code == 202
+
+    delta = make_delta(base, data)
+    delta["hash"] = snapshot_hash(make_report("mismatch-pc", [("Firefox", "119.0")]))
+    response = client.post("/api/asset/delta", json=delta)
+
+    assert response.status_code == 409
+    assert response.get_json()["resend"] == "full"
+    assert server.get_latest_snapshot("mismatch-pc")[0] == snapshot_hash(base)
+
+
+def test_delta_on_unknown_base_asks_for_full_snapshot(client):
+    base = make_report("unknown-base-pc", [("Firefox", "115.0")])
+    data = make_report("unknown-base-pc", [("Firefox", "118.0")])
+
+    response = client.post("/api/asset/delta", json=make_delta(base, data))
+
+    assert response.status_code == 409
+    assert response.get_json()["resend"] == "full"
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import make_report
+from history import HistoryStore, retention_period
+
+NOW = datetime(2026, 3, 10, 12, 0)
+HOSTS = ["history-pc-1", "history-pc-2"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    History of two hosts reporting every 20 minutes for four days, spread over several segments.
+    """
+    store = HistoryStore(str(tmp_path), segment_max_bytes=4096)
+    moment = NOW - timedelta(days=4)
+    i = 0
+    while moment <= NOW:
+        store.save_batch([(moment, make_report(host, [("App", f"1.{i // 3}"), ("Tool", "2.0")],
+                                               user_accounts=[f"user{i % 5}"]))
+                          for host in HOSTS])
+        moment += timedelta(minutes=20)
+        i += 1
+    assert len(store.all_segments()) > 2
+    return store
+
+
+def times(store, host):
+    return [received_at for received_at, _ in store.iter_snapshots(host)]
+
+
+def test_as_of_before_compaction(store):
+    for host in HOSTS:
+        snapshots = list(store.iter_snapshots(host))
+        assert len(snapshots) == 4 * 72 + 1
+        for received_at, data in snapshots[::7]:
+            assert store.as_of(host, received_at) == (received_at, data)
+            assert store.as_of(host, received_at + timedelta(minutes=10)) == (received_at, data)
+        assert store.as_of(host) == snapshots[-1]
+        assert store.as_of(host, snapshots[0][0] - timedelta(seconds=1)) is None
+
+
+def test_as_of_after_compaction(store, tmp_path):
+    before = {host: dict(store.iter_snapshots(host)) for host in HOSTS}
+
+    kept = store.compact(NOW)
+
+    assert [segment.name for segment in store.all_segments()] == ["compact-%08d" % store.sequence]
+    for host in HOSTS:
+        kept_times = times(store, host)
+        recent = [moment for moment in before[host] if NOW - moment < timedelta(days=2)]
+        old = [moment for moment in before[host] if NOW - moment >= timedelta(days=2)]
+        # Recent history is kept in full, older history keeps the last snapshot of each hour
+        last_of_period = {}
+        for moment in old:
+            last_of_period[retention_period(moment, NOW)] = moment
+        assert kept_times == sorted(last_of_period.values()) + recent
+        for moment in before[host]:
+            expected = max((kept for kept in kept_times if kept <= moment), default=None)
+            if expected is None:
+                assert store.as_of(host, moment) is None  # Thinned away, the hour's last snapshot is later
+            else:
+                assert store.as_of(host, moment) == (expected, before[host][expected])
+    assert kept == sum(len(times(store, host)) for host in HOSTS)
+
+    # The compacted segment is read back the same way after a restart, with the reports received since
+    latest = make_report(HOSTS[0], [("App", "9.0")])
+    store.save(latest, NOW + timedelta(minutes=5))
+    reopened = HistoryStore(str(tmp_path))
+    assert reopened.as_of(HOSTS[0], NOW) == (NOW, before[HOSTS[0]][NOW])
+    assert reopened.as_of(HOSTS[0]) == (NOW + timedelta(minutes=5), latest)
+    assert reopened.as_of(HOSTS[1]) == (NOW, before[HOSTS[1]][NOW])
+
+
+def test_as_of_unknown_host(store):
+    assert store.as_of("history-pc-3") is None
+    store.compact(NOW)
+    assert store.as_of("history-pc-3") is None
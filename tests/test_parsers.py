@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from parsers import parse_int, parse_ipconfig, parse_netstat, parse_tasklist, parse_wmic_qfe
+
+
+def fixture_lines(name, line_end=None):
+    """
+    Returns the lines of a captured command output, as read from a pipe (line ends kept).
+    """
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8", newline="") as file:
+        lines = file.readlines()
+    if line_end is not None:
+        lines = [line.rstrip("\r\n") + line_end for line in lines]
+    return lines
+
+
+@pytest.mark.parametrize("text, expected", [("3,120 K", 3120), ("8 K", 8), ("", None), ("N/A", None)])
+def test_parse_int(text, expected):
+    assert parse_int(text) == expected
+
+
+@pytest.mark.parametrize("line_end", ["\n", "\r\n"])
+def test_parse_tasklist(line_end):
+    processes = list(parse_tasklist(fixture_lines("tasklist.txt", line_end)))
+
+    assert len(processes) == 13
+    assert processes[0] == {"Name": "System Idle Process", "PID": 0, "Session": "Services", "Memory KB": 8}
+    assert processes[-1] == {"Name": "tasklist.exe", "PID": 9904, "Session": "Console", "Memory KB": 9876}
+    assert {"Name": "chrome.exe", "PID": 7344, "Session": "Console", "Memory KB": 245612} in processes
+
+
+def test_parse_netstat():
+    connections = list(parse_netstat(fixture_lines("netstat_an.txt")))
+
+    assert len(connections) == 10
+    assert connections[3] == {"Proto": "TCP", "Local": "192.168.25.10:49712", "Remote": "52.96.165.18:443",
+                              "State": "ESTABLISHED"}
+    assert connections[-1] == {"Proto": "UDP", "Local": "[::]:500", "Remote": "*:*"}
+    assert sum(1 for connection in connections if connection.get("State") == "LISTENING") == 5
+
+
+def test_parse_wmic_qfe():
+    # wmic ends its lines with \r\r\n
+    updates = list(parse_wmic_qfe(fixture_lines("wmic_qfe_list_brief.txt")))
+
+    assert updates == [
+        {"HotFixID": "KB5031988", "Description": "Update", "InstalledOn": "11/15/2023",
+         "InstalledBy": "NT AUTHORITY\\SYSTEM"},
+        {"HotFixID": "KB5032189", "Description": "Security Update", "InstalledOn": "11/15/2023",
+         "InstalledBy": "NT AUTHORITY\\SYSTEM"},
+        {"HotFixID": "KB5011048", "Description": "Update", "InstalledOn": "3/2/2022",
+         "InstalledBy": "P10241201-PC\\admin"}
+    ]
+
+
+@pytest.mark.parametrize("line_end", ["\n", "\r\n"])
+def test_parse_ipconfig(line_end):
+    ethernet, wifi = parse_ipconfig(fixture_lines("ipconfig_all.txt", line_end))
+
+    assert ethernet == {
+        "Adapter": "Ethernet adapter Ethernet",
+        "Description": "Intel(R) Ethernet Connection (7) I219-LM",
+        "Physical Address": "00-0A-CD-43-71-0C",
+        "DHCP Enabled": "Yes",
+        "Link-local IPv6 Address": ["fe80::1c2d:3e4f:5a6b:7c8d%12"],
+        "IPv4 Address": ["192.168.25.10"],
+        "Subnet Mask": ["255.255.255.0"],
+        "Default Gateway": ["192.168.25.1"],
+        "DNS Servers": ["192.168.25.2", "192.168.25.3"]
+    }
+    assert wifi["Media State"] == "Media disconnected"
+    assert "IPv4 Address" not in wifi
+
+
+def test_parsers_read_lines_lazily():
+    lines = iter(fixture_lines("tasklist.txt"))
+    processes = parse_tasklist(lines)
+
+    assert next(processes)["Name"] == "System Idle Process"
+    assert next(lines).startswith("System ")
@@ -0,0 +1,102 @@
+import os
+import threading
+
+from software import HIVES, UNINSTALL_PATHS, FakeRegistry, SoftwareScanner
+
+PATH = UNINSTALL_PATHS[0]
+
+
+def make_registry(count):
+    registry = FakeRegistry()
+    for i in range(count):
+        registry.set_subkey("HKLM", PATH, f"app{i}", {"DisplayName": f"App {i}", "DisplayVersion": "1.0"}, 1)
+    registry.set_subkey("HKLM", PATH, "no-name", {"DisplayVersion": "1.0"}, 1)
+    return registry
+
+
+def test_scan_reads_only_changed_subkeys(tmp_path):
+    registry = make_registry(20)
+    scanner = SoftwareScanner(registry, str(tmp_path / "cache.json"))
+
+    assert len(scanner.scan()) == 20
+    assert registry.reads == 21
+    registry.set_subkey("HKLM", PATH, "app3", {"DisplayName": "App 3", "DisplayVersion": "2.0"}, 2)
+    registry.delete_subkey("HKLM", PATH, "app4")
+
+    software = scanner.scan()
+
+    assert registry.reads == 22
+    assert len(software) == 19
+    assert {"Name": "App 3", "Version": "2.0", "Vendor": "N/A"} in software
+    # A new scanner starts from the cache file
+    assert len(SoftwareScanner(registry, scanner.cache_file).scan()) == 19
+    assert registry.reads == 22
+
+
+def test_cache_is_only_written_when_it_changed(tmp_path):
+    registry = make_registry(5)
+    scanner = SoftwareScanner(registry, str(tmp_path / "cache.json"))
+    scanner.scan()
+    os.utime(scanner.cache_file, (0, 0))
+
+    scanner.scan()
+    assert os.path.getmtime(scanner.cache_file) == 0
+
+    registry.delete_subkey("HKLM", PATH, "app0")
+    scanner.scan()
+    assert os.path.getmtime(scanner.cache_file) != 0
+
+
+class WatchedLock:
+    """
+    Lock telling when a thread is waiting for it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = threading.Event()
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            self.waiting.set()
+            self.lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+def test_concurrent_scans_share_one_pass():
+    registry = make_registry(50)
+    scanner = SoftwareScanner(registry)
+    scanner.lock = WatchedLock()
+    reading = threading.Event()
+    release = threading.Event()
+    read_values = registry.read_values
+
+    def slow_read_values(*args):
+        reading.set()
+        release.wait(5)
+        return read_values(*args)
+
+    registry.read_values = slow_read_values
+    assert scanner.is_cold()
+    results = []
+    first = threading.Thread(target=lambda: results.append(scanner.scan()))
+    first.start()
+    reading.wait(5)
+    second = threading.Thread(target=lambda: results.append(scanner.scan()))
+    second.start()
+    scanner.lock.waiting.wait(5)
+    release.set()
+    first.join()
+    second.join()
+
+    assert scanner.generation == 1 and registry.reads == 51
+    assert len(results) == 2 and results[0] == results[1]
+    assert not scanner.is_cold()
+
+
+def test_missing_keys_are_skipped():
+    registry = FakeRegistry()
+    registry.set_subkey(HIVES[-1], UNINSTALL_PATHS[-1], "app", {"DisplayName": "App"}, 1)
+    assert SoftwareScanner(registry).scan() == [{"Name": "App", "Version": "N/A", "Vendor": "N/A"}]
@@ -0,0 +1,69 @@
+import pytest
+
+from spool import Spool, backoff_delay
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=200)
+    for i in range(40):
+        spool.append({"collected_at": "2026-03-01T08:00:00", "report": {"i": i}})
+    assert len(spool.segments()) > 3
+    return spool
+
+
+def sent_numbers(batches):
+    return [record["report"]["i"] for batch in batches for record in batch]
+
+
+def test_drain_sends_batches_of_at_most_max_records(spool):
+    batches = []
+
+    sent = spool.drain(lambda records: batches.append(records) or True, max_records=7)
+
+    assert sent == 40
+    assert [len(batch) for batch in batches] == [7, 7, 7, 7, 7, 5]
+    assert sent_numbers(batches) == list(range(40))
+    assert spool.segments() == []
+
+
+def test_failed_batch_is_sent_again_without_duplicates(spool):
+    batches = []
+    results = iter([True, True, False])
+
+    def send_batch(records):
+        result = next(results, True)
+        if result is True:
+            batches.append(records)
+        return result
+
+    assert spool.drain(send_batch, max_records=7) == 14
+    assert not spool.ready()
+    assert spool.load_state()["attempts"] == 1
+
+    spool.save_state({"attempts": 1, "next_attempt": 0})
+    assert spool.drain(send_batch, max_records=7) == 26
+    assert sent_numbers(batches) == list(range(40))
+    assert spool.load_state() == {"attempts": 0, "next_attempt": 0}
+
+
+def test_retry_after_is_used_as_the_delay(spool):
+    spool.drain(lambda records: 120, max_records=7)
+    assert spool.load_state()["attempts"] == 1
+    assert not spool.ready()
+    assert sum(len(spool.read_segment(path)) for path in spool.segments()) == 40
+
+
+def test_spool_is_capped(tmp_path):
+    spool = Spool(str(tmp_path), segment_bytes=100, max_bytes=500)
+    for i in range(200):
+        spool.append({"report": {"i": i}})
+    records = [record for path in spool.segments() for record in spool.read_segment(path)]
+    assert 0 < len(records) < 200
+    assert records[-1] == {"report": {"i": 199}}
+
+
+@pytest.mark.parametrize("attempt", [0, 3, 30])
+def test_backoff_delay(attempt):
+    delays = [backoff_delay(attempt, base=10, cap=600) for _ in range(100)]
+    assert all(0 <= delay <= min(600, 10 * 2 ** attempt) for delay in delays)
@@ -0,0 +1,101 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from conftest import make_report
+from validation import PayloadError, SECTION_LIMITS, read_document, sanitize
+
+
+def processes(count):
+    return [{"Name": f"process{i}.exe", "PID": i, "Session": "Console", "Memory KB": 1000 + i} for i in range(count)]
+
+
+def read(document, **limits):
+    return read_document(io.BytesIO(json.dumps(document).encode("utf-8")), **limits)
+
+
+def test_document_within_limits_is_unchanged():
+    report = make_report("valid-pc", [("Firefox", "118.0")], running_processes=processes(3))
+
+    data, notes = read(report)
+
+    assert data == report
+    assert sanitize(data, notes) == {"truncated": {}, "quarantined": {}, "dropped_items": {}}
+
+
+def test_oversized_list_section_is_truncated():
+    report = make_report("truncated-pc", running_processes=processes(100))
+    limit = 1000
+
+    data, notes = read(report, section_limits=dict(SECTION_LIMITS, running_processes=limit))
+
+    kept = data["running_processes"]
+    assert 0 < len(kept) < 100
+    assert kept == report["running_processes"][:len(kept)]
+    assert len(json.dumps(kept, separators=(",", ":"))) <= limit
+    assert notes["truncated"] == {"running_processes": 100 - len(kept)}
+    assert data["software_list"] == report["software_list"]
+
+
+def test_oversized_object_section_is_quarantined():
+    report = make_report("quarantined-pc", environment_variables={f"VAR{i}": "x" * 50 for i in range(100)})
+
+    data, notes = read(report, section_limits=dict(SECTION_LIMITS, environment_variables=1000))
+
+    assert "environment_variables" not in data
+    assert notes["quarantined"] == {"environment_variables": "Section exceeds 1000 bytes"}
+    assert data["system_info"] == report["system_info"]
+
+
+def test_invalid_sections_and_items_are_dropped():
+    report = make_report("invalid-pc", [("Firefox", "118.0")], user_accounts="admin",
+                         running_processes=processes(2) + [{"Name": "bad.exe", "PID": "not a number"}])
+    report["software_list"].append({"Version": "1.0"})
+
+    data, notes = read(report)
+    notes = sanitize(data, notes)
+
+    assert "user_accounts" in notes["quarantined"] and "user_accounts" not in data
+    assert notes["dropped_items"] == {"running_processes": 1, "software_list": 1}
+    assert data["running_processes"] == processes(2)
+    assert data["software_list"] == [{"Name": "Firefox", "Version": "118.0", "Vendor": "Vendor"}]
+
+
+@pytest.mark.parametrize("document, error", [
+    ({"software_list": []}, "Missing system_info section"),
+    ({"system_info": "pc"}, "Invalid system_info"),
+    ({}, "No JSON payload received")
+])
+def test_document_without_valid_system_info_is_rejected(document, error):
+    data, notes = read(document)
+    with pytest.raises(PayloadError, match=error):
+        sanitize(data, notes)
+
+
+def test_document_over_max_bytes_is_rejected():
+    report = make_report("huge-pc", running_processes=processes(1000))
+    with pytest.raises(PayloadError):
+        read(report, max_bytes=10000)
+
+
+def test_malformed_document_is_rejected():
+    with pytest.raises(PayloadError):
+        read_document(io.BytesIO(b'{"system_info": {"Node Name": "pc"}, "software_list": [1, 2'))
+
+
+def test_ingest_notes_are_returned_to_the_agent(server, client, monkeypatch):
+    monkeypatch.setitem(SECTION_LIMITS, "running_processes", 1000)
+    report = make_report("ingest-notes-pc", running_processes=processes(100), user_accounts="admin")
+
+    response = client.post("/api/asset", data=gzip.compress(json.dumps(report).encode("utf-8")),
+                           headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+
+    assert response.status_code == 202
+    ingest = response.get_json()["ingest"]
+    assert 0 < ingest["truncated"]["running_processes"] < 100
+    assert "user_accounts" in ingest["quarantined"]
+    snapshot = server.get_latest_snapshot("ingest-notes-pc")[1]
+    assert len(snapshot["running_processes"]) == 100 - ingest["truncated"]["running_processes"]
+    assert "user_accounts" not in snapshot
@@ -0,0 +1,117 @@
+import gzip
+import io
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+# Content-Encoding used when the caller does not ask for a specific one
+DEFAULT_ENCODING = "zstd" if zstandard is not None else "gzip"
+# Content-Encodings this process can decode, preferred first
+SUPPORTED_ENCODINGS = (("zstd",) if zstandard is not None else ()) + ("gzip", "identity")
+
+# File extension of saved payloads, per Content-Encoding
+FILE_EXTENSIONS = {"gzip": ".json.gz", "zstd": ".json.zst", "identity": ".json"}
+
+
+def encode_payload(data, encoding=None):
+    """
+    Serializes the data once into compact JSON and compresses it.
+    Returns the payload bytes and their Content-Encoding.
+    """
+    encoding = encoding or DEFAULT_ENCODING
+    raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if encoding == "gzip":
+        return gzip.compress(raw, compresslevel=6), encoding
+    if encoding == "zstd":
+        if zstandard is None:
+            return gzip.compress(raw, compresslevel=6), "gzip"
+        return zstandard.ZstdCompressor(level=3).compress(raw), encoding
+    return raw, "identity"
+
+
+def choose_encoding(accept_encoding):
+    """
+    Returns the preferred encoding supported here among those of an Accept-Encoding header, or gzip.
+    """
+    accepted = {value.split(";")[0].strip().lower() for value in (accept_encoding or "").split(",")}
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return "gzip"
+
+
+def open_decoded(stream, encoding):
+    """
+    Wraps a binary stream so that reading it yields the decompressed bytes.
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding in ("", "identity"):
+        return stream
+    if encoding in ("gzip", "x-gzip"):
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd payloads are not supported on this server")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream))
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+def decode_payload(stream, encoding):
+    """
+    Decompresses a payload stream and parses its JSON content.
+    """
+    return json.load(open_decoded(stream, encoding))
+
+
+def iter_ndjson(stream, max_line_bytes):
+    """
+    Parses a stream of newline-delimited JSON records one line at a time.
+    Yields (line number, record, error); lines longer than max_line_bytes are skipped
+    without being held in memory.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > max_line_bytes and not line.endswith(b"\n"):
+            # Drain the rest of the oversized line in bounded chunks
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line_bytes)
+            yield line_number, None, f"Record exceeds {max_line_bytes} bytes"
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+
+
+def encode_ndjson(records, encoding="gzip"):
+    """
+    Yields an NDJSON body (gzip-compressed by default) built incrementally from an iterable of records.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if encoding == "gzip" else None
+    for record in records:
+        line = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+        chunk = compressor.compress(line) if compressor else line
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def encoding_for_file(path):
+    """
+    Returns the Content-Encoding of a saved payload file, based on its extension.
+    """
+    for encoding, extension in FILE_EXTENSIONS.items():
+        if encoding != "identity" and path.endswith(extension):
+            return encoding
+    return "identity"
@@ -0,0 +1,437 @@
+import json
+import re
+
+# Validation of collected_data documents on ingest, with bounded memory.
+# read_document parses a (decompressed) body one top-level section at a time: a section is only
+# materialized when it fits its size limit, list sections over their limit are truncated item by item,
+# other oversized sections are quarantined (dropped), and the whole body is capped at MAX_DOCUMENT_BYTES.
+# sanitize then checks every section against SCHEMA, compiled once into plain validator functions.
+
+# Largest decompressed document accepted, in bytes
+MAX_DOCUMENT_BYTES = 64 * 1024 * 1024
+# Largest section, in bytes of JSON, by section name; DEFAULT_SECTION_BYTES for the others
+SECTION_LIMITS = {
+    "software_list": 16 * 1024 * 1024,
+    "running_processes": 4 * 1024 * 1024,
+    "network_connections": 4 * 1024 * 1024,
+    "update_status": 2 * 1024 * 1024,
+    "environment_variables": 256 * 1024,
+    "system_info": 64 * 1024
+}
+DEFAULT_SECTION_BYTES = 1024 * 1024
+# Longest section name
+MAX_KEY_BYTES = 256
+# Bytes read from the stream at a time
+CHUNK_SIZE = 64 * 1024
+
+# Sections that cannot be dropped: the report is rejected instead
+REQUIRED_SECTIONS = ("system_info",)
+
+# Schema of collected_data. Types: "string", "integer", "number", "boolean", "null", "scalar" (any of those),
+# "any", {"type": "array", "items": ...}, {"type": "object", "properties": {...}, "required": [...],
+# "values": ...} (values: schema of the properties not listed), or a list of alternatives.
+STRING_OR_NULL = ["string", "null"]
+INTEGER_OR_NULL = ["integer", "null"]
+SOFTWARE = {"type": "object", "properties": {"Name": "string", "Version": "scalar", "Vendor": "scalar"},
+            "required": ["Name"], "values": "scalar"}
+SCHEMA = {
+    "type": "object",
+    "required": ["system_info"],
+    "properties": {
+        "system_info": {"type": "object", "values": "scalar"},
+        "programming_languages": {"type": "array", "items": SOFTWARE},
+        "development_tools": {"type": "array", "items": SOFTWARE},
+        "environment_variables": {"type": "object", "values": "scalar"},
+        "network_configuration": {"type": "object", "values": "any"},
+        "hardware_info": {"type": "object", "values": "any"},
+        "user_accounts": {"type": "array", "items": "string"},
+        "security_software": {"type": "array", "items": "string"},
+        "running_processes": {"type": "array", "items": {
+            "type": "object", "properties": {"Name": STRING_OR_NULL, "PID": INTEGER_OR_NULL,
+                                             "Session": STRING_OR_NULL, "Memory KB": INTEGER_OR_NULL},
+            "values": "scalar"}},
+        "network_connections": {"type": "array", "items": {"type": "object", "values": STRING_OR_NULL}},
+        "update_status": {"type": "array", "items": {"type": "object", "values": "scalar"}},
+        "disk_encryption_status": ["string", {"type": "object", "values": "any"}],
+        "telemetry": {"type": "object", "values": "any"},
+        "software_list": {"type": "array", "items": SOFTWARE}
+    },
+    "values": "any"
+}
+
+
+class PayloadError(ValueError):
+    """
+    A body that cannot be accepted at all; status is the HTTP status to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+SCALAR_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+    "scalar": (str, int, float, bool, type(None))
+}
+
+
+def compile_schema(schema):
+    """
+    Turns a schema into a function returning None for a valid value, or the reason it is invalid.
+    """
+    if isinstance(schema, list):
+        alternatives = [compile_schema(alternative) for alternative in schema]
+
+        def check_any_of(value):
+            errors = [check(value) for check in alternatives]
+            return None if None in errors else errors[0]
+        return check_any_of
+
+    if isinstance(schema, str):
+        if schema == "any":
+            return lambda value: None
+        types = SCALAR_TYPES[schema]
+        # bool is an int in Python, but not an integer or a number in JSON
+        exclude_bool = schema in ("integer", "number")
+
+        def check_scalar(value):
+            if isinstance(value, types) and not (exclude_bool and isinstance(value, bool)):
+                return None
+            return f"expected {schema}, got {type(value).__name__}"
+        return check_scalar
+
+    if schema["type"] == "array":
+        check_item = compile_schema(schema.get("items", "any"))
+
+        def check_array(value):
+            if not isinstance(value, list):
+                return f"expected array, got {type(value).__name__}"
+            for i, item in enumerate(value):
+                error = check_item(item)
+                if error:
+                    return f"[{i}]: {error}"
+            return None
+        check_array.check_item = check_item
+        return check_array
+
+    properties = {name: compile_schema(item) for name, item in schema.get("properties", {}).items()}
+    check_other = compile_schema(schema.get("values", "any"))
+    required = schema.get("required", [])
+
+    def check_object(value):
+        if not isinstance(value, dict):
+            return f"expected object, got {type(value).__name__}"
+        for name in required:
+            if name not in value:
+                return f"missing {name}"
+        for name, item in value.items():
+            error = properties.get(name, check_other)(item)
+            if error:
+                return f"{name}: {error}"
+        return None
+    check_object.properties = properties
+    check_object.check_other = check_other
+    return check_object
+
+
+_document_validator = compile_schema(SCHEMA)
+
+
+def sanitize(data, notes=None):
+    """
+    Checks a collected_data document against SCHEMA, in place: invalid items of list sections are dropped,
+    invalid sections are quarantined (removed). Returns the notes {"truncated", "quarantined", "dropped_items"}.
+    Raises PayloadError when the document is not an object or a required section is missing or invalid.
+    """
+    notes = notes if notes is not None else new_notes()
+    if not isinstance(data, dict) or not data:
+        raise PayloadError("No JSON payload received")
+    for section in list(data):
+        check = _document_validator.properties.get(section, _document_validator.check_other)
+        value = data[section]
+        check_item = getattr(check, "check_item", None)
+        if check_item is not None and isinstance(value, list):
+            valid = [item for item in value if check_item(item) is None]
+            if len(valid) != len(value):
+                notes["dropped_items"][section] = notes["dropped_items"].get(section, 0) + len(value) - len(valid)
+                data[section] = valid
+            continue
+        error = check(value)
+        if error:
+            if section in REQUIRED_SECTIONS:
+                raise PayloadError(f"Invalid {section}: {error}")
+            notes["quarantined"][section] = error
+            del data[section]
+    for section in REQUIRED_SECTIONS:
+        if section not in data:
+            raise PayloadError(f"Missing {section} section")
+    return notes
+
+
+def new_notes():
+    return {"truncated": {}, "quarantined": {}, "dropped_items": {}}
+
+
+def has_notes(notes):
+    return any(notes.values())
+
+
+# Returned by JsonScanner in place of a value too big to keep
+SKIPPED = object()
+
+WHITESPACE = re.compile(rb"[ \t\r\n]*")
+STRUCTURAL = re.compile(rb'["\[\]{}]')
+STRING_SPECIAL = re.compile(rb'["\\]')
+SCALAR_END = re.compile(rb"[,}\]\s]")
+DECODER = json.JSONDecoder()
+
+
+class JsonScanner:
+    """
+    Reads JSON values from a binary stream one at a time, keeping in memory only the value being
+    captured (up to a size limit) and the current chunk. Values that are too big are skipped by
+    scanning for the end of their strings and brackets, without parsing them.
+    """
+
+    def __init__(self, stream, max_bytes=MAX_DOCUMENT_BYTES, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.buffer = b""
+        self.pos = 0
+        self.total = 0
+        self.mark = None  # Start of the value being captured, kept in the buffer by fill
+
+    def fill(self):
+        """
+        Reads the next chunk, dropping the bytes already scanned. Returns False at the end of the stream.
+        """
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.total += len(chunk)
+        if self.total > self.max_bytes:
+            raise PayloadError(f"Payload exceeds {self.max_bytes} bytes", 413)
+        keep = min(self.pos if self.mark is None else self.mark, len(self.buffer))
+        self.buffer = self.buffer[keep:] + chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+        return True
+
+    def offset(self):
+        """
+        Returns the position of the scanner in the stream.
+        """
+        return self.total - len(self.buffer) + self.pos
+
+    def more(self):
+        if not self.fill():
+            raise PayloadError("Truncated JSON document")
+
+    def peek(self):
+        """
+        Returns the next non-whitespace byte, or None at the end of the stream.
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos:self.pos + 1]
+            if not self.fill():
+                return None
+
+    def expect(self, token):
+        if self.peek() != token:
+            raise PayloadError(f"Invalid JSON document: expected {token.decode()} at byte {self.total}")
+        self.pos += 1
+
+    def skip_string(self):
+        self.pos += 1
+        while True:
+            match = STRING_SPECIAL.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                self.more()
+                continue
+            if match.group() == b'"':
+                self.pos = match.end()
+                return
+            self.pos = match.start() + 2  # Skip the escaped byte, possibly in the next chunk
+            while self.pos > len(self.buffer):
+                self.more()
+
+    def skip_value(self):
+        first = self.peek()
+        if first is None:
+            raise PayloadError("Truncated JSON document")
+        if first == b'"':
+            self.skip_string()
+        elif first in (b"{", b"["):
+            self.pos += 1
+            depth = 1
+            while depth:
+                match = STRUCTURAL.search(self.buffer, self.pos)
+                if match is None:
+                    self.pos = len(self.buffer)
+                    self.more()
+                    continue
+                self.pos = match.start()
+                token = match.group()
+                if token == b'"':
+                    self.skip_string()
+                    continue
+                depth += 1 if token in (b"{", b"[") else -1
+                self.pos += 1
+        else:
+            while True:
+                match = SCALAR_END.search(self.buffer, self.pos)
+                if match is not None:
+                    self.pos = match.start()
+                    return
+                self.pos = len(self.buffer)
+                if not self.fill():
+                    return
+
+    def decode(self, size):
+        """
+        Parses the value at the start of the next size bytes from the mark.
+        Returns (value, length in bytes), or None when these bytes do not hold a complete value.
+        """
+        window = self.buffer[self.mark:self.mark + size]
+        try:
+            text = window.decode("utf-8")
+        except UnicodeDecodeError as e:
+            if e.reason != "unexpected end of data":
+                raise PayloadError("Invalid UTF-8 in JSON document")
+            text = window[:e.start].decode("utf-8")  # A character cut at the end of the window
+        try:
+            value, end = DECODER.raw_decode(text)
+        except ValueError as e:
+            self.error = e
+            return None
+        return value, end if text.isascii() else len(text[:end].encode("utf-8"))
+
+    def capture_value(self, limit, window=CHUNK_SIZE):
+        """
+        Returns the parsed next value if its JSON is at most limit bytes. Otherwise returns SKIPPED,
+        leaving the scanner at the start of the value. Strings, arrays and objects are parsed by the json module
+        over a window of window bytes, grown fourfold (and read from the stream) until it holds the whole value.
+        """
+        first = self.peek()
+        if first is None:
+            raise PayloadError("Truncated JSON document")
+        self.mark = self.pos
+        try:
+            if first not in (b'"', b"[", b"{"):
+                # The mark keeps the scalar in the buffer while skip_value reads the rest of it
+                self.skip_value()
+                if self.pos - self.mark > limit:
+                    self.pos = self.mark
+                    return SKIPPED
+                try:
+                    return json.loads(self.buffer[self.mark:self.pos])
+                except ValueError as e:
+                    raise PayloadError(f"Invalid JSON: {e}")
+            while True:
+                size = min(window, len(self.buffer) - self.mark, limit)
+                result = self.decode(size)
+                if result is not None:
+                    self.pos = self.mark + result[1]
+                    return result[0]
+                if size >= limit:
+                    return SKIPPED
+                window *= 4
+                while len(self.buffer) - self.mark < min(window, limit) and self.fill():
+                    pass
+                if len(self.buffer) - self.mark <= size:
+                    raise PayloadError(f"Invalid JSON: {self.error}")
+        finally:
+            self.mark = None
+
+    def iter_array(self, limit):
+        """
+        Yields the items of the next array while their total size stays within limit,
+        then SKIPPED for every item beyond it (skipped without being parsed).
+        """
+        self.expect(b"[")
+        used = 0
+        if self.peek() == b"]":
+            self.pos += 1
+            return
+        while True:
+            if used > limit:
+                self.skip_value()
+                item = SKIPPED
+            else:
+                self.peek()
+                start = self.offset()
+                item = self.capture_value(limit - used, 512)
+                if item is SKIPPED:
+                    self.skip_value()
+                    used = limit + 1
+                else:
+                    used += self.offset() - start
+            yield item
+            token = self.peek()
+            self.pos += 1
+            if token == b"]":
+                return
+            if token != b",":
+                raise PayloadError(f"Invalid JSON document: expected , or ] at byte {self.total}")
+
+
+def read_document(stream, max_bytes=MAX_DOCUMENT_BYTES, section_limits=SECTION_LIMITS,
+                  default_limit=DEFAULT_SECTION_BYTES):
+    """
+    Parses a collected_data document from a binary stream, one section at a time, within the size limits.
+    Returns the document and the notes on truncated (items dropped) and quarantined sections.
+    Raises PayloadError on malformed JSON or a body over max_bytes.
+    """
+    scanner = JsonScanner(stream, max_bytes)
+    notes = new_notes()
+    data = {}
+    scanner.expect(b"{")
+    if scanner.peek() == b"}":
+        scanner.pos += 1
+    else:
+        while True:
+            if scanner.peek() != b'"':
+                raise PayloadError(f"Invalid JSON document: expected a section name at byte {scanner.total}")
+            key = scanner.capture_value(MAX_KEY_BYTES)
+            if key is SKIPPED:
+                raise PayloadError("Section name too long")
+            scanner.expect(b":")
+            limit = section_limits.get(key, default_limit)
+            value = scanner.capture_value(limit)
+            if value is not SKIPPED:
+                data[key] = value
+            elif scanner.peek() == b"[":
+                # Too big: keep the items that fit
+                items = []
+                dropped = 0
+                for item in scanner.iter_array(limit):
+                    if item is SKIPPED:
+                        dropped += 1
+                    else:
+                        items.append(item)
+                data[key] = items
+                if dropped:
+                    notes["truncated"][key] = dropped
+            else:
+                scanner.skip_value()
+                notes["quarantined"][key] = f"Section exceeds {limit} bytes"
+                data.pop(key, None)
+            token = scanner.peek()
+            scanner.pos += 1
+            if token == b"}":
+                break
+            if token != b",":
+                raise PayloadError(f"Invalid JSON document: expected , or }} at byte {scanner.total}")
+    if scanner.peek() is not None:
+        raise PayloadError("Invalid JSON document: data after the end of the document")
+    return data, notes